@@ -16,3 +16,12 @@ class LocationAdmin(admin.ModelAdmin):
 class FundingAdmin(admin.ModelAdmin):
     list_display = ('project', 'total_funds_gross', 'total_funds_net')
     search_fields = ('project__oc_project_title',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Ranking column of the project (the importer refreshes it for all projects at the end)
+        Project.objects.filter(pk=obj.project_id).update(total_financing=obj.total_funds_gross)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Project.objects.filter(pk=obj.project_id).update(total_financing=None)
@@ -0,0 +1,136 @@
+from django.db import connection, transaction
+
+from analytics_projects.models import Project, Funding, Location, FundingAggregate, BIG_PROJECT_THRESHOLD
+
+# Colonne di Funding sommate nel cubo
+SUM_FIELDS = [
+    field.column for field in Funding._meta.concrete_fields
+    if field.get_internal_type() == "FloatField"
+]
+
+DIMENSIONS = [
+    "region_code", "macroarea", "is_trasversale", "oc_project_status",
+    "cup_descr_sector", "oc_synthetic_theme", "cup_typology",
+]
+
+
+# ------------------------------
+# Regioni e macroaree denormalizzate su Project
+# ------------------------------
+def refresh_project_locations():
+    """
+    Allinea Project.region_codes / macroareas e le etichette region_label / macroarea_label
+    ai legami con Location (nello schema attivo); i progetti senza legami tornano vuoti.
+    Scrive solo i progetti i cui legami sono cambiati; restituisce quanti sono.
+    """
+    project_table = Project._meta.db_table
+    location_table = Location._meta.db_table
+    through_table = Location.project.through._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {project_table} p
+            SET region_codes = s.region_codes, macroareas = s.macroareas,
+                region_label = s.region_label, macroarea_label = s.macroarea_label
+            FROM (
+                SELECT t.project_id,
+                       array_agg(t.location_id ORDER BY t.id) AS region_codes,
+                       array_agg(DISTINCT l.macroarea ORDER BY l.macroarea) AS macroareas,
+                       string_agg(l.region_name, ', ' ORDER BY t.id) AS region_label,
+                       string_agg(l.macroarea, ', ' ORDER BY t.id) AS macroarea_label
+                FROM {through_table} t JOIN {location_table} l ON l.region_code = t.location_id
+                GROUP BY t.project_id
+            ) s
+            WHERE s.project_id = p.local_project_code
+              AND (p.region_codes IS DISTINCT FROM s.region_codes OR p.macroareas IS DISTINCT FROM s.macroareas
+                   OR p.region_label IS DISTINCT FROM s.region_label
+                   OR p.macroarea_label IS DISTINCT FROM s.macroarea_label)
+        """)
+        updated = cursor.rowcount
+
+        # Progetti rimasti senza legami (es. un import delta che ne ha tolto tutte le regioni)
+        cursor.execute(f"""
+            UPDATE {project_table} p
+            SET region_codes = '{{}}', macroareas = '{{}}', region_label = '', macroarea_label = ''
+            WHERE NOT EXISTS (SELECT 1 FROM {through_table} t WHERE t.project_id = p.local_project_code)
+              AND (p.region_codes <> '{{}}' OR p.macroareas <> '{{}}'
+                   OR p.region_label <> '' OR p.macroarea_label <> '')
+        """)
+        return updated + cursor.rowcount
+
+
+# ------------------------------
+# Finanziamento totale denormalizzato su Project
+# ------------------------------
+def refresh_project_rankings():
+    """
+    Allinea Project.total_financing (ordinamento dei top-N, indice project_ranking_idx)
+    al lordo del Funding del progetto (nello schema attivo).
+    Scrive solo i progetti il cui totale è cambiato; restituisce quanti sono.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {project_table} p
+            SET total_financing = f.total_funds_gross
+            FROM {funding_table} f
+            WHERE f.project_id = p.local_project_code
+              AND p.total_financing IS DISTINCT FROM f.total_funds_gross
+        """)
+        return cursor.rowcount
+
+
+# ------------------------------
+# Ricostruzione del cubo
+# ------------------------------
+def refresh_funding_aggregates():
+    """
+    Ricostruisce FundingAggregate dalle tabelle del dataset (nello schema attivo).
+    Ogni progetto finisce in una riga per ogni combinazione (sua regione o tutte) x (sua macroarea o tutte),
+    così i filtri per regione/macroarea restituiscono ogni progetto una sola volta.
+    Richiede Project.region_codes / macroareas aggiornati (refresh_project_locations).
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    aggregate_table = FundingAggregate._meta.db_table
+
+    columns = [
+        *DIMENSIONS, "project_count", "big_project_count", "projects_with_savings", "positive_savings",
+        *SUM_FIELDS,
+    ]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # DELETE e non TRUNCATE: le letture in corso continuano a vedere il cubo precedente
+        cursor.execute(f"DELETE FROM {aggregate_table}")
+        cursor.execute(f"""
+            INSERT INTO {aggregate_table} ({", ".join(columns)})
+            WITH project_regions AS (
+                SELECT DISTINCT local_project_code AS project_id, unnest(region_codes) AS region_code
+                FROM {project_table}
+                UNION ALL
+                SELECT local_project_code, NULL FROM {project_table}
+            ), project_macroareas AS (
+                SELECT local_project_code AS project_id, unnest(macroareas) AS macroarea FROM {project_table}
+                UNION ALL
+                SELECT local_project_code, NULL FROM {project_table}
+            )
+            SELECT r.region_code, m.macroarea, p.is_trasversale, p.oc_project_status,
+                   p.cup_descr_sector, p.oc_synthetic_theme, p.cup_typology,
+                   count(*),
+                   count(*) FILTER (WHERE f.total_funds_gross >= %s),
+                   count(*) FILTER (WHERE f.total_savings > 0),
+                   coalesce(sum(f.total_savings) FILTER (WHERE f.total_savings > 0), 0),
+                   {", ".join(f"sum(f.{c})" for c in SUM_FIELDS)}
+            FROM {project_table} p
+            JOIN project_regions r ON r.project_id = p.local_project_code
+            JOIN project_macroareas m ON m.project_id = p.local_project_code
+            LEFT JOIN {funding_table} f ON f.project_id = p.local_project_code
+            GROUP BY r.region_code, m.macroarea, p.is_trasversale, p.oc_project_status,
+                     p.cup_descr_sector, p.oc_synthetic_theme, p.cup_typology
+        """, [BIG_PROJECT_THRESHOLD])
+        rows = cursor.rowcount
+        cursor.execute(f"ANALYZE {aggregate_table}")
+
+    return rows
@@ -0,0 +1,147 @@
+"""
+Cache delle risposte delle API di analisi.
+
+Le chiavi contengono l'endpoint, l'hash dei filtri normalizzati (region, macroarea, is_trasversale,
+funding_source) e la versione del dataset (DatasetVersion), che l'import incrementa a ogni
+completamento: dopo un import le chiavi vecchie non vengono più lette e l'LRU del backend
+(settings.CACHES, vedi CACHE_URL) le elimina.
+
+Oltre ai dati si possono salvare i corpi JSON già serializzati, insieme alle varianti
+compresse (gzip e, se il pacchetto brotli è installato, br): la compressione avviene una
+volta per versione e filtri, e ogni hit restituisce i byte della codifica negoziata.
+"""
+import gzip
+import hashlib
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from analytics_projects.models import DatasetVersion
+
+try:
+    import brotli
+except ImportError:  # dipendenza opzionale: solo gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Contatori di hit/miss del processo corrente
+stats = Counter()
+
+
+# ------------------------------
+# Versione del dataset
+# ------------------------------
+def get_dataset_version():
+    """DatasetVersion corrente (versione 0 se non è ancora stato fatto nessun import)."""
+    current = DatasetVersion.objects.filter(pk=DatasetVersion.SINGLETON_ID).first()
+    return current or DatasetVersion(pk=DatasetVersion.SINGLETON_ID, version=0)
+
+
+def bump_dataset_version():
+    """Nuova versione del dataset: invalida tutte le risposte in cache. Da chiamare a import completato."""
+    DatasetVersion.objects.get_or_create(pk=DatasetVersion.SINGLETON_ID)
+    DatasetVersion.objects.filter(pk=DatasetVersion.SINGLETON_ID).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    return get_dataset_version().version
+
+
+# ------------------------------
+# Cache delle risposte
+# ------------------------------
+def response_cache_key(endpoint, filters_key, version):
+    """
+    Chiave della risposta: i filtri (anche l'eco dei parametri ricevuti, con spazi o di qualsiasi lunghezza)
+    entrano come hash, così la chiave resta corta e valida per ogni backend, memcached compreso.
+    """
+    values = "|".join("" if value is None else str(value) for value in filters_key)
+    digest = hashlib.blake2b(values.encode(), digest_size=16).hexdigest()
+    return f"analytics:{endpoint}:v{version}:{digest}"
+
+
+def cached_response(endpoint, filters_key, compute, *args, version=None):
+    """
+    Restituisce compute(*args) dalla cache, calcolandolo e salvandolo in caso di miss.
+    version è la versione del dataset se il chiamante l'ha già letta (le view per l'ETag),
+    altrimenti viene letta qui.
+    """
+    if not settings.ANALYTICS_RESPONSE_CACHE:
+        return compute(*args)
+
+    if version is None:
+        version = get_dataset_version().version
+    cache = caches[settings.ANALYTICS_CACHE_ALIAS]
+    key = response_cache_key(endpoint, filters_key, version)
+
+    data = cache.get(key)
+    if data is not None:
+        stats["hits"] += 1
+        return data
+
+    stats["misses"] += 1
+    data = compute(*args)
+    cache.set(key, data)
+    logger.debug("Risposta %s calcolata e salvata in cache (%s)", key, dict(stats))
+    return data
+
+
+# ------------------------------
+# Corpi delle risposte pre-compressi
+# ------------------------------
+# Codifiche in ordine di preferenza -> compressione (al massimo livello: si comprime una volta sola)
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {"br": lambda body: brotli.compress(body, quality=11), **COMPRESSORS}
+
+
+def negotiate_encoding(accept_encoding, codings=COMPRESSORS):
+    """
+    Codifica da usare per l'header Accept-Encoding: la preferita tra codings con q > 0, o "identity".
+    Per un corpo già in cache codings sono le sue chiavi, che possono non coincidere con COMPRESSORS
+    se la voce è stata scritta da un processo con brotli disponibile (o mancante).
+    """
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    for coding in codings:
+        if coding != "identity" and accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return "identity"
+
+
+def cached_body(endpoint, filters_key, render, version=None):
+    """
+    {codifica: byte} del corpo render() e delle sue varianti compresse, dalla cache o calcolati
+    e salvati in caso di miss. version come in cached_response.
+    """
+    def compress():
+        body = render()
+        return {"identity": body, **{coding: compressor(body) for coding, compressor in COMPRESSORS.items()}}
+
+    return cached_response(f"{endpoint}.body", filters_key, compress, version=version)
+
+
+def cache_stats():
+    """Hit, miss e hit ratio della cache delle risposte nel processo corrente (un worker di gunicorn)."""
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+    }
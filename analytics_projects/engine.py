@@ -0,0 +1,345 @@
+"""
+Motore colonnare in memoria per le API di analisi (settings.ANALYTICS_ENGINE = "numpy").
+
+Le colonne di Project e Funding usate da services.py vengono caricate una volta per
+versione del dataset in array NumPy: le categorie (stato, settore, tema, tipologia)
+sono codificate a dizionario, i legami progetto-regione sono una lista di incidenza
+(progetto, regione) nell'ordine della tabella through. Ogni richiesta diventa
+una maschera booleana sui progetti e qualche bincount / argpartition.
+
+I risultati hanno la stessa forma di overview_fused / analysis_fused.
+"""
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError as exc:  # dipendenza opzionale
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured("ANALYTICS_ENGINE = 'numpy' richiede il pacchetto numpy") from exc
+
+from django.conf import settings
+from django.db import connection
+
+from analytics_projects.models import Project, Funding, Location
+from analytics_projects.aggregates import BIG_PROJECT_THRESHOLD, SUM_FIELDS
+from analytics_projects.cache import get_dataset_version
+from analytics_projects.snapshot import read_snapshot, write_snapshot
+from analytics_projects.services import (
+    SOURCE_FIELDS, SPECIFIC_FUNDS_FIELDS,
+    normalize_overview_filters, normalize_analysis_filters, normalize_top_n,
+    funding_sources_result, specific_funds_result, group_ranking_key,
+)
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_COLUMNS = ["oc_project_status", "cup_descr_sector", "oc_synthetic_theme", "cup_typology"]
+
+
+def encode(values):
+    """Codifica a dizionario: (codici int32, categorie)."""
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32)
+    return codes, list(lookup)
+
+
+# ------------------------------
+# Caricamento delle colonne
+# ------------------------------
+def load_columns_from_database():
+    """
+    Legge dal database le colonne del motore: {nome: array} per le colonne numeriche e i codici,
+    {nome: lista} per categorie, codici e titoli dei progetti.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    through_table = Location.project.through._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT p.local_project_code, p.oc_project_title, p.is_trasversale, f.id IS NOT NULL,
+                   coalesce(f.source_mask, 0),
+                   {", ".join(f"p.{c}" for c in CATEGORY_COLUMNS)},
+                   {", ".join(f"f.{c}" for c in SUM_FIELDS)}
+            FROM {project_table} p
+            LEFT JOIN {funding_table} f ON f.project_id = p.local_project_code
+            ORDER BY p.local_project_code
+        """)
+        rows = cursor.fetchall()
+        cursor.execute(f"SELECT project_id, location_id FROM {through_table} ORDER BY id")
+        links = cursor.fetchall()
+
+    locations = list(Location.objects.order_by("region_code").values_list("region_code", "region_name", "macroarea"))
+    return build_columns(rows, links, locations)
+
+
+def build_columns(rows, links, locations):
+    """Colonne del motore dalle righe progetto+finanziamento, dai legami (progetto, regione) e dalle regioni."""
+    columns = list(zip(*rows)) or [()] * (5 + len(CATEGORY_COLUMNS) + len(SUM_FIELDS))
+    codes, titles, is_trasversale, has_funding, source_mask = columns[:5]
+    arrays = {
+        "is_trasversale": np.array(is_trasversale, dtype=bool),
+        "has_funding": np.array(has_funding, dtype=bool),
+        "source_mask": np.array(source_mask, dtype=np.int32),
+    }
+    lists = {"codes": list(codes), "titles": list(titles)}
+
+    for name, values in zip(CATEGORY_COLUMNS, columns[5:5 + len(CATEGORY_COLUMNS)]):
+        arrays[name], lists[name] = encode(values)
+    for name, values in zip(SUM_FIELDS, columns[5 + len(CATEGORY_COLUMNS):]):
+        # NULL (anche per i progetti senza Funding) -> NaN
+        arrays[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    # Regioni e lista di incidenza progetto-regione
+    project_index = {code: i for i, code in enumerate(codes)}
+    region_index = {code: i for i, (code, _, _) in enumerate(locations)}
+    links = [(project_index[p], region_index[r]) for p, r in links if p in project_index and r in region_index]
+    arrays["link_project"] = np.array([p for p, _ in links], dtype=np.int32)
+    arrays["link_region"] = np.array([r for _, r in links], dtype=np.int32)
+    lists["region_codes"] = [code for code, _, _ in locations]
+    lists["region_names"] = [name for _, name, _ in locations]
+    arrays["region_macroarea"], lists["macroareas"] = encode(macroarea for _, _, macroarea in locations)
+
+    return arrays, lists
+
+
+# ------------------------------
+# Motore
+# ------------------------------
+class ColumnarEngine:
+
+    def __init__(self, version, arrays, lists):
+        self.version = version
+        self.arrays = arrays
+        self.lists = lists
+        self.size = len(lists["codes"])
+
+        # Regioni di ogni progetto in formato CSR (ordine della tabella through), già pronte nello snapshot
+        if "project_regions" in arrays:
+            self.project_regions = arrays["project_regions"]
+            self.project_region_offsets = arrays["project_region_offsets"]
+        else:
+            link_project = arrays["link_project"]
+            order = np.argsort(link_project, kind="stable")
+            self.project_regions = arrays["link_region"][order]
+            self.project_region_offsets = np.concatenate(
+                ([0], np.cumsum(np.bincount(link_project, minlength=self.size)))
+            )
+
+        self.macroarea_financing = self._macroarea_financing()
+
+    @classmethod
+    def from_database(cls, version):
+        return cls(version, *load_columns_from_database())
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """Motore sopra lo snapshot mappato in memoria, o None se il file non esiste."""
+        snapshot = read_snapshot(path)
+        return cls(*snapshot) if snapshot else None
+
+    def write_snapshot(self, path):
+        arrays = {
+            **self.arrays,
+            "project_regions": self.project_regions,
+            "project_region_offsets": self.project_region_offsets,
+        }
+        write_snapshot(path, self.version, arrays, self.lists)
+
+    # --------------------------
+    # Maschere
+    # --------------------------
+    def projects_in_regions(self, selected_regions):
+        """Progetti legati ad almeno una delle regioni selezionate (array bool per regione)."""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.arrays["link_project"][selected_regions[self.arrays["link_region"]]]] = True
+        return mask
+
+    def region_mask(self, region):
+        return self.projects_in_regions(np.array([code == region for code in self.lists["region_codes"]], dtype=bool))
+
+    def macroarea_mask(self, macroarea):
+        macroareas = np.array([name == macroarea for name in self.lists["macroareas"]], dtype=bool)
+        return self.projects_in_regions(macroareas[self.arrays["region_macroarea"]])
+
+    def source_mask(self, funding_source):
+        return (self.arrays["source_mask"] & Funding.source_bit(funding_source)) != 0
+
+    # --------------------------
+    # Aggregazioni
+    # --------------------------
+    def total(self, column, mask):
+        return float(np.nansum(self.arrays[column][mask]))
+
+    def top_indexes(self, column, mask, n):
+        """
+        Indici dei primi n progetti per valore decrescente, NULL per primi come in Postgres;
+        a parità di valore per codice crescente (i progetti sono ordinati per codice), come Project.RANKING_ORDER.
+        """
+        candidates = np.flatnonzero(mask)
+        key = self.arrays[column][candidates]
+        key = -np.where(np.isnan(key), np.inf, key)
+        if len(candidates) > n:
+            # tutti i pari merito dell'n-esimo restano candidati: l'ordinamento per codice decide
+            keep = key <= np.partition(key, n - 1)[n - 1]
+            candidates, key = candidates[keep], key[keep]
+        return candidates[np.lexsort((candidates, key))][:n]
+
+    def top_groups(self, category, column, mask, n, skip_none=False):
+        """Primi n valori di una categoria per somma di column: [(valore, somma)], a parità per valore (group_ranking_key)."""
+        categories = self.lists[category]
+        codes = self.arrays[category][mask]
+        sums = np.bincount(codes, weights=np.nan_to_num(self.arrays[column][mask]), minlength=len(categories))
+        present = np.bincount(codes, minlength=len(categories)) > 0
+        if skip_none and None in categories:
+            present[categories.index(None)] = False
+
+        groups = [(categories[g], float(sums[g])) for g in np.flatnonzero(present)]
+        return sorted(groups, key=group_ranking_key)[:n]
+
+    def region_labels(self, index):
+        regions = self.project_regions[self.project_region_offsets[index]:self.project_region_offsets[index + 1]]
+        names = ", ".join(self.lists["region_names"][r] for r in regions)
+        macroareas = ", ".join(self.lists["macroareas"][self.arrays["region_macroarea"][r]] for r in regions)
+        return names, macroareas
+
+    def _macroarea_financing(self):
+        """Come funding_by_macroarea: ogni Funding conta una volta per ciascuna macroarea del progetto (non filtrato)."""
+        gross = np.nan_to_num(self.arrays["total_funds_gross"])
+        link_project = self.arrays["link_project"].astype(np.int64)
+        funded = self.arrays["has_funding"][link_project]
+        size = len(self.lists["macroareas"])
+
+        # Coppie (progetto, macroarea) distinte
+        pairs = np.unique(
+            link_project[funded] * size + self.arrays["region_macroarea"][self.arrays["link_region"][funded]]
+        )
+        projects, macroareas = pairs // size, pairs % size
+        sums = np.bincount(macroareas, weights=gross[projects], minlength=size)
+        counts = np.bincount(macroareas, minlength=size)
+        return {name: float(sums[i]) for i, name in enumerate(self.lists["macroareas"]) if counts[i]}
+
+    # --------------------------
+    # Risposte
+    # --------------------------
+    def overview(self, filters):
+        region, macroarea, is_trasversale = normalize_overview_filters(filters)
+
+        mask = np.ones(self.size, dtype=bool)
+        if region is not None:
+            mask &= self.region_mask(region)
+        if macroarea is not None:
+            mask &= self.macroarea_mask(macroarea)
+        if is_trasversale is not None:
+            mask &= self.arrays["is_trasversale"] == is_trasversale
+
+        statuses = self.lists["oc_project_status"]
+        by_status = np.bincount(self.arrays["oc_project_status"][mask], minlength=len(statuses))
+
+        def count_status(choice):
+            return int(by_status[statuses.index(choice.value)]) if choice.value in statuses else 0
+
+        gross = self.arrays["total_funds_gross"]
+        top_projects = {}
+        for position, index in enumerate(self.top_indexes("total_funds_gross", mask, normalize_top_n(filters)), start=1):
+            regions, macroareas = self.region_labels(index)
+            top_projects[f"project{position}"] = {
+                "id": self.lists["codes"][index],
+                "title": self.lists["titles"][index],
+                "total_financing": 0 if np.isnan(gross[index]) else float(gross[index]),
+                "region": regions,
+                "macroarea": macroareas,
+            }
+
+        funded = mask & self.arrays["has_funding"]
+        top_sectors = self.top_groups("cup_descr_sector", "total_funds_gross", funded, 3)
+
+        choices = Project.ProjectStatusChoices
+        return {
+            "number_of_projects": int(mask.sum()),
+            "total_financing": self.total("total_funds_gross", mask),
+            "number_ended_projects": count_status(choices.CONCLUDED),
+            "number_not_started_projects": count_status(choices.NOT_STARTED),
+            "number_projects_in_progress": count_status(choices.ONGOING),
+            "number_projects_liquidated": count_status(choices.LIQUIDATED),
+            "middle_north_financing": self.macroarea_financing.get('Centro-Nord', 0.0),
+            "midday_financing": self.macroarea_financing.get('Mezzogiorno', 0.0),
+            "national_financing": self.macroarea_financing.get('Ambito Nazionale', 0.0),
+            "abroad_financing": self.macroarea_financing.get('Estero', 0.0),
+            "top_projects": top_projects,
+            "number_big_projects": int(np.count_nonzero(mask & (gross >= BIG_PROJECT_THRESHOLD))),
+            "top_sectors": {
+                f"sector{i}": {"name": name, "total_financing": total}
+                for i, (name, total) in enumerate(top_sectors, start=1)
+            },
+        }
+
+    def analysis(self, filters):
+        macroarea, funding_source = normalize_analysis_filters(filters)
+
+        mask = self.arrays["has_funding"].copy()
+        if macroarea is not None:
+            mask &= self.macroarea_mask(macroarea)
+        if funding_source is not None:
+            mask &= self.source_mask(funding_source)
+
+        sum_fields = set(sum(SOURCE_FIELDS.values(), [])) | set(SPECIFIC_FUNDS_FIELDS)
+        agg = {field: self.total(field, mask) for field in sum_fields}
+
+        savings = self.arrays["total_savings"]
+        with_gap = mask & (savings > 0)
+
+        funded = self.arrays["has_funding"]
+        total_realized_cost = self.total("total_funds_gross", funded)
+        total_payments_made = self.total("total_funds_net", funded)
+
+        return {
+            "funding_sources_analysis": funding_sources_result(agg, funding_source),
+            "specific_funds_contribution": specific_funds_result(agg, funding_source),
+            "top10_thematic_objectives": [
+                {"description": theme or "Non specificato", "amount": amount}
+                for theme, amount in self.top_groups("oc_synthetic_theme", "total_funds_gross", mask, 10)
+            ],
+            "top10_project_typologies": [
+                {"type": typology or "sconosciuto", "amount": amount}
+                for typology, amount in self.top_groups("cup_typology", "total_funds_gross", mask, 10, skip_none=True)
+            ],
+            "funds_to_be_found": {
+                "number_of_projects_with_gap": int(np.count_nonzero(with_gap)),
+                "total_missing_amount": self.total("total_savings", with_gap),
+            },
+            "payments_realization_gap": {
+                "total_realized_cost": total_realized_cost,
+                "total_payments_made": total_payments_made,
+                "overall_difference": total_realized_cost - total_payments_made,
+            },
+        }
+
+
+# ------------------------------
+# Istanza del processo
+# ------------------------------
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def load_engine(version):
+    """Dallo snapshot condiviso se è della versione richiesta, altrimenti dal database."""
+    path = settings.ANALYTICS_SNAPSHOT_PATH
+    if path:
+        engine = ColumnarEngine.from_snapshot(path)
+        if engine is not None and engine.version == version:
+            return engine
+        logger.warning("Snapshot %s assente o non aggiornato alla versione %s: carico dal database", path, version)
+    return ColumnarEngine.from_database(version)
+
+
+def get_engine():
+    """Motore per la versione corrente del dataset, ricaricato quando l'import la incrementa."""
+    global _engine
+    version = get_dataset_version().version
+    if _engine is None or _engine.version != version:
+        with _engine_lock:
+            if _engine is None or _engine.version != version:
+                _engine = load_engine(version)
+    return _engine
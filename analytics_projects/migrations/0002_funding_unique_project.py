@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='funding',
+            constraint=models.UniqueConstraint(fields=('project',), name='unique_funding_per_project'),
+        ),
+    ]
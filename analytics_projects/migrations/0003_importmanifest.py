@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0002_funding_unique_project'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportManifest',
+            fields=[
+                ('local_project_code', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('content_hash', models.CharField(blank=True, max_length=32, null=True)),
+            ],
+        ),
+    ]
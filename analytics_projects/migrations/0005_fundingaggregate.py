@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0004_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region_code', models.CharField(blank=True, max_length=20, null=True)),
+                ('macroarea', models.CharField(blank=True, max_length=50, null=True)),
+                ('is_trasversale', models.BooleanField(default=False)),
+                ('oc_project_status', models.CharField(max_length=100)),
+                ('cup_descr_sector', models.CharField(blank=True, max_length=255, null=True)),
+                ('oc_synthetic_theme', models.CharField(blank=True, max_length=255, null=True)),
+                ('cup_typology', models.CharField(blank=True, max_length=255, null=True)),
+                ('project_count', models.IntegerField(default=0)),
+                ('big_project_count', models.IntegerField(default=0)),
+                ('projects_with_savings', models.IntegerField(default=0)),
+                ('positive_savings', models.FloatField(default=0)),
+                ('eu_funds', models.FloatField(blank=True, null=True)),
+                ('eu_funds_fesr', models.FloatField(blank=True, null=True)),
+                ('eu_funds_fse', models.FloatField(blank=True, null=True)),
+                ('eu_funds_feasr', models.FloatField(blank=True, null=True)),
+                ('eu_funds_feamp', models.FloatField(blank=True, null=True)),
+                ('eu_funds_iog', models.FloatField(blank=True, null=True)),
+                ('state_rotating_fund', models.FloatField(blank=True, null=True)),
+                ('state_fsc', models.FloatField(blank=True, null=True)),
+                ('state_pac', models.FloatField(blank=True, null=True)),
+                ('state_completions', models.FloatField(blank=True, null=True)),
+                ('state_other_measures', models.FloatField(blank=True, null=True)),
+                ('regional_funds', models.FloatField(blank=True, null=True)),
+                ('provincial_funds', models.FloatField(blank=True, null=True)),
+                ('municipal_funds', models.FloatField(blank=True, null=True)),
+                ('freed_resources', models.FloatField(blank=True, null=True)),
+                ('other_public_funds', models.FloatField(blank=True, null=True)),
+                ('foreign_state', models.FloatField(blank=True, null=True)),
+                ('private_funds', models.FloatField(blank=True, null=True)),
+                ('funds_to_find', models.FloatField(blank=True, null=True)),
+                ('total_savings', models.FloatField(blank=True, null=True)),
+                ('total_public_savings', models.FloatField(blank=True, null=True)),
+                ('total_funds_gross', models.FloatField(blank=True, null=True)),
+                ('total_funds_net', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['region_code', 'macroarea', 'is_trasversale'], name='fundingagg_filters_idx')],
+            },
+        ),
+    ]
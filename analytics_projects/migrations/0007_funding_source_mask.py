@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:31
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.lookups
+
+# Frozen copy of Funding.SOURCE_FAMILIES at the time of this migration
+SOURCE_FAMILIES = {
+    "UE": ("eu_funds", "eu_funds_fesr", "eu_funds_fse", "eu_funds_feasr", "eu_funds_feamp", "eu_funds_iog"),
+    "Stato": ("state_rotating_fund", "state_fsc", "state_pac", "state_completions", "state_other_measures"),
+    "Regioni": ("regional_funds",),
+    "Privato": ("private_funds",),
+    "Comune": ("municipal_funds",),
+    "Provincia": ("provincial_funds",),
+    "Altro_Pubblico": ("other_public_funds",),
+}
+
+
+def source_mask_sql():
+    """UPDATE computing source_mask like Funding.compute_source_mask for the existing rows."""
+    terms, field_bit = [], len(SOURCE_FAMILIES)
+    for family_bit, fields in enumerate(SOURCE_FAMILIES.values()):
+        for field in fields:
+            terms.append(f"(CASE WHEN {field} > 0 THEN {(1 << family_bit) | (1 << field_bit)} ELSE 0 END)")
+            field_bit += 1
+    return f"UPDATE analytics_projects_funding SET source_mask = {' | '.join(terms)}"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0006_datasetversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='funding',
+            name='source_mask',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(source_mask_sql(), migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(1)), 0)), fields=['project'], name='funding_src_ue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(2)), 0)), fields=['project'], name='funding_src_stato_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(4)), 0)), fields=['project'], name='funding_src_regioni_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(8)), 0)), fields=['project'], name='funding_src_privato_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(16)), 0)), fields=['project'], name='funding_src_comune_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(32)), 0)), fields=['project'], name='funding_src_provincia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('source_mask'), '&', models.Value(64)), 0)), fields=['project'], name='funding_src_altro_pubblico_idx'),
+        ),
+    ]
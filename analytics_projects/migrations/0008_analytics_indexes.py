@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0007_funding_source_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(fields=['-total_funds_gross'], include=('project',), name='funding_gross_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(('total_funds_gross__gte', 50000000)), fields=['project'], include=('total_funds_gross',), name='funding_big_projects_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='funding',
+            index=models.Index(condition=models.Q(('total_savings__gt', 0)), fields=['project'], include=('total_savings',), name='funding_savings_gap_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['macroarea', 'region_code'], name='location_macroarea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['is_trasversale', 'oc_project_status'], name='project_trasv_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['oc_project_status'], name='project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['cup_descr_sector'], include=('local_project_code',), name='project_sector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['oc_synthetic_theme'], include=('local_project_code',), name='project_theme_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('cup_typology__isnull', False)), fields=['cup_typology'], include=('local_project_code',), name='project_typology_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:34
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Fill the new columns from the M2M links of the existing projects
+POPULATE_SQL = """
+    UPDATE analytics_projects_project p
+    SET region_codes = s.region_codes, macroareas = s.macroareas
+    FROM (
+        SELECT t.project_id,
+               array_agg(t.location_id ORDER BY t.id) AS region_codes,
+               array_agg(DISTINCT l.macroarea ORDER BY l.macroarea) AS macroareas
+        FROM analytics_projects_location_project t
+        JOIN analytics_projects_location l ON l.region_code = t.location_id
+        GROUP BY t.project_id
+    ) s
+    WHERE s.project_id = p.local_project_code
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0008_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='macroareas',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='region_codes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=20), blank=True, default=list, size=None),
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='project',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['region_codes'], name='project_region_codes_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['macroareas'], name='project_macroareas_gin'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+# Fill the new columns from the funding and the M2M links of the existing projects
+POPULATE_SQL = [
+    """
+    UPDATE analytics_projects_project p
+    SET total_financing = f.total_funds_gross
+    FROM analytics_projects_funding f
+    WHERE f.project_id = p.local_project_code
+    """,
+    """
+    UPDATE analytics_projects_project p
+    SET region_label = s.region_label, macroarea_label = s.macroarea_label
+    FROM (
+        SELECT t.project_id,
+               string_agg(l.region_name, ', ' ORDER BY t.id) AS region_label,
+               string_agg(l.macroarea, ', ' ORDER BY t.id) AS macroarea_label
+        FROM analytics_projects_location_project t
+        JOIN analytics_projects_location l ON l.region_code = t.location_id
+        GROUP BY t.project_id
+    ) s
+    WHERE s.project_id = p.local_project_code
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0009_project_location_arrays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='macroarea_label',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='region_label',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='total_financing',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-total_financing', 'local_project_code'], name='project_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['is_trasversale', '-total_financing', 'local_project_code'], name='project_trasv_ranking_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:02
+
+from django.db import migrations
+
+# Frozen copy of the family bits of Funding.source_bit at the time of this migration
+SOURCE_FAMILY_BITS = [1 << bit for bit in range(7)]
+
+# Expression statistics on every source family bit (PostgreSQL 14+): without them the planner
+# estimates "source_mask & bit > 0" at a fixed third of the rows, whatever the source
+CREATE_SQL = "CREATE STATISTICS funding_source_bits_stats ON {} FROM analytics_projects_funding".format(
+    ", ".join(f"((source_mask & {bit}))" for bit in SOURCE_FAMILY_BITS)
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_projects', '0010_project_ranking'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE_SQL, "ANALYZE analytics_projects_funding"],
+            reverse_sql="DROP STATISTICS IF EXISTS funding_source_bits_stats",
+        ),
+    ]
@@ -1,4 +1,11 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.lookups import GreaterThan
+
+# Gross funding from which a project counts as "big" (count_big_projects)
+BIG_PROJECT_THRESHOLD = 50_000_000
 
 class Project(models.Model):
 
@@ -100,6 +107,51 @@ class Project(models.Model):
     cup_descr_sector = models.CharField(max_length=255, blank=True, null=True)  # CUP_DESCR_SETTORE
     oc_synthetic_theme = models.CharField(max_length=255, blank=True, null=True)  # OC_TEMA_SINTETICO
 
+    # Denormalized from locations at import (aggregates.refresh_project_locations):
+    # region codes in link order and distinct macroareas, filtered with @> instead of joining the M2M table
+    region_codes = ArrayField(models.CharField(max_length=20), default=list, blank=True)
+    macroareas = ArrayField(models.CharField(max_length=50), default=list, blank=True)
+
+    # Denormalized for the top-N listing (aggregates.refresh_project_rankings / refresh_project_locations):
+    # gross funding of the project (NULL without Funding) and the region / macroarea of every location,
+    # comma-separated in link order
+    total_financing = models.FloatField(blank=True, null=True)
+    region_label = models.TextField(default="", blank=True)
+    macroarea_label = models.TextField(default="", blank=True)
+
+    # Ranking order of the top-N listing, served by project_ranking_idx (NULL first, as in Postgres DESC)
+    RANKING_ORDER = ("-total_financing", "local_project_code")
+
+    class Meta:
+        indexes = [
+            # Top-N by financing: index scan stopping after N rows, also under the is_trasversale filter
+            models.Index(fields=["-total_financing", "local_project_code"], name="project_ranking_idx"),
+            models.Index(fields=["is_trasversale", "-total_financing", "local_project_code"],
+                         name="project_trasv_ranking_idx"),
+            # region / macroarea filters
+            GinIndex(fields=["region_codes"], name="project_region_codes_gin"),
+            GinIndex(fields=["macroareas"], name="project_macroareas_gin"),
+            # Overview: is_trasversale filter, counts by status
+            models.Index(fields=["is_trasversale", "oc_project_status"], name="project_trasv_status_idx"),
+            models.Index(fields=["oc_project_status"], name="project_status_idx"),
+            # Group-by columns of the top-N sections, covering the join key to Funding
+            models.Index(fields=["cup_descr_sector"], include=["local_project_code"], name="project_sector_idx"),
+            models.Index(fields=["oc_synthetic_theme"], include=["local_project_code"], name="project_theme_idx"),
+            models.Index(fields=["cup_typology"], include=["local_project_code"], name="project_typology_idx",
+                         condition=Q(cup_typology__isnull=False)),
+        ]
+
+# Funding source families (the funding_source filter) and their fund columns
+FUNDING_SOURCE_FAMILIES = {
+    "UE": ("eu_funds", "eu_funds_fesr", "eu_funds_fse", "eu_funds_feasr", "eu_funds_feamp", "eu_funds_iog"),
+    "Stato": ("state_rotating_fund", "state_fsc", "state_pac", "state_completions", "state_other_measures"),
+    "Regioni": ("regional_funds",),
+    "Privato": ("private_funds",),
+    "Comune": ("municipal_funds",),
+    "Provincia": ("provincial_funds",),
+    "Altro_Pubblico": ("other_public_funds",),
+}
+
 class Funding(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="funding")
 
@@ -134,19 +186,82 @@ class Funding(models.Model):
     total_funds_gross = models.FloatField(blank=True, null=True)  # Gross
     total_funds_net = models.FloatField(blank=True, null=True)  # Net
 
+    # Funding sources present (> 0): one bit per source family, then one per fund column (see source_bit)
+    source_mask = models.IntegerField(default=0)
+
+    # Components of the gross total, in the order they are summed
+    GROSS_FUNDS_FIELDS = (
+        "eu_funds", "eu_funds_fesr", "eu_funds_fse", "eu_funds_feasr", "eu_funds_feamp",
+        "eu_funds_iog", "state_rotating_fund", "state_fsc", "state_pac", "state_completions",
+        "state_other_measures", "regional_funds", "provincial_funds", "municipal_funds",
+        "freed_resources", "other_public_funds", "foreign_state", "private_funds",
+        "funds_to_find",
+    )
+
+    SOURCE_FAMILIES = FUNDING_SOURCE_FAMILIES
+    SOURCE_MASK_FIELDS = tuple(field for fields in SOURCE_FAMILIES.values() for field in fields)
+
+    class Meta:
+        constraints = [
+            # one funding row per project (the importer upserts on it)
+            models.UniqueConstraint(fields=["project"], name="unique_funding_per_project"),
+        ]
+        indexes = [
+            # one partial index per source family, matching Funding.source_filter
+            # (their selectivity comes from the funding_source_bits_stats statistics, migration 0011)
+            models.Index(fields=["project"], name=f"funding_src_{family.lower()}_idx",
+                         condition=Q(GreaterThan(F("source_mask").bitand(1 << bit), 0)))
+            for bit, family in enumerate(FUNDING_SOURCE_FAMILIES)
+        ] + [
+            # ranking and sums by gross funding
+            models.Index(fields=["-total_funds_gross"], include=["project"], name="funding_gross_idx"),
+            # count_big_projects
+            models.Index(fields=["project"], include=["total_funds_gross"], name="funding_big_projects_idx",
+                         condition=Q(total_funds_gross__gte=BIG_PROJECT_THRESHOLD)),
+            # get_funds_to_be_found
+            models.Index(fields=["project"], include=["total_savings"], name="funding_savings_gap_idx",
+                         condition=Q(total_savings__gt=0)),
+        ]
+
+    @classmethod
+    def source_bit(cls, name):
+        """Bit of a source family ("UE", "Stato", ...) or of a fund column in source_mask."""
+        if name in cls.SOURCE_FAMILIES:
+            return 1 << list(cls.SOURCE_FAMILIES).index(name)
+        return 1 << (len(cls.SOURCE_FAMILIES) + cls.SOURCE_MASK_FIELDS.index(name))
+
+    @classmethod
+    def source_filter(cls, name):
+        """Q matching the funding rows with the given source family or fund column (> 0)."""
+        return Q(GreaterThan(F("source_mask").bitand(cls.source_bit(name)), 0))
+
+    @classmethod
+    def compute_source_mask(cls, values):
+        """source_mask for a mapping of fund column -> amount."""
+        mask = 0
+        for family, fields in cls.SOURCE_FAMILIES.items():
+            for field in fields:
+                if (values.get(field) or 0) > 0:
+                    mask |= cls.source_bit(family) | cls.source_bit(field)
+        return mask
+
     def save(self, *args, **kwargs):
         # Gross total = sum of all funds
-        self.total_funds_gross = (
-                self.eu_funds + self.eu_funds_fesr + self.eu_funds_fse + self.eu_funds_feasr + self.eu_funds_feamp +
-                self.eu_funds_iog + self.state_rotating_fund + self.state_fsc + self.state_pac + self.state_completions
-                + self.state_other_measures + self.regional_funds + self.provincial_funds + self.municipal_funds +
-                self.freed_resources + self.other_public_funds + self.foreign_state + self.private_funds +
-                self.funds_to_find
-        )
+        self.total_funds_gross = sum(getattr(self, field) for field in self.GROSS_FUNDS_FIELDS)
 
         # Net total = gross - total savings
         self.total_funds_net = self.total_funds_gross - (self.total_savings or 0)
 
+        self.source_mask = self.compute_source_mask(
+            {field: getattr(self, field) for field in self.SOURCE_MASK_FIELDS}
+        )
+
+        # update_or_create saves only the fields of its defaults: the derived ones go along
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "total_funds_gross", "total_funds_net", "source_mask"}
+
+        # Project.total_financing is not touched here: the importer refreshes it set-wise
+        # (refresh_project_rankings), the admin in FundingAdmin.save_model
         super().save(*args, **kwargs)
 
 class Location(models.Model):
@@ -166,4 +281,77 @@ class Location(models.Model):
         default=MacroAreaChoices.OTHER,
         verbose_name='Macro Area'
     )
-    project = models.ManyToManyField('Project', related_name='locations')
\ No newline at end of file
+    project = models.ManyToManyField('Project', related_name='locations')
+
+    class Meta:
+        indexes = [
+            # macroarea filter -> region codes to look up in the M2M table
+            models.Index(fields=["macroarea", "region_code"], name="location_macroarea_idx"),
+        ]
+class ImportManifest(models.Model):
+    # Content fingerprint of the CSV row last imported for each project (delta import)
+    local_project_code = models.CharField(max_length=100, primary_key=True)  # COD_LOCALE_PROGETTO
+    content_hash = models.CharField(max_length=32, blank=True, null=True)
+
+class ImportCheckpoint(models.Model):
+    # Progress of a chunked import, one row per CSV file (resume after a failure)
+    file_path = models.CharField(max_length=500, primary_key=True)
+    row_offset = models.PositiveBigIntegerField(default=0)  # CSV rows already committed
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class DatasetVersion(models.Model):
+    # Single row bumped by the importer after every completed import (or swap / rollback):
+    # cached API responses are keyed on it, so a new import invalidates them all
+    SINGLETON_ID = 1
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class FundingAggregate(models.Model):
+    # Funding sums per combination of the analytics filters, rebuilt after every import
+    # (see aggregates.refresh_funding_aggregates).
+    # region_code / macroarea NULL mean "all": every project is counted once per row it matches.
+    region_code = models.CharField(max_length=20, blank=True, null=True)
+    macroarea = models.CharField(max_length=50, blank=True, null=True)
+    is_trasversale = models.BooleanField(default=False)
+    oc_project_status = models.CharField(max_length=100)
+    cup_descr_sector = models.CharField(max_length=255, blank=True, null=True)
+    oc_synthetic_theme = models.CharField(max_length=255, blank=True, null=True)
+    cup_typology = models.CharField(max_length=255, blank=True, null=True)
+
+    # Counters
+    project_count = models.IntegerField(default=0)
+    big_project_count = models.IntegerField(default=0)  # total_funds_gross >= BIG_PROJECT_THRESHOLD
+    projects_with_savings = models.IntegerField(default=0)  # total_savings > 0
+    positive_savings = models.FloatField(default=0)  # sum of total_savings > 0
+
+    # Sums of the Funding columns (NULL when no project of the row has a funding)
+    eu_funds = models.FloatField(blank=True, null=True)
+    eu_funds_fesr = models.FloatField(blank=True, null=True)
+    eu_funds_fse = models.FloatField(blank=True, null=True)
+    eu_funds_feasr = models.FloatField(blank=True, null=True)
+    eu_funds_feamp = models.FloatField(blank=True, null=True)
+    eu_funds_iog = models.FloatField(blank=True, null=True)
+    state_rotating_fund = models.FloatField(blank=True, null=True)
+    state_fsc = models.FloatField(blank=True, null=True)
+    state_pac = models.FloatField(blank=True, null=True)
+    state_completions = models.FloatField(blank=True, null=True)
+    state_other_measures = models.FloatField(blank=True, null=True)
+    regional_funds = models.FloatField(blank=True, null=True)
+    provincial_funds = models.FloatField(blank=True, null=True)
+    municipal_funds = models.FloatField(blank=True, null=True)
+    freed_resources = models.FloatField(blank=True, null=True)
+    other_public_funds = models.FloatField(blank=True, null=True)
+    foreign_state = models.FloatField(blank=True, null=True)
+    private_funds = models.FloatField(blank=True, null=True)
+    funds_to_find = models.FloatField(blank=True, null=True)
+    total_savings = models.FloatField(blank=True, null=True)
+    total_public_savings = models.FloatField(blank=True, null=True)
+    total_funds_gross = models.FloatField(blank=True, null=True)
+    total_funds_net = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["region_code", "macroarea", "is_trasversale"], name="fundingagg_filters_idx"),
+        ]
@@ -0,0 +1,41 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional dependency: fall back to the stock renderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed and settings.ANALYTICS_FAST_JSON is on.
+
+    Same output as the compact JSONRenderer: UTF-8, no whitespace, U+2028 / U+2029 escaped.
+    Indented output (Accept: application/json; indent=N, browsable API) and the non-compact
+    or ASCII-only configurations still go through the stock encoder.
+
+    Dates and times are passed through to the DRF encoder, so they keep its format
+    (ISO 8601, "Z" for UTC). Two known differences remain: floats written with an exponent
+    (1e16 rather than 1e+16, same value), and NaN / Infinity rendered as null where
+    JSONRenderer raises ValueError (the services never return them).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or not settings.ANALYTICS_FAST_JSON
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # Keep the output a strict javascript subset, as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,3 +1,6 @@
+from functools import lru_cache
+
+from django.conf import settings
 from rest_framework import serializers
 
 #Overview
@@ -109,3 +112,101 @@ class AnalysisSerializer(serializers.Serializer):
     funds_to_be_found = FundsToBeFoundSerializer()
     payments_realization_gap = PaymentsRealizationGapSerializer()
 
+
+# -----------------------------
+# Grouped metrics (one entry per value of a dimension)
+# -----------------------------
+
+class GroupOverviewSerializer(OverviewSerializer):
+    filters = None
+
+class GroupAnalysisSerializer(AnalysisSerializer):
+    filters = None
+
+class GroupSerializer(serializers.Serializer):
+    value = serializers.CharField(allow_null=True)
+    overview = GroupOverviewSerializer()
+    analysis = GroupAnalysisSerializer()
+
+class GroupedSerializer(serializers.Serializer):
+    dimension = serializers.CharField()
+    groups = GroupSerializer(many=True)
+
+# -----------------------------
+# Project listing (keyset pagination, sparse fields)
+# -----------------------------
+
+class ProjectListItemSerializer(serializers.Serializer):
+    id = serializers.CharField()
+    title = serializers.CharField()
+    total_financing = serializers.FloatField(allow_null=True)
+    region = serializers.CharField()
+    macroarea = serializers.CharField()
+    region_codes = serializers.ListField(child=serializers.CharField())
+    is_trasversale = serializers.BooleanField()
+    status = serializers.CharField()
+    procedural_state = serializers.CharField()
+    sector = serializers.CharField(allow_null=True)
+    theme = serializers.CharField(allow_null=True)
+    typology = serializers.CharField(allow_null=True)
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse field selection: keep only the requested fields
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+# -----------------------------
+# Fast path for trusted service output
+# -----------------------------
+
+def compile_representation(field):
+    """
+    Plain function equivalent to field.to_representation for the field types used above
+    (nested serializers, DictField / ListField, Float / Integer / Char fields): the field tree
+    is walked once here instead of on every response. None values stay None, as in DRF.
+    """
+    if isinstance(field, serializers.ListSerializer):
+        child = compile_representation(field.child)
+        return lambda value: [child(item) for item in value]
+
+    if isinstance(field, serializers.Serializer):
+        fields = [(name, compile_representation(sub)) for name, sub in field.fields.items()]
+
+        def represent(value):
+            ret = {}
+            for name, child in fields:
+                item = value[name]
+                ret[name] = None if item is None else child(item)
+            return ret
+        return represent
+
+    if isinstance(field, serializers.DictField):
+        child = compile_representation(field.child)
+        return lambda value: {str(key): None if item is None else child(item) for key, item in value.items()}
+
+    if isinstance(field, serializers.ListField):
+        child = compile_representation(field.child)
+        return lambda value: [None if item is None else child(item) for item in value]
+
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.CharField):
+        return str
+
+    return field.to_representation
+
+
+@lru_cache(maxsize=None)
+def compiled_serializer(serializer_class):
+    return compile_representation(serializer_class())
+
+
+def serialize(serializer_class, data):
+    """serializer_class(data).data, through the compiled fast path when settings.ANALYTICS_FAST_JSON is on."""
+    if settings.ANALYTICS_FAST_JSON:
+        return compiled_serializer(serializer_class)(data)
+    return serializer_class(data).data
@@ -1,33 +1,175 @@
 import os
+import logging
+import base64
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import django
-from django.db.models import Sum, Q, F
+from django.db.models import Sum, Q, F, Exists, OuterRef
 
 from django.db.models import Prefetch
+from django.db.models.functions import Collate
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'horizon_analytics.settings')
 
 # Initialize Django
 django.setup()
 
-from analytics_projects.models import Project, Funding, Location
+from django.conf import settings
+from django.db import connection, connections, close_old_connections
+
+from analytics_projects.models import Project, Funding, Location, FundingAggregate
+from analytics_projects.aggregates import BIG_PROJECT_THRESHOLD
+from analytics_projects.cache import cached_response
+
+logger = logging.getLogger(__name__)
+
+# Colonne di Funding che identificano ogni fonte di finanziamento (funding_source)
+FUNDING_SOURCE_FIELDS = Funding.SOURCE_FAMILIES
+
+# Filtri per fonte di finanziamento: un solo predicato sul bit della fonte in source_mask,
+# servito dall'indice parziale della fonte
+FUNDING_SOURCE_FILTERS = {source: Funding.source_filter(source) for source in FUNDING_SOURCE_FIELDS}
+
+# Colonne di Funding sommate per fonte (funding_sources_analysis)
+SOURCE_FIELDS = {
+    "UE": ["eu_funds"],
+    "Stato": ["state_rotating_fund", "state_fsc", "state_pac", "state_completions", "state_other_measures"],
+    "Regioni": ["regional_funds"],
+    "Privato": ["private_funds"],
+    "Comune": ["municipal_funds"],
+    "Provincia": ["provincial_funds"],
+    "Altro_Pubblico": ["other_public_funds"]
+}
+
+# Colonne di Funding -> chiavi di specific_funds_contribution
+SPECIFIC_FUNDS_FIELDS = {
+    "eu_funds_fesr": "FESR_UE",
+    "eu_funds_fse": "FSE_UE",
+    "eu_funds_feasr": "FEASR_UE",
+    "eu_funds_feamp": "FEAMP_UE",
+    "eu_funds_iog": "IOG_UE",
+    "state_fsc": "FSC_Stato",
+    "state_rotating_fund": "Fondo_di_Rotazione_Stato",
+    "state_pac": "PAC_Stato",
+    "state_completions": "Completamenti_Stato",
+    "state_other_measures": "Altri_Stato",
+    "regional_funds": "Regioni",
+    "private_funds": "Privato",
+    "municipal_funds": "Comune",
+    "provincial_funds": "Provincia",
+    "other_public_funds": "Altro_Pubblico"
+}
+
+# Colonne specifiche aggregate quando funding_source è specificato
+SPECIFIC_SOURCE_FIELDS = {
+    "UE": ["eu_funds_fesr", "eu_funds_fse", "eu_funds_feasr", "eu_funds_feamp", "eu_funds_iog"],
+    "Stato": ["state_fsc", "state_rotating_fund", "state_pac", "state_completions", "state_other_measures"],
+    "Regioni": ["regional_funds"],
+    "Privato": ["private_funds"],
+    "Comune": ["municipal_funds"],
+    "Provincia": ["provincial_funds"],
+    "Altro_Pubblico": ["other_public_funds"]
+}
+
+# ------------------------------
+# Ordinamento dei top-N
+# ------------------------------
+def ranking_order(amount, name):
+    """
+    Ordine dei top-N per somma (settori, temi, tipologie): amount decrescente e, a parità, name
+    in collation "C" con i NULL per ultimi, lo stesso ordine di group_ranking_key in Python.
+    """
+    return F(amount).desc(), Collate(F(name), "C").asc(nulls_last=True)
+
+
+def group_ranking_key(group):
+    """Chiave di ordinamento di (nome, somma) come ranking_order."""
+    name, amount = group
+    return -(amount or 0), name is None, name or ""
+
+
+# ------------------------------
+# Cubo pre-aggregato (FundingAggregate)
+# ------------------------------
+def aggregates_enabled():
+    """Il cubo si usa solo se abilitato e già calcolato da un import."""
+    return settings.ANALYTICS_USE_AGGREGATES and FundingAggregate.objects.exists()
+
+
+def normalize_overview_filters(filters):
+    """(region, macroarea, is_trasversale) come li interpreta get_filtered_projects: None = nessun filtro."""
+    region = filters.get("region")
+    macroarea = filters.get("macroarea")
+    is_trasversale = filters.get("is_trasversale")
+
+    if not region or region == "nessun filtro":
+        region = None
+    if not macroarea or macroarea == "nessun filtro":
+        macroarea = None
+    if is_trasversale is not None:
+        is_trasversale = {"true": True, "false": False}.get(str(is_trasversale).lower())
+
+    return region, macroarea, is_trasversale
+
+
+def get_overview_aggregates(filters):
+    """Righe del cubo che corrispondono ai filtri di get_filtered_projects, o None se il cubo non si può usare."""
+    if not aggregates_enabled():
+        return None
+
+    region, macroarea, is_trasversale = normalize_overview_filters(filters)
+
+    aggregates_qs = FundingAggregate.objects.filter(region_code=region, macroarea=macroarea)
+    if is_trasversale is not None:
+        aggregates_qs = aggregates_qs.filter(is_trasversale=is_trasversale)
+
+    return aggregates_qs
+
+
+def normalize_analysis_filters(filters):
+    """(macroarea, funding_source) come li interpreta get_filtered_projects_by_filters: None = nessun filtro."""
+    macroarea = filters.get("macroarea")
+    funding_source = filters.get("funding_source")
+
+    if not macroarea or macroarea == "Tutte":
+        macroarea = None
+    if funding_source not in FUNDING_SOURCE_FILTERS:
+        funding_source = None
+
+    return macroarea, funding_source
+
+
+def get_analysis_aggregates(filters):
+    """
+    Righe del cubo che corrispondono ai filtri di get_filtered_projects_by_filters, o None se il cubo non si può usare.
+    Il filtro per fonte di finanziamento è per singolo Funding e non è rappresentato nel cubo.
+    """
+    macroarea, funding_source = normalize_analysis_filters(filters)
+
+    if funding_source is not None or not aggregates_enabled():
+        return None
+
+    return FundingAggregate.objects.filter(region_code=None, macroarea=macroarea)
+
 
 # ------------------------------
 # Funzione base per filtrare progetti
 # ------------------------------
 def get_filtered_projects(filters):
-    """Restituisce i progetti filtrati per regione, macroarea e is_trasversale, con total_financing annotato."""
+    """Restituisce i progetti filtrati per regione, macroarea e is_trasversale."""
     region = filters.get("region")
     macroarea = filters.get("macroarea")
     is_trasversale = filters.get("is_trasversale")
 
-    projects_qs = Project.objects.prefetch_related("locations").annotate(
-        total_financing=Sum("funding__total_funds_gross")
-    )
+    projects_qs = Project.objects.all()
 
+    # region_codes / macroareas: niente join con le locations, quindi niente distinct
     if region and region != "nessun filtro":
-        projects_qs = projects_qs.filter(locations__region_code=region)
+        projects_qs = projects_qs.filter(region_codes__contains=[region])
 
     if macroarea and macroarea != "nessun filtro":
-        projects_qs = projects_qs.filter(locations__macroarea=macroarea)
+        projects_qs = projects_qs.filter(macroareas__contains=[macroarea])
 
     if is_trasversale is not None:
         if str(is_trasversale).lower() == "true":
@@ -35,27 +177,39 @@ def get_filtered_projects(filters):
         elif str(is_trasversale).lower() == "false":
             projects_qs = projects_qs.filter(is_trasversale=False)
 
-    return projects_qs.distinct()
+    return projects_qs
 
 # ------------------------------
-# Top 10 progetti per finanziamento
+# Top N progetti per finanziamento
 # ------------------------------
+def normalize_top_n(filters):
+    """Numero di progetti del top-N: filters["top_n"] tra 1 e ANALYTICS_TOP_N_MAX, altrimenti ANALYTICS_TOP_N."""
+    try:
+        top_n = int(filters.get("top_n") or settings.ANALYTICS_TOP_N)
+    except (TypeError, ValueError):
+        top_n = settings.ANALYTICS_TOP_N
+    return min(max(top_n, 1), settings.ANALYTICS_TOP_N_MAX)
+
+
 def top_10_projects(filters):
+    """
+    Primi N progetti (normalize_top_n, 10 di default) per finanziamento: total_financing ed etichette
+    sono colonne di Project, quindi una sola query che legge project_ranking_idx e si ferma dopo N righe.
+    """
     projects_qs = get_filtered_projects(filters)
 
-    top_projects_qs = projects_qs.order_by("-total_financing")[:10]
+    top_projects_qs = projects_qs.order_by(*Project.RANKING_ORDER).values_list(
+        "local_project_code", "oc_project_title", "total_financing", "region_label", "macroarea_label"
+    )[:normalize_top_n(filters)]
 
     result = {}
-    for index, project in enumerate(top_projects_qs, start=1):
-        regions_str = ", ".join([loc.region_name for loc in project.locations.all()])
-        macroareas_str = ", ".join([loc.macroarea for loc in project.locations.all()])
-
+    for index, (code, title, total_financing, region_label, macroarea_label) in enumerate(top_projects_qs, start=1):
         result[f"project{index}"] = {
-            "id": project.local_project_code,
-            "title": project.oc_project_title,
-            "total_financing": project.total_financing or 0,
-            "region": regions_str,
-            "macroarea": macroareas_str,
+            "id": code,
+            "title": title,
+            "total_financing": total_financing or 0,
+            "region": region_label,
+            "macroarea": macroarea_label,
         }
 
     return result
@@ -65,13 +219,26 @@ def top_10_projects(filters):
 # Top 3 settori per finanziamento
 # ------------------------------
 def get_top_sectors(filters):
+    aggregates_qs = get_overview_aggregates(filters)
+    if aggregates_qs is not None:
+        sectors = (
+            aggregates_qs.values("cup_descr_sector")
+            .annotate(total=Sum("total_funds_gross"))
+            .filter(total__isnull=False)
+            .order_by(*ranking_order("total", "cup_descr_sector"))[:3]
+        )
+        return {
+            f"sector{i}": {"name": x["cup_descr_sector"], "total_financing": x["total"] or 0}
+            for i, x in enumerate(sectors, start=1)
+        }
+
     projects_qs = get_filtered_projects(filters)
 
     fundings = Funding.objects.filter(project__in=projects_qs).values(
         "project__cup_descr_sector"
     ).annotate(
         total=Sum("total_funds_gross")
-    ).order_by("-total")[:3]
+    ).order_by(*ranking_order("total", "project__cup_descr_sector"))[:3]
 
     result = {}
     for i, x in enumerate(fundings, start=1):
@@ -88,32 +255,50 @@ def get_top_sectors(filters):
 # Numero di progetti grandi (>50M)
 # ------------------------------
 def count_big_projects(filters):
+    aggregates_qs = get_overview_aggregates(filters)
+    if aggregates_qs is not None:
+        return aggregates_qs.aggregate(total=Sum("big_project_count"))["total"] or 0
+
     projects_qs = get_filtered_projects(filters)
-    big_project_threshold = 50_000_000
 
-    return projects_qs.filter(funding__total_funds_gross__gte=big_project_threshold).distinct().count()
+    return projects_qs.filter(funding__total_funds_gross__gte=BIG_PROJECT_THRESHOLD).distinct().count()
 
 
 # ------------------------------
 # Finanziamenti per macroarea
 # ------------------------------
 def funding_by_macroarea(filters):
-    projects_qs = Project.objects.all() #no filter because we want see only middle north and midday
-    fundings = Funding.objects.filter(project__in=projects_qs).distinct()
-
-    result = fundings.values("project__locations__macroarea").annotate(
-        total=Sum("total_funds_gross")
-    )
+    # Non filtrata: ogni Funding conta una volta per ciascuna macroarea del suo progetto
+    macroareas = Location.MacroAreaChoices.values
+    result = Funding.objects.aggregate(**{
+        f"macroarea_{i}": Sum("total_funds_gross", filter=Q(project__macroareas__contains=[macroarea]))
+        for i, macroarea in enumerate(macroareas)
+    })
 
     return {
-        item["project__locations__macroarea"]: item["total"] or 0
-        for item in result
+        macroarea: result[f"macroarea_{i}"] or 0
+        for i, macroarea in enumerate(macroareas)
+        if result[f"macroarea_{i}"] is not None
     }
 
 # ------------------------------
 # Conteggio progetti per stato
 # ------------------------------
 def count_projects_with_status(filters):
+    aggregates_qs = get_overview_aggregates(filters)
+    if aggregates_qs is not None:
+        by_status = {
+            row["oc_project_status"]: row["total"]
+            for row in aggregates_qs.values("oc_project_status").annotate(total=Sum("project_count"))
+        }
+        return {
+            "total": sum(by_status.values()),
+            "not_started": by_status.get(Project.ProjectStatusChoices.NOT_STARTED, 0),
+            "in_progress": by_status.get(Project.ProjectStatusChoices.ONGOING, 0),
+            "concluded": by_status.get(Project.ProjectStatusChoices.CONCLUDED, 0),
+            "liquidated": by_status.get(Project.ProjectStatusChoices.LIQUIDATED, 0),
+        }
+
     projects_qs = get_filtered_projects(filters)
 
     not_started_projects = projects_qs.filter(
@@ -146,6 +331,10 @@ def count_projects_with_status(filters):
 # Somma totale dei finanziamenti
 # ------------------------------
 def sum_funding_gross(filters):
+    aggregates_qs = get_overview_aggregates(filters)
+    if aggregates_qs is not None:
+        return aggregates_qs.aggregate(total_gross=Sum("total_funds_gross"))["total_gross"] or 0
+
     projects_qs = get_filtered_projects(filters)
     fundings = Funding.objects.filter(project__in=projects_qs).distinct()
 
@@ -167,135 +356,103 @@ def get_filtered_projects_by_filters(filters):
     # --------------------------
     # Filtra i progetti per macroarea
     # --------------------------
-    projects_qs = Project.objects.prefetch_related("locations").distinct()
+    projects_qs = Project.objects.all()
     if macroarea and macroarea != "Tutte":
-        projects_qs = projects_qs.filter(locations__macroarea=macroarea)
+        projects_qs = projects_qs.filter(macroareas__contains=[macroarea])
 
     # --------------------------
     # Filtra i finanziamenti per funding_source
     # --------------------------
     funding_qs = Funding.objects.filter(project__in=projects_qs)
     if funding_source and funding_source != "Tutte":
-        source_map = {
-            "UE": Q(eu_funds__gt=0) | Q(eu_funds_fesr__gt=0) | Q(eu_funds_fse__gt=0) |
-                  Q(eu_funds_feasr__gt=0) | Q(eu_funds_feamp__gt=0) | Q(eu_funds_iog__gt=0),
-            "Stato": Q(state_rotating_fund__gt=0) | Q(state_fsc__gt=0) | Q(state_pac__gt=0) |
-                     Q(state_completions__gt=0) | Q(state_other_measures__gt=0),
-            "Regioni": Q(regional_funds__gt=0),
-            "Privato": Q(private_funds__gt=0),
-            "Comune": Q(municipal_funds__gt=0),
-            "Provincia": Q(provincial_funds__gt=0),
-            "Altro_Pubblico": Q(other_public_funds__gt=0),
-        }
-        if funding_source in source_map:
-            funding_qs = funding_qs.filter(source_map[funding_source])
+        if funding_source in FUNDING_SOURCE_FILTERS:
+            funding_qs = funding_qs.filter(FUNDING_SOURCE_FILTERS[funding_source])
 
-    return projects_qs.distinct(), funding_qs.distinct()
+    return projects_qs, funding_qs
 
 
 # ------------------------------
 # Somma totale delle fonti di finanziamento
 # ------------------------------
-def funding_sources_analysis(filters):
-    projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
-    funding_source = filters.get("funding_source")
+def funding_sources_fields(funding_source):
+    if funding_source in SOURCE_FIELDS:
+        return SOURCE_FIELDS[funding_source]
+    return sum(SOURCE_FIELDS.values(), [])
 
-    all_sources = ["UE", "Stato", "Regioni", "Privato", "Comune", "Provincia", "Altro_Pubblico"]
 
-    source_fields = {
-        "UE": ["eu_funds"],
-        "Stato": ["state_rotating_fund", "state_fsc", "state_pac", "state_completions", "state_other_measures"],
-        "Regioni": ["regional_funds"],
-        "Privato": ["private_funds"],
-        "Comune": ["municipal_funds"],
-        "Provincia": ["provincial_funds"],
-        "Altro_Pubblico": ["other_public_funds"]
-    }
+def funding_sources_result(agg, funding_source):
+    """Somme per fonte a partire dalle somme per colonna."""
+    fields_to_aggregate = funding_sources_fields(funding_source)
 
-    output_map = {
-        "eu_funds": "UE",
-        "state_fsc": "Stato",
-        "state_rotating_fund": "Stato",
-        "state_pac": "Stato",
-        "state_completions": "Stato",
-        "state_other_measures": "Stato",
-        "regional_funds": "Regioni",
-        "private_funds": "Privato",
-        "municipal_funds": "Comune",
-        "provincial_funds": "Provincia",
-        "other_public_funds": "Altro_Pubblico"
-    }
+    result = {s: 0.0 for s in SOURCE_FIELDS}
+    for key, fields in SOURCE_FIELDS.items():
+        for f in fields:
+            if f in fields_to_aggregate:
+                result[key] += float(agg.get(f, 0) or 0)
+    return result
 
-    if funding_source in source_fields:
-        fields_to_aggregate = source_fields[funding_source]
-    else:
-        fields_to_aggregate = sum(source_fields.values(), [])
 
-    agg = funding_qs.aggregate(**{f: Sum(f) for f in fields_to_aggregate})
+def funding_sources_analysis(filters):
+    projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
+    funding_source = filters.get("funding_source")
 
-    result = {s: 0.0 for s in all_sources}
-    for f in fields_to_aggregate:
-        key = output_map[f]
-        result[key] += float(agg.get(f, 0) or 0)
+    # Il cubo ha le stesse colonne di Funding
+    aggregates_qs = get_analysis_aggregates(filters)
+    source_qs = aggregates_qs if aggregates_qs is not None else funding_qs
+    agg = source_qs.aggregate(**{f: Sum(f) for f in funding_sources_fields(funding_source)})
 
-    return result
+    return funding_sources_result(agg, funding_source)
 
 
 # ------------------------------
 # Somma totale delle fonti di finanziamento SPECIFICHE
 # ------------------------------
-def specific_funds_contribution(filters):
-    projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
-
-    field_mapping = {
-        "eu_funds_fesr": "FESR_UE",
-        "eu_funds_fse": "FSE_UE",
-        "eu_funds_feasr": "FEASR_UE",
-        "eu_funds_feamp": "FEAMP_UE",
-        "eu_funds_iog": "IOG_UE",
-        "state_fsc": "FSC_Stato",
-        "state_rotating_fund": "Fondo_di_Rotazione_Stato",
-        "state_pac": "PAC_Stato",
-        "state_completions": "Completamenti_Stato",
-        "state_other_measures": "Altri_Stato",
-        "regional_funds": "Regioni",
-        "private_funds": "Privato",
-        "municipal_funds": "Comune",
-        "provincial_funds": "Provincia",
-        "other_public_funds": "Altro_Pubblico"
-    }
-
+def specific_funds_fields(funding_source):
     # Aggrega solo i campi filtrati se funding_source è specificato
-    funding_source = filters.get("funding_source")
-    source_fields_map = {
-        "UE": ["eu_funds_fesr", "eu_funds_fse", "eu_funds_feasr", "eu_funds_feamp", "eu_funds_iog"],
-        "Stato": ["state_fsc", "state_rotating_fund", "state_pac", "state_completions", "state_other_measures"],
-        "Regioni": ["regional_funds"],
-        "Privato": ["private_funds"],
-        "Comune": ["municipal_funds"],
-        "Provincia": ["provincial_funds"],
-        "Altro_Pubblico": ["other_public_funds"]
-    }
+    if funding_source in SPECIFIC_SOURCE_FIELDS:
+        return SPECIFIC_SOURCE_FIELDS[funding_source]
+    return list(SPECIFIC_FUNDS_FIELDS.keys())
 
-    if funding_source in source_fields_map:
-        fields_to_aggregate = source_fields_map[funding_source]
-    else:
-        fields_to_aggregate = list(field_mapping.keys())
 
-    agg = funding_qs.aggregate(**{f: Sum(f) for f in fields_to_aggregate})
+def specific_funds_result(agg, funding_source):
+    fields_to_aggregate = specific_funds_fields(funding_source)
 
     # Mantieni tutte le chiavi per il serializer
-    result = {v: 0.0 for v in field_mapping.values()}
-    for f, out_key in field_mapping.items():
+    result = {v: 0.0 for v in SPECIFIC_FUNDS_FIELDS.values()}
+    for f, out_key in SPECIFIC_FUNDS_FIELDS.items():
         if f in fields_to_aggregate:
             result[out_key] = float(agg.get(f, 0) or 0)
     return result
 
 
+def specific_funds_contribution(filters):
+    projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
+    funding_source = filters.get("funding_source")
+
+    aggregates_qs = get_analysis_aggregates(filters)
+    source_qs = aggregates_qs if aggregates_qs is not None else funding_qs
+    agg = source_qs.aggregate(**{f: Sum(f) for f in specific_funds_fields(funding_source)})
+
+    return specific_funds_result(agg, funding_source)
+
+
 # ------------------------------
 # Top 10 tematiche con il maggior valore di finanziamento (aggiornata con filtro funding_source)
 # ------------------------------
 def top10_thematic_objectives(filters):
+    aggregates_qs = get_analysis_aggregates(filters)
+    if aggregates_qs is not None:
+        themes = (
+            aggregates_qs.values("oc_synthetic_theme")
+            .annotate(amount=Sum("total_funds_gross"))
+            .filter(amount__isnull=False)
+            .order_by(*ranking_order("amount", "oc_synthetic_theme"))[:10]
+        )
+        return [
+            {"description": t["oc_synthetic_theme"] or "Non specificato", "amount": float(t["amount"] or 0)}
+            for t in themes
+        ]
+
     projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
 
     # Se non ci sono progetti o finanziamenti filtrati, ritorna vuoto
@@ -306,7 +463,7 @@ def top10_thematic_objectives(filters):
         funding_qs
         .values("project__oc_synthetic_theme")
         .annotate(amount=Sum("total_funds_gross"))
-        .order_by("-amount")[:10]
+        .order_by(*ranking_order("amount", "project__oc_synthetic_theme"))[:10]
     )
 
     return [
@@ -322,6 +479,14 @@ def top10_thematic_objectives(filters):
 # Totale fondi da trovare (gap)
 # ------------------------------
 def get_funds_to_be_found(filters):
+    aggregates_qs = get_analysis_aggregates(filters)
+    if aggregates_qs is not None:
+        agg = aggregates_qs.aggregate(
+            number_of_projects_with_gap=Sum("projects_with_savings"),
+            total_missing_amount=Sum("positive_savings"),
+        )
+        return {key: value or 0 for key, value in agg.items()}
+
     projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
 
     project_sums = funding_qs.values("project_id").annotate(total_savings=Sum("total_savings"))
@@ -339,7 +504,10 @@ def get_funds_to_be_found(filters):
 # Realizzazione e pagamento - NON filtrata
 # ------------------------------
 def get_payments_realization_gap(filters):
-    aggregation = Funding.objects.aggregate(
+    # Non filtrata: dal cubo basta la riga "tutte le regioni / tutte le macroaree"
+    aggregates_qs = get_analysis_aggregates({})
+    source_qs = aggregates_qs if aggregates_qs is not None else Funding.objects
+    aggregation = source_qs.aggregate(
         total_realized_cost=Sum('total_funds_gross'),
         total_payments_made=Sum('total_funds_net'),
     )
@@ -359,6 +527,21 @@ def get_payments_realization_gap(filters):
 # Top 10 tipologie di progetto per finanziamento (aggiornata con filtro funding_source)
 # ------------------------------
 def get_top_project_typologies(filters):
+    aggregates_qs = get_analysis_aggregates(filters)
+    if aggregates_qs is not None:
+        typologies = (
+            aggregates_qs
+            .filter(cup_typology__isnull=False)
+            .values("cup_typology")
+            .annotate(total=Sum("total_funds_gross"))
+            .filter(total__isnull=False)
+            .order_by(*ranking_order("total", "cup_typology"))[:10]
+        )
+        return [
+            {"type": t["cup_typology"] or "sconosciuto", "amount": float(t["total"] or 0)}
+            for t in typologies
+        ]
+
     projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
 
     # Se non ci sono progetti o finanziamenti filtrati, ritorna vuoto
@@ -370,7 +553,7 @@ def get_top_project_typologies(filters):
         .filter(project__cup_typology__isnull=False)
         .values("project__cup_typology")
         .annotate(total=Sum("total_funds_gross"))
-        .order_by("-total")[:10]
+        .order_by(*ranking_order("total", "project__cup_typology"))[:10]
     )
 
     return [
@@ -379,4 +562,743 @@ def get_top_project_typologies(filters):
             "amount": float(t["total"] or 0)
         }
         for t in typologies
-    ]
\ No newline at end of file
+    ]
+
+
+# ------------------------------
+# Esecuzione concorrente delle sezioni
+# ------------------------------
+_section_executor = None
+_section_executor_lock = threading.Lock()
+_section_state = threading.local()
+
+
+def section_executor():
+    """Pool di thread condiviso dalle richieste del processo (ANALYTICS_SECTION_THREADS thread)."""
+    global _section_executor
+    if _section_executor is None:
+        with _section_executor_lock:
+            if _section_executor is None:
+                _section_executor = ThreadPoolExecutor(
+                    max_workers=settings.ANALYTICS_SECTION_THREADS, thread_name_prefix="analytics-section"
+                )
+    return _section_executor
+
+
+def run_section(function, *args):
+    """
+    Esegue una sezione in un thread del pool, con la connessione al database del thread.
+    Alla fine la chiude (o la restituisce al pool di connessioni): i thread del pool sopravvivono
+    alla richiesta e non devono tenere aperta una connessione ciascuno.
+    """
+    close_old_connections()
+    _section_state.active = True
+    try:
+        return function(*args)
+    finally:
+        _section_state.active = False
+        connections.close_all()
+
+
+def run_sections(sections, *args):
+    """
+    {chiave: funzione(*args)} per sezioni indipendenti. Con ANALYTICS_SECTION_CONCURRENCY > 1 girano
+    sul pool condiviso, al massimo tante alla volta per richiesta (ognuna tiene una connessione);
+    altrimenti, o se già dentro una sezione, in sequenza.
+    """
+    limit = settings.ANALYTICS_SECTION_CONCURRENCY
+    if limit <= 1 or len(sections) <= 1 or getattr(_section_state, "active", False):
+        return {key: function(*args) for key, function in sections.items()}
+
+    slots = threading.BoundedSemaphore(limit)
+    futures = {}
+    for key, function in sections.items():
+        slots.acquire()
+        futures[key] = section_executor().submit(run_section, function, *args)
+        futures[key].add_done_callback(lambda future: slots.release())
+
+    return {key: future.result() for key, future in futures.items()}
+
+
+# ------------------------------
+# Overview: calcolo in un solo round trip
+# ------------------------------
+def overview_legacy(filters):
+    """Metriche di Overview calcolate funzione per funzione (sezioni indipendenti, vedi run_sections)."""
+    sections = run_sections({
+        "status": count_projects_with_status,
+        "macroarea_financing": funding_by_macroarea,
+        "total_financing": sum_funding_gross,
+        "top_projects": top_10_projects,
+        "big_projects": count_big_projects,
+        "top_sectors": get_top_sectors,
+    }, filters)
+    num_projects_with_status = sections["status"]
+    macroarea_financing = sections["macroarea_financing"]
+
+    return {
+        "number_of_projects": num_projects_with_status.get('total', 0),
+        "total_financing": sections["total_financing"],
+        "number_ended_projects": num_projects_with_status.get('concluded', 0),
+        "number_not_started_projects": num_projects_with_status.get('not_started', 0),
+        "number_projects_in_progress": num_projects_with_status.get('in_progress', 0),
+        "number_projects_liquidated": num_projects_with_status.get('liquidated', 0),
+        "middle_north_financing": macroarea_financing.get('Centro-Nord', 0.0),
+        "midday_financing": macroarea_financing.get('Mezzogiorno', 0.0),
+        "national_financing": macroarea_financing.get('Ambito Nazionale', 0.0),
+        "abroad_financing": macroarea_financing.get('Estero', 0.0),
+        "top_projects": sections["top_projects"],
+        "number_big_projects": sections["big_projects"],
+        "top_sectors": sections["top_sectors"],
+    }
+
+
+def overview_aggregates_sql(region, macroarea, is_trasversale, top_projects_sql, json_columns):
+    """
+    Query di overview_fused sul cubo: conteggi, somme e settori dalle righe dei filtri, finanziamenti
+    per macroarea dalle righe "tutte le regioni" (ogni progetto una volta per ciascuna sua macroarea,
+    come funding_by_macroarea); solo il top-N legge Project.
+    """
+    aggregate_table = FundingAggregate._meta.db_table
+    conditions = [
+        "region_code IS NULL" if region is None else "region_code = %(region)s",
+        "macroarea IS NULL" if macroarea is None else "macroarea = %(macroarea)s",
+    ]
+    if is_trasversale is not None:
+        conditions.append("is_trasversale = %(is_trasversale)s")
+
+    return f"""
+        WITH filtered AS (
+            SELECT oc_project_status, cup_descr_sector, project_count, big_project_count, total_funds_gross
+            FROM {aggregate_table}
+            WHERE {" AND ".join(conditions)}
+        ), top_projects AS ({top_projects_sql}), top_sectors AS (
+            SELECT cup_descr_sector AS name, sum(total_funds_gross) AS total_financing
+            FROM filtered
+            GROUP BY cup_descr_sector HAVING sum(total_funds_gross) IS NOT NULL
+            ORDER BY 2 DESC, cup_descr_sector COLLATE "C" LIMIT 3
+        ), macroarea_financing AS (
+            SELECT macroarea, sum(total_funds_gross) AS total
+            FROM {aggregate_table}
+            WHERE region_code IS NULL AND macroarea IS NOT NULL
+            GROUP BY macroarea
+        )
+        SELECT
+            coalesce(sum(project_count), 0),
+            coalesce(sum(project_count) FILTER (WHERE oc_project_status = %(not_started)s), 0),
+            coalesce(sum(project_count) FILTER (WHERE oc_project_status = %(in_progress)s), 0),
+            coalesce(sum(project_count) FILTER (WHERE oc_project_status = %(concluded)s), 0),
+            coalesce(sum(project_count) FILTER (WHERE oc_project_status = %(liquidated)s), 0),
+            sum(total_funds_gross),
+            coalesce(sum(big_project_count), 0),
+            {json_columns}
+        FROM filtered
+    """
+
+
+def overview_fused(filters):
+    """
+    Stesse metriche di overview_legacy con una sola query: una CTE con i progetti filtrati,
+    conteggi con aggregazione condizionale, top-N e finanziamenti per macroarea in JSON.
+    Con il cubo abilitato (aggregates_enabled) i conteggi e le somme vengono dalle sue righe.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+
+    region, macroarea, is_trasversale = normalize_overview_filters(filters)
+    conditions, params = [], {
+        "top_n": normalize_top_n(filters),
+        "threshold": BIG_PROJECT_THRESHOLD,
+        "not_started": Project.ProjectStatusChoices.NOT_STARTED.value,
+        "in_progress": Project.ProjectStatusChoices.ONGOING.value,
+        "concluded": Project.ProjectStatusChoices.CONCLUDED.value,
+        "liquidated": Project.ProjectStatusChoices.LIQUIDATED.value,
+    }
+    if region is not None:
+        conditions.append("p.region_codes @> ARRAY[%(region)s]::varchar[]")
+        params["region"] = region
+    if macroarea is not None:
+        conditions.append("p.macroareas @> ARRAY[%(macroarea)s]::varchar[]")
+        params["macroarea"] = macroarea
+    if is_trasversale is not None:
+        conditions.append("p.is_trasversale = %(is_trasversale)s")
+        params["is_trasversale"] = is_trasversale
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # top-N direttamente su Project: project_ranking_idx, fermandosi dopo top_n righe
+    top_projects_sql = f"""
+        SELECT p.local_project_code, p.oc_project_title, p.total_financing, p.region_label, p.macroarea_label
+        FROM {project_table} p
+        {where}
+        ORDER BY p.total_financing DESC, p.local_project_code
+        LIMIT %(top_n)s
+    """
+    json_columns = """
+        (SELECT json_agg(json_build_object(
+                    'id', tp.local_project_code,
+                    'title', tp.oc_project_title,
+                    'total_financing', tp.total_financing,
+                    'region', tp.region_label,
+                    'macroarea', tp.macroarea_label
+                ) ORDER BY tp.total_financing DESC, tp.local_project_code)
+         FROM top_projects tp),
+        (SELECT json_agg(ts ORDER BY ts.total_financing DESC, ts.name COLLATE "C") FROM top_sectors ts),
+        (SELECT json_agg(mf) FROM macroarea_financing mf)
+    """
+
+    if aggregates_enabled():
+        sql = overview_aggregates_sql(region, macroarea, is_trasversale, top_projects_sql, json_columns)
+    else:
+        sql = f"""
+            WITH filtered AS (
+                SELECT p.local_project_code, p.oc_project_status, p.cup_descr_sector,
+                       f.id AS funding_id, f.total_funds_gross
+                FROM {project_table} p
+                LEFT JOIN {funding_table} f ON f.project_id = p.local_project_code
+                {where}
+            ), top_projects AS ({top_projects_sql}), top_sectors AS (
+                SELECT cup_descr_sector AS name, sum(total_funds_gross) AS total_financing
+                FROM filtered WHERE funding_id IS NOT NULL
+                GROUP BY cup_descr_sector ORDER BY 2 DESC, cup_descr_sector COLLATE "C" LIMIT 3
+            ), macroarea_financing AS (
+                SELECT m.macroarea, sum(f.total_funds_gross) AS total
+                FROM {funding_table} f
+                JOIN {project_table} p ON p.local_project_code = f.project_id
+                CROSS JOIN LATERAL unnest(p.macroareas) AS m(macroarea)
+                GROUP BY m.macroarea
+            )
+            SELECT
+                count(*),
+                count(*) FILTER (WHERE oc_project_status = %(not_started)s),
+                count(*) FILTER (WHERE oc_project_status = %(in_progress)s),
+                count(*) FILTER (WHERE oc_project_status = %(concluded)s),
+                count(*) FILTER (WHERE oc_project_status = %(liquidated)s),
+                sum(total_funds_gross),
+                count(*) FILTER (WHERE total_funds_gross >= %(threshold)s),
+                {json_columns}
+            FROM filtered
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        (total, not_started, in_progress, concluded, liquidated, total_financing, big_projects,
+         top_projects, top_sectors, macroarea_rows) = cursor.fetchone()
+
+    macroarea_financing = {row["macroarea"]: row["total"] or 0 for row in macroarea_rows or []}
+
+    return {
+        "number_of_projects": total,
+        "total_financing": total_financing or 0,
+        "number_ended_projects": concluded,
+        "number_not_started_projects": not_started,
+        "number_projects_in_progress": in_progress,
+        "number_projects_liquidated": liquidated,
+        "middle_north_financing": macroarea_financing.get('Centro-Nord', 0.0),
+        "midday_financing": macroarea_financing.get('Mezzogiorno', 0.0),
+        "national_financing": macroarea_financing.get('Ambito Nazionale', 0.0),
+        "abroad_financing": macroarea_financing.get('Estero', 0.0),
+        "top_projects": {
+            f"project{index}": {
+                **project,
+                "total_financing": project["total_financing"] or 0,
+                "region": project["region"] or "",
+                "macroarea": project["macroarea"] or "",
+            }
+            for index, project in enumerate(top_projects or [], start=1)
+        },
+        "number_big_projects": big_projects,
+        "top_sectors": {
+            f"sector{i}": {"name": sector["name"], "total_financing": sector["total_financing"] or 0}
+            for i, sector in enumerate(top_sectors or [], start=1)
+        },
+    }
+
+
+def results_match(expected, actual):
+    """Uguaglianza dei risultati, con tolleranza sulle somme float (l'ordine di somma cambia tra i calcoli)."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(results_match(expected[k], actual[k]) for k in expected)
+    if isinstance(expected, list) and isinstance(actual, list):
+        return len(expected) == len(actual) and all(map(results_match, expected, actual))
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return math.isclose(expected, actual, rel_tol=1e-9)
+    return expected == actual
+
+
+def compare_results(name, expected, actual):
+    """Registra le differenze tra il calcolo legacy e quello nuovo (ANALYTICS_QUERY_PLANNER = "compare")."""
+    if not results_match(expected, actual):
+        logger.warning("%s: risultato diverso dal calcolo legacy\nlegacy: %r\nnuovo: %r", name, expected, actual)
+
+
+def overview_filters_key(filters):
+    """Filtri normalizzati che determinano le metriche di Overview (chiave della cache delle risposte)."""
+    region, macroarea, is_trasversale = normalize_overview_filters(filters)
+    return region, macroarea, is_trasversale, None, normalize_top_n(filters)
+
+
+def build_overview_data(filters):
+    """Metriche di Overview (dalla cache delle risposte se presenti per la versione corrente del dataset)."""
+    return cached_response("overview", overview_filters_key(filters), compute_overview_data, filters)
+
+
+def overview_fast(filters):
+    """Overview dal motore in memoria (ANALYTICS_ENGINE = "numpy") o con la query fusa."""
+    if settings.ANALYTICS_ENGINE == "numpy":
+        return get_engine().overview(filters)
+    return overview_fused(filters)
+
+
+def compute_overview_data(filters):
+    """Metriche di Overview secondo settings.ANALYTICS_QUERY_PLANNER: "legacy", "fused" o "compare"."""
+    planner = settings.ANALYTICS_QUERY_PLANNER
+    if planner == "legacy":
+        return overview_legacy(filters)
+
+    if planner == "compare":
+        results = run_sections({"legacy": overview_legacy, "fast": overview_fast}, filters)
+        compare_results("overview", results["legacy"], results["fast"])
+        return results["legacy"]
+    return overview_fast(filters)
+
+
+# ------------------------------
+# Analysis: una sola scansione dei finanziamenti filtrati
+# ------------------------------
+def analysis_legacy(filters):
+    """Sezioni di Analysis calcolate funzione per funzione (sezioni indipendenti, vedi run_sections)."""
+    return run_sections({
+        "funding_sources_analysis": funding_sources_analysis,
+        "specific_funds_contribution": specific_funds_contribution,
+        "top10_thematic_objectives": top10_thematic_objectives,
+        "top10_project_typologies": get_top_project_typologies,
+        "funds_to_be_found": get_funds_to_be_found,
+        "payments_realization_gap": get_payments_realization_gap,
+    }, filters)
+
+
+def analysis_fused(filters):
+    """
+    Stesse sezioni di analysis_legacy con una sola query: i finanziamenti filtrati
+    (stesso queryset di get_filtered_projects_by_filters) vengono letti una volta e
+    sommati per colonna, raggruppati per tema / tipologia e per il gap; i totali
+    non filtrati di realizzazione e pagamento arrivano nella stessa riga.
+    Quando il cubo può rispondere (get_analysis_aggregates, senza filtro per fonte) si leggono le sue righe.
+    """
+    funding_table = Funding._meta.db_table
+    funding_source = filters.get("funding_source")
+    sum_fields = sorted(set(sum(SOURCE_FIELDS.values(), [])) | set(SPECIFIC_FUNDS_FIELDS))
+
+    aggregates_qs = get_analysis_aggregates(filters)
+    if aggregates_qs is not None:
+        # Dal cubo: le righe della macroarea (già sommate) e la riga "tutte le regioni / tutte le macroaree"
+        aggregate_table = FundingAggregate._meta.db_table
+        filtered_sql, params = aggregates_qs.values(
+            "total_funds_gross", "projects_with_savings", "positive_savings", "oc_synthetic_theme", "cup_typology",
+            *sum_fields,
+        ).query.sql_with_params()
+        sql = f"""
+            WITH filtered AS ({filtered_sql})
+            SELECT
+                {", ".join(f"sum({f})" for f in sum_fields)},
+                coalesce(sum(projects_with_savings), 0),
+                sum(positive_savings),
+                (SELECT json_agg(t ORDER BY t.amount DESC, t.description COLLATE "C")
+                 FROM (SELECT oc_synthetic_theme AS description, sum(total_funds_gross) AS amount
+                       FROM filtered GROUP BY oc_synthetic_theme HAVING sum(total_funds_gross) IS NOT NULL
+                       ORDER BY 2 DESC, oc_synthetic_theme COLLATE "C" LIMIT 10) t),
+                (SELECT json_agg(t ORDER BY t.amount DESC, t.type COLLATE "C")
+                 FROM (SELECT cup_typology AS type, sum(total_funds_gross) AS amount
+                       FROM filtered WHERE cup_typology IS NOT NULL
+                       GROUP BY cup_typology HAVING sum(total_funds_gross) IS NOT NULL
+                       ORDER BY 2 DESC, cup_typology COLLATE "C" LIMIT 10) t),
+                (SELECT json_build_array(sum(total_funds_gross), sum(total_funds_net))
+                 FROM {aggregate_table} WHERE region_code IS NULL AND macroarea IS NULL)
+            FROM filtered
+        """
+    else:
+        projects_qs, funding_qs = get_filtered_projects_by_filters(filters)
+        filtered_sql, params = funding_qs.values(
+            "id", "total_funds_gross", "total_savings", *sum_fields,
+            oc_synthetic_theme=F("project__oc_synthetic_theme"),
+            cup_typology=F("project__cup_typology"),
+        ).query.sql_with_params()
+        sql = f"""
+            WITH filtered AS ({filtered_sql})
+            SELECT
+                {", ".join(f"sum({f})" for f in sum_fields)},
+                count(*) FILTER (WHERE total_savings > 0),
+                sum(total_savings) FILTER (WHERE total_savings > 0),
+                (SELECT json_agg(t ORDER BY t.amount DESC, t.description COLLATE "C")
+                 FROM (SELECT oc_synthetic_theme AS description, sum(total_funds_gross) AS amount
+                       FROM filtered GROUP BY oc_synthetic_theme ORDER BY 2 DESC, oc_synthetic_theme COLLATE "C" LIMIT 10) t),
+                (SELECT json_agg(t ORDER BY t.amount DESC, t.type COLLATE "C")
+                 FROM (SELECT cup_typology AS type, sum(total_funds_gross) AS amount
+                       FROM filtered WHERE cup_typology IS NOT NULL
+                       GROUP BY cup_typology ORDER BY 2 DESC, cup_typology COLLATE "C" LIMIT 10) t),
+                (SELECT json_build_array(sum(total_funds_gross), sum(total_funds_net)) FROM {funding_table})
+            FROM filtered
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    agg = dict(zip(sum_fields, row))
+    projects_with_gap, missing_amount, themes, typologies, (realized_cost, payments_made) = row[len(sum_fields):]
+    total_realized_cost = realized_cost or 0
+    total_payments_made = payments_made or 0
+
+    return {
+        "funding_sources_analysis": funding_sources_result(agg, funding_source),
+        "specific_funds_contribution": specific_funds_result(agg, funding_source),
+        "top10_thematic_objectives": [
+            {"description": t["description"] or "Non specificato", "amount": float(t["amount"] or 0)}
+            for t in themes or []
+        ],
+        "top10_project_typologies": [
+            {"type": t["type"] or "sconosciuto", "amount": float(t["amount"] or 0)}
+            for t in typologies or []
+        ],
+        "funds_to_be_found": {
+            "number_of_projects_with_gap": projects_with_gap,
+            "total_missing_amount": missing_amount or 0,
+        },
+        "payments_realization_gap": {
+            "total_realized_cost": total_realized_cost,
+            "total_payments_made": total_payments_made,
+            "overall_difference": total_realized_cost - total_payments_made,
+        },
+    }
+
+
+def analysis_filters_key(filters):
+    """Filtri normalizzati che determinano le sezioni di Analysis (chiave della cache delle risposte)."""
+    macroarea, funding_source = normalize_analysis_filters(filters)
+    return None, macroarea, None, funding_source
+
+
+def build_analysis_data(filters):
+    """Sezioni di Analysis (dalla cache delle risposte se presenti per la versione corrente del dataset)."""
+    return cached_response("analysis", analysis_filters_key(filters), compute_analysis_data, filters)
+
+
+def analysis_fast(filters):
+    """Analysis dal motore in memoria (ANALYTICS_ENGINE = "numpy") o con la query fusa."""
+    if settings.ANALYTICS_ENGINE == "numpy":
+        return get_engine().analysis(filters)
+    return analysis_fused(filters)
+
+
+def compute_analysis_data(filters):
+    """Sezioni di Analysis secondo settings.ANALYTICS_QUERY_PLANNER: "legacy", "fused" o "compare"."""
+    planner = settings.ANALYTICS_QUERY_PLANNER
+    if planner == "legacy":
+        return analysis_legacy(filters)
+
+    if planner == "compare":
+        results = run_sections({"legacy": analysis_legacy, "fast": analysis_fast}, filters)
+        compare_results("analysis", results["legacy"], results["fast"])
+        return results["legacy"]
+    return analysis_fast(filters)
+
+
+# ------------------------------
+# Elenco dei progetti con paginazione keyset
+# ------------------------------
+# Campi dell'elenco (parametro fields) -> colonne di Project
+PROJECT_LIST_FIELDS = {
+    "id": "local_project_code",
+    "title": "oc_project_title",
+    "total_financing": "total_financing",
+    "region": "region_label",
+    "macroarea": "macroarea_label",
+    "region_codes": "region_codes",
+    "is_trasversale": "is_trasversale",
+    "status": "oc_project_status",
+    "procedural_state": "oc_procedural_state",
+    "sector": "cup_descr_sector",
+    "theme": "oc_synthetic_theme",
+    "typology": "cup_typology",
+}
+PROJECT_LIST_DEFAULT_FIELDS = ("id", "title", "total_financing", "region", "macroarea")
+
+# Colonne del cursore, nell'ordine di Project.RANKING_ORDER
+KEYSET_COLUMNS = ("total_financing", "local_project_code")
+
+# Filtri per uguaglianza (parametro -> colonna di Project)
+PROJECT_LIST_FILTERS = {
+    "status": "oc_project_status",
+    "procedural_state": "oc_procedural_state",
+    "sector": "cup_descr_sector",
+    "theme": "oc_synthetic_theme",
+    "typology": "cup_typology",
+}
+
+
+def encode_cursor(total_financing, code):
+    """Cursore opaco per la pagina successiva all'ultimo progetto (total_financing, codice) restituito."""
+    return base64.urlsafe_b64encode(json.dumps([total_financing, code]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(total_financing, codice) dal cursore; ValueError se non è valido."""
+    try:
+        total_financing, code = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("cursore non valido")
+    if not isinstance(code, str) or not (total_financing is None or isinstance(total_financing, (int, float))):
+        raise ValueError("cursore non valido")
+    return total_financing, code
+
+
+def get_listed_projects(filters):
+    """
+    Progetti filtrati per l'elenco: region / macroarea / is_trasversale normalizzati come in
+    get_filtered_projects (normalize_overview_filters), le colonne di PROJECT_LIST_FILTERS per uguaglianza,
+    funding_source sul bit del Funding (indice parziale della fonte) e l'intervallo
+    min_financing / max_financing su total_financing.
+    """
+    region, macroarea, is_trasversale = normalize_overview_filters(filters)
+    projects_qs = Project.objects.all()
+
+    if region is not None:
+        projects_qs = projects_qs.filter(region_codes__contains=[region])
+    if macroarea is not None:
+        projects_qs = projects_qs.filter(macroareas__contains=[macroarea])
+    if is_trasversale is not None:
+        projects_qs = projects_qs.filter(is_trasversale=is_trasversale)
+
+    for name, column in PROJECT_LIST_FILTERS.items():
+        if filters.get(name):
+            projects_qs = projects_qs.filter(**{column: filters[name]})
+
+    if filters.get("funding_source"):
+        projects_qs = projects_qs.filter(Exists(
+            Funding.objects.filter(project=OuterRef("pk")).filter(FUNDING_SOURCE_FILTERS[filters["funding_source"]])
+        ))
+
+    if filters.get("min_financing") is not None:
+        projects_qs = projects_qs.filter(total_financing__gte=filters["min_financing"])
+    if filters.get("max_financing") is not None:
+        projects_qs = projects_qs.filter(total_financing__lte=filters["max_financing"])
+
+    return projects_qs
+
+
+def get_projects_page(filters, fields, page_size, cursor=None):
+    """
+    Pagina dell'elenco in Project.RANKING_ORDER (total_financing decrescente con i NULL per primi,
+    poi codice) dopo il cursore: (righe con le colonne di fields, cursore della pagina successiva o None).
+
+    Keyset invece di OFFSET: la pagina riprende dalla posizione del cursore con al massimo due scansioni
+    di intervallo su project_ranking_idx, i pari merito dell'ultimo valore e poi i valori minori
+    (i NULL prima, dove il confronto di riga non vale), quindi il costo non cresce con la profondità.
+    """
+    projects_qs = get_listed_projects(filters).order_by(*Project.RANKING_ORDER)
+    columns = list(dict.fromkeys([*(PROJECT_LIST_FIELDS[field] for field in fields), *KEYSET_COLUMNS]))
+
+    if cursor is None:
+        segments = [Q()]
+    else:
+        total_financing, code = cursor
+        if total_financing is None:
+            segments = [Q(total_financing__isnull=True, local_project_code__gt=code),
+                        Q(total_financing__isnull=False)]
+        else:
+            segments = [Q(total_financing=total_financing, local_project_code__gt=code),
+                        Q(total_financing__lt=total_financing)]
+
+    # Una riga in più per sapere se esiste la pagina successiva
+    rows = []
+    for segment in segments:
+        rows += projects_qs.filter(segment).values(*columns)[:page_size + 1 - len(rows)]
+        if len(rows) > page_size:
+            break
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]["total_financing"], rows[-1]["local_project_code"])
+
+    return [{field: row[PROJECT_LIST_FIELDS[field]] for field in fields} for row in rows], next_cursor
+
+
+# ------------------------------
+# Metriche raggruppate per dimensione (tutti i valori in una richiesta)
+# ------------------------------
+# Dimensione -> valori di ogni progetto (array SQL): un progetto rientra nel gruppo di ciascun valore,
+# come con i filtri region / macroarea di get_filtered_projects e get_filtered_projects_by_filters
+GROUP_DIMENSIONS = {
+    "region": "p.region_codes",
+    "macroarea": "p.macroareas",
+    "sector": "ARRAY[p.cup_descr_sector]",
+    "theme": "ARRAY[p.oc_synthetic_theme]",
+    "typology": "ARRAY[p.cup_typology]",
+}
+
+# GROUPING(cup_descr_sector, oc_synthetic_theme, cup_typology) di ogni insieme di raggruppamento
+GROUPING_TOTAL, GROUPING_SECTOR, GROUPING_THEME, GROUPING_TYPOLOGY = 0b111, 0b011, 0b101, 0b110
+
+
+def grouped_filters_key(dimension, filters):
+    """Dimensione e filtri normalizzati che determinano le metriche raggruppate (chiave della cache delle risposte)."""
+    return dimension, None, None, None, normalize_top_n(filters)
+
+
+def build_grouped_data(dimension, filters):
+    """Metriche raggruppate (dalla cache delle risposte se presenti per la versione corrente del dataset)."""
+    return cached_response("grouped", grouped_filters_key(dimension, filters), compute_grouped_data, dimension, filters)
+
+
+def compute_grouped_data(dimension, filters):
+    """
+    Metriche di Overview e di Analysis (senza filtro per fonte) per ogni valore di dimension,
+    calcolate insieme: un GROUP BY GROUPING SETS sui progetti con il loro finanziamento (totali,
+    settori, temi e tipologie di ogni gruppo), una query per i top-N di ogni gruppo e le due
+    sezioni non filtrate. Ogni gruppo ha lo stesso contenuto di overview / analysis filtrate per quel valore.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    values = GROUP_DIMENSIONS[dimension]
+    sum_fields = sorted(set(sum(SOURCE_FIELDS.values(), [])) | set(SPECIFIC_FUNDS_FIELDS))
+    params = {
+        "top_n": normalize_top_n(filters),
+        "threshold": BIG_PROJECT_THRESHOLD,
+        "not_started": Project.ProjectStatusChoices.NOT_STARTED.value,
+        "in_progress": Project.ProjectStatusChoices.ONGOING.value,
+        "concluded": Project.ProjectStatusChoices.CONCLUDED.value,
+        "liquidated": Project.ProjectStatusChoices.LIQUIDATED.value,
+    }
+
+    grouping_sql = f"""
+        WITH grouped AS (
+            SELECT g.value, p.oc_project_status, p.cup_descr_sector, p.oc_synthetic_theme, p.cup_typology,
+                   f.id AS funding_id, f.total_funds_gross, f.total_savings,
+                   {", ".join(f"f.{field}" for field in sum_fields)}
+            FROM {project_table} p
+            LEFT JOIN {funding_table} f ON f.project_id = p.local_project_code
+            CROSS JOIN LATERAL unnest({values}) AS g(value)
+        )
+        SELECT value, cup_descr_sector, oc_synthetic_theme, cup_typology,
+               GROUPING(cup_descr_sector, oc_synthetic_theme, cup_typology),
+               count(*),
+               count(*) FILTER (WHERE oc_project_status = %(not_started)s),
+               count(*) FILTER (WHERE oc_project_status = %(in_progress)s),
+               count(*) FILTER (WHERE oc_project_status = %(concluded)s),
+               count(*) FILTER (WHERE oc_project_status = %(liquidated)s),
+               count(*) FILTER (WHERE total_funds_gross >= %(threshold)s),
+               count(funding_id),
+               sum(total_funds_gross),
+               count(*) FILTER (WHERE total_savings > 0),
+               sum(total_savings) FILTER (WHERE total_savings > 0),
+               {", ".join(f"sum({field})" for field in sum_fields)}
+        FROM grouped
+        GROUP BY GROUPING SETS (
+            (value), (value, cup_descr_sector), (value, oc_synthetic_theme), (value, cup_typology)
+        )
+    """
+    top_projects_sql = f"""
+        SELECT value, local_project_code, oc_project_title, total_financing, region_label, macroarea_label
+        FROM (
+            SELECT g.value, p.local_project_code, p.oc_project_title, p.total_financing,
+                   p.region_label, p.macroarea_label,
+                   row_number() OVER (
+                       PARTITION BY g.value ORDER BY p.total_financing DESC, p.local_project_code
+                   ) AS position
+            FROM {project_table} p
+            CROSS JOIN LATERAL unnest({values}) AS g(value)
+        ) ranked
+        WHERE position <= %(top_n)s
+        ORDER BY value, position
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(grouping_sql, params)
+        grouping_rows = cursor.fetchall()
+        cursor.execute(top_projects_sql, params)
+        top_project_rows = cursor.fetchall()
+
+    # Sezioni non filtrate, uguali per tutti i gruppi
+    macroarea_financing = funding_by_macroarea({})
+    payments_realization_gap = get_payments_realization_gap({})
+
+    totals, sectors, themes, typologies = {}, {}, {}, {}
+    for value, sector, theme, typology, grouping, *metrics in grouping_rows:
+        funded, gross = metrics[6], metrics[7]
+        if grouping == GROUPING_TOTAL:
+            totals[value] = metrics
+        elif not funded:
+            continue  # solo progetti senza finanziamento: esclusi come in get_top_sectors / top10_*
+        elif grouping == GROUPING_SECTOR:
+            sectors.setdefault(value, []).append((sector, gross))
+        elif grouping == GROUPING_THEME:
+            themes.setdefault(value, []).append((theme, gross))
+        elif grouping == GROUPING_TYPOLOGY and typology is not None:
+            typologies.setdefault(value, []).append((typology, gross))
+
+    top_projects = {}
+    for value, code, title, total_financing, region_label, macroarea_label in top_project_rows:
+        projects = top_projects.setdefault(value, {})
+        projects[f"project{len(projects) + 1}"] = {
+            "id": code,
+            "title": title,
+            "total_financing": total_financing or 0,
+            "region": region_label,
+            "macroarea": macroarea_label,
+        }
+
+    def ranked(groups, n):
+        return sorted(groups, key=group_ranking_key)[:n]
+
+    groups = []
+    for value in sorted(totals, key=lambda value: (value is None, value)):
+        (total, not_started, in_progress, concluded, liquidated, big_projects, _, gross,
+         projects_with_gap, missing_amount, *sums) = totals[value]
+        agg = dict(zip(sum_fields, sums))
+        groups.append({
+            "value": value,
+            "overview": {
+                "number_of_projects": total,
+                "total_financing": gross or 0,
+                "number_ended_projects": concluded,
+                "number_not_started_projects": not_started,
+                "number_projects_in_progress": in_progress,
+                "number_projects_liquidated": liquidated,
+                "middle_north_financing": macroarea_financing.get('Centro-Nord', 0.0),
+                "midday_financing": macroarea_financing.get('Mezzogiorno', 0.0),
+                "national_financing": macroarea_financing.get('Ambito Nazionale', 0.0),
+                "abroad_financing": macroarea_financing.get('Estero', 0.0),
+                "top_projects": top_projects.get(value, {}),
+                "number_big_projects": big_projects,
+                "top_sectors": {
+                    f"sector{i}": {"name": name, "total_financing": amount or 0}
+                    for i, (name, amount) in enumerate(ranked(sectors.get(value, []), 3), start=1)
+                },
+            },
+            "analysis": {
+                "funding_sources_analysis": funding_sources_result(agg, None),
+                "specific_funds_contribution": specific_funds_result(agg, None),
+                "top10_thematic_objectives": [
+                    {"description": theme or "Non specificato", "amount": float(amount or 0)}
+                    for theme, amount in ranked(themes.get(value, []), 10)
+                ],
+                "top10_project_typologies": [
+                    {"type": typology, "amount": float(amount or 0)}
+                    for typology, amount in ranked(typologies.get(value, []), 10)
+                ],
+                "funds_to_be_found": {
+                    "number_of_projects_with_gap": projects_with_gap,
+                    "total_missing_amount": missing_amount or 0,
+                },
+                "payments_realization_gap": payments_realization_gap,
+            },
+        })
+
+    return {"dimension": dimension, "groups": groups}
+
+
+def get_engine():
+    """Motore colonnare NumPy per la versione corrente del dataset (NumPy è una dipendenza opzionale)."""
+    from analytics_projects.engine import get_engine
+    return get_engine()
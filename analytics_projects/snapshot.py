@@ -0,0 +1,122 @@
+"""
+Snapshot binario delle colonne del motore NumPy (engine.py), condiviso tra i worker.
+
+L'import scrive il file una volta per versione del dataset; ogni worker lo apre con mmap
+in sola lettura, così le pagine sono condivise tra i processi e l'avvio non richiede
+nessuna query. Il file nuovo viene scritto accanto a quello vecchio e pubblicato con
+os.replace: chi ha già mappato il precedente continua a leggerlo finché non lo rilascia.
+
+Formato: MAGIC, lunghezza dell'header (uint64 little-endian), header JSON, array allineati
+a ALIGNMENT byte. L'header contiene versione, dtype / shape / offset di ogni array e le
+liste piccole (categorie, regioni). Le stringhe per progetto (codici e titoli) sono un
+blocco UTF-8 più un array di offset, decodificate solo per gli elementi letti.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b"HZSNAP01"
+ALIGNMENT = 64
+STRING_COLUMNS = ("codes", "titles")
+
+
+class StringColumn:
+    """Lista di stringhe in sola lettura sopra un blocco UTF-8 e i suoi offset."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode()
+
+
+def encode_strings(values):
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+# ------------------------------
+# Scrittura
+# ------------------------------
+def write_snapshot(path, version, arrays, lists):
+    """Scrive lo snapshot in un file temporaneo e lo pubblica atomicamente in path."""
+    arrays = dict(arrays)
+    small_lists = {}
+    for name, values in lists.items():
+        if name in STRING_COLUMNS:
+            arrays[f"{name}.offsets"], arrays[f"{name}.data"] = encode_strings(values)
+        else:
+            small_lists[name] = list(values)
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({"version": version, "arrays": layout, "lists": small_lists}).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for name, array in arrays.items():
+                file.seek(data_start + layout[name]["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(data_start + offset)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# ------------------------------
+# Lettura
+# ------------------------------
+def read_snapshot(path):
+    """(versione, array, liste) dallo snapshot mappato in memoria, o None se il file non esiste."""
+    try:
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} non è uno snapshot del dataset")
+    (header_length,) = struct.unpack_from("<Q", mapped, len(MAGIC))
+    header_start = len(MAGIC) + 8
+    header = json.loads(mapped[header_start:header_start + header_length])
+    data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        if not count:
+            arrays[name] = np.empty(spec["shape"], dtype=dtype)
+            continue
+        arrays[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + spec["offset"]
+        ).reshape(spec["shape"])
+
+    lists = header["lists"]
+    for name in STRING_COLUMNS:
+        lists[name] = StringColumn(arrays.pop(f"{name}.offsets"), arrays.pop(f"{name}.data"))
+
+    return header["version"], arrays, lists
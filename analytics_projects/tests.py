@@ -1,3 +1,1014 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import warnings
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, connections
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from . import cache, services
+from .aggregates import DIMENSIONS, refresh_funding_aggregates, refresh_project_locations, refresh_project_rankings
+from .models import (
+    Project, Funding, Location, FundingAggregate, DatasetVersion, ImportCheckpoint, BIG_PROJECT_THRESHOLD,
+)
+from .renderers import FastJSONRenderer
+from .serializers import GroupedSerializer, serialize
+
+# The importer runs as a script from data_import/ and imports its siblings as top-level modules
+sys.path.insert(0, str(settings.BASE_DIR / "data_import"))
+import import_script  # noqa: E402
+from column_codec import ColumnCodec  # noqa: E402
+
+# Only the warnings of the importer in the test output
+import_script.logger.setLevel(logging.WARNING)
+
+REGIONS = [
+    ("001", "PIEMONTE", "Centro-Nord"),
+    ("012", "LAZIO", "Centro-Nord"),
+    ("015", "CAMPANIA", "Mezzogiorno"),
+    ("019", "SICILIA", "Mezzogiorno"),
+    ("000", "AMBITO NAZIONALE", "Ambito Nazionale"),
+    ("997", "PAESI EUROPEI", "Estero"),
+]
+
+# One project in RARE is abroad, one is trasversale and one has private funding: the plan tests
+# filter on these values, selective enough that reading them through an index is the right plan
+RARE = 200
+
+OVERVIEW_FILTERS = [
+    {"region": "997", "macroarea": None, "is_trasversale": None},
+    {"region": None, "macroarea": "Estero", "is_trasversale": None},
+    {"region": None, "macroarea": None, "is_trasversale": True},
+]
+
+ANALYSIS_FILTERS = [
+    {"macroarea": "Estero", "funding_source": "Tutte"},
+    {"macroarea": "Tutte", "funding_source": "Privato"},
+    {"macroarea": "Estero", "funding_source": "UE"},
+]
+
+# Tables that must not be read in full when the filters select a few rows
+CHECKED_TABLES = {
+    Project._meta.db_table,
+    Funding._meta.db_table,
+    Location.project.through._meta.db_table,
+}
+
+# Service functions and the tables they may read in full even with filters:
+# funding_by_macroarea / get_payments_realization_gap are unfiltered on purpose
+# and read every Funding row (and its project's macroareas).
+OVERVIEW_FUNCTIONS = {
+    "count_projects_with_status": set(),
+    "sum_funding_gross": set(),
+    "count_big_projects": set(),
+    "top_10_projects": set(),
+    "get_top_sectors": set(),
+    "funding_by_macroarea": {"analytics_projects_funding", "analytics_projects_project"},
+    "overview_fused": {"analytics_projects_funding", "analytics_projects_project"},
+}
+ANALYSIS_FUNCTIONS = {
+    "funding_sources_analysis": set(),
+    "specific_funds_contribution": set(),
+    "top10_thematic_objectives": set(),
+    "get_top_project_typologies": set(),
+    "get_funds_to_be_found": set(),
+    "get_payments_realization_gap": {"analytics_projects_funding"},
+    "analysis_fused": {"analytics_projects_funding"},
+}
+
+# Nodes that return rows as their first child produces them: below a Limit, they stop early too
+STREAMING_NODES = {"Limit", "Nested Loop", "Subquery Scan", "Result", "Append", "Merge Append"}
+
+
+def build_synthetic_dataset(size=600):
+    """Projects spread over regions, statuses, sectors, themes, typologies and funding sources."""
+    locations = [
+        Location.objects.create(region_code=code, region_name=name, macroarea=macroarea)
+        for code, name, macroarea in REGIONS
+    ]
+    statuses = [choice.value for choice in Project.ProjectStatusChoices]
+    typologies = [choice.value for choice in Project.CUPTypologyChoices][:8] + [None]
+
+    projects = Project.objects.bulk_create(
+        Project(
+            local_project_code=f"P{i:05d}",
+            oc_project_title=f"Progetto {i}",
+            is_trasversale=i % RARE == 0,
+            oc_project_status=statuses[i % len(statuses)],
+            cup_descr_sector=f"SETTORE {i % 11}",
+            oc_synthetic_theme=f"TEMA {i % 13}",
+            cup_typology=typologies[i % len(typologies)],
+        )
+        for i in range(size)
+    )
+
+    fundings = []
+    for i, project in enumerate(projects):
+        funding = Funding(
+            project=project,
+            eu_funds_fesr=(i % 5) * 1_000_000.0,
+            state_fsc=(i % 3) * 2_000_000.0,
+            regional_funds=(i % 4) * 500_000.0,
+            private_funds=BIG_PROJECT_THRESHOLD if i % RARE == 0 else 0.0,
+            total_savings=(i % 6 - 2) * 10_000.0,
+        )
+        # bulk_create skips save(): same totals and mask
+        funding.total_funds_gross = sum(getattr(funding, field) for field in Funding.GROSS_FUNDS_FIELDS)
+        funding.total_funds_net = funding.total_funds_gross - funding.total_savings
+        funding.source_mask = Funding.compute_source_mask(
+            {field: getattr(funding, field) for field in Funding.SOURCE_MASK_FIELDS}
+        )
+        fundings.append(funding)
+    Funding.objects.bulk_create(fundings)
+
+    # Italian regions and national scope for most projects, one project in RARE abroad
+    domestic, abroad = locations[:-1], locations[-1]
+    Through = Location.project.through
+    Through.objects.bulk_create(
+        Through(project_id=project.pk, location_id=location.pk)
+        for i, project in enumerate(projects)
+        for location in (
+            [abroad] if i % RARE == RARE // 2 else [domestic[j % len(domestic)] for j in range(i, i + 1 + i % 3)]
+        )
+    )
+    refresh_project_locations()
+    refresh_project_rankings()
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def plan_nodes(plan, limited=False):
+    """(node, limited) for every node of an EXPLAIN plan; limited: below a Limit through streaming nodes only."""
+    yield plan, limited
+    limited = plan["Node Type"] == "Limit" or (limited and plan["Node Type"] in STREAMING_NODES)
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child, limited)
+
+
+@override_settings(ANALYTICS_USE_AGGREGATES=False, ANALYTICS_RESPONSE_CACHE=False, ANALYTICS_ENGINE="database")
+class SyntheticDatasetTestCase(TestCase):
+    """Tests on the synthetic dataset, computed from the base tables: no cube, no response cache, SQL engine."""
+
+    dataset_size = 600
+
+    @classmethod
+    def setUpTestData(cls):
+        build_synthetic_dataset(cls.dataset_size)
+
+
+class QueryPlanMixin:
+    """
+    EXPLAINs the queries of a function with the default planner settings and returns the CHECKED_TABLES
+    it reads in full. A scan is bounded when it has an index condition (Index Cond / Recheck Cond),
+    runs below a Limit that stops it early, or has no filter and an estimate of at most
+    MAX_READ_FRACTION of its table (a partial index, which only holds the matching rows).
+    """
+
+    # Enough rows for the planner to prefer the indexes on selective filters
+    dataset_size = 10_000
+
+    MAX_READ_FRACTION = 0.05
+
+    def full_scans(self, function, filters):
+        with CaptureQueriesContext(connection) as captured:
+            function(filters)
+
+        tables = set()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)", [list(CHECKED_TABLES)])
+            table_rows = dict(cursor.fetchall())
+            for query in captured.captured_queries:
+                if not query["sql"].lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query['sql']}")
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                tables |= {
+                    node["Relation Name"]
+                    for node, limited in plan_nodes(plan[0]["Plan"])
+                    if node.get("Relation Name") in table_rows
+                    and not self.bounded(node, limited, table_rows[node["Relation Name"]])
+                }
+        return tables
+
+    def bounded(self, node, limited, table_rows):
+        if node.get("Index Cond") or node.get("Recheck Cond") or limited:
+            return True
+        return "Filter" not in node and node["Plan Rows"] <= table_rows * self.MAX_READ_FRACTION
+
+
+class ServiceQueryPlanTests(QueryPlanMixin, SyntheticDatasetTestCase):
+    """
+    Runs every service function on selective filters of a synthetic dataset and EXPLAINs its queries:
+    a project or funding table read in full means no index serves the filter, i.e. a missing or
+    regressed index (or statistics misleading the planner).
+    """
+
+    def assert_index_driven(self, functions, filter_sets):
+        for name, allowed in functions.items():
+            for filters in filter_sets:
+                with self.subTest(function=name, filters=filters):
+                    scans = self.full_scans(getattr(services, name), filters)
+                    self.assertFalse(scans - allowed, f"{name}({filters}) reads whole tables")
+
+    def test_overview_functions_use_indexes(self):
+        self.assert_index_driven(OVERVIEW_FUNCTIONS, OVERVIEW_FILTERS)
+
+    def test_analysis_functions_use_indexes(self):
+        self.assert_index_driven(ANALYSIS_FUNCTIONS, ANALYSIS_FILTERS)
+
+    @override_settings(ANALYTICS_USE_AGGREGATES=True)
+    def test_aggregate_cube_uses_indexes(self):
+        refresh_funding_aggregates()
+        # From the cube, the fused queries read the project tables only for the top-N
+        self.assert_index_driven({**OVERVIEW_FUNCTIONS, "overview_fused": set()}, OVERVIEW_FILTERS)
+        self.assert_index_driven(
+            {**ANALYSIS_FUNCTIONS, "analysis_fused": set()},
+            [{"macroarea": "Estero", "funding_source": "Tutte"}, {"macroarea": "Tutte", "funding_source": "Tutte"}],
+        )
+
+
+class FusedAggregateTests(SyntheticDatasetTestCase):
+    """overview_fused / analysis_fused answer the same from the FundingAggregate cube as from the base tables."""
+
+    def test_cube_matches_base_tables(self):
+        refresh_funding_aggregates()
+        for function, filter_sets in [
+            (services.overview_fused, OVERVIEW_FILTERS + [{}, {"region": "015", "is_trasversale": "false"}]),
+            # the cube has no funding source dimension: only funding_source "Tutte"
+            (services.analysis_fused, [{"macroarea": macroarea, "funding_source": "Tutte"}
+                                       for macroarea in ("Tutte", "Estero", "Mezzogiorno")]),
+        ]:
+            for filters in filter_sets:
+                with self.subTest(function=function.__name__, filters=filters):
+                    expected = function(filters)
+                    with override_settings(ANALYTICS_USE_AGGREGATES=True), \
+                            CaptureQueriesContext(connection) as captured:
+                        self.assertTrue(services.results_match(expected, function(filters)))
+                    self.assertIn(FundingAggregate._meta.db_table, captured.captured_queries[-1]["sql"])
+
+
+@override_settings(ANALYTICS_USE_AGGREGATES=False, ANALYTICS_RESPONSE_CACHE=False, ANALYTICS_ENGINE="database")
+class SectionConcurrencyTests(TransactionTestCase):
+    """
+    run_sections on the thread pool: same payload as in sequence, and no connection left open by the workers.
+    The dataset is committed (TransactionTestCase), as the threads read it through their own connections.
+    """
+
+    def setUp(self):
+        build_synthetic_dataset(400)
+
+    def test_concurrent_sections_match_serial(self):
+        filter_sets = [(services.overview_legacy, filters) for filters in OVERVIEW_FILTERS + [{}]]
+        filter_sets += [(services.analysis_legacy, filters) for filters in ANALYSIS_FILTERS + [{}]]
+        for function, filters in filter_sets:
+            with self.subTest(function=function.__name__, filters=filters):
+                expected = function(filters)
+                with override_settings(ANALYTICS_SECTION_CONCURRENCY=4):
+                    self.assertTrue(services.results_match(expected, function(filters)))
+
+    def test_workers_close_their_connections(self):
+        worker_connections = {}
+
+        def section(filters):
+            worker_connections[threading.get_ident()] = connections["default"]
+            return services.sum_funding_gross(filters)
+
+        with override_settings(ANALYTICS_SECTION_CONCURRENCY=4):
+            results = services.run_sections({f"section{i}": section for i in range(8)}, {})
+
+        self.assertEqual(set(results.values()), {services.sum_funding_gross({})})
+        self.assertNotIn(threading.get_ident(), worker_connections)
+        for wrapper in worker_connections.values():
+            self.assertIsNone(wrapper.connection)
+
+
+def load_settings(**environment):
+    """A fresh copy of the settings module, evaluated with the given environment variables."""
+    spec = importlib.util.spec_from_file_location("settings_under_test", settings.BASE_DIR / "horizon_analytics" / "settings.py")
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, environment):
+        spec.loader.exec_module(module)
+    return module
+
+
+class ConnectionSettingsTests(SimpleTestCase):
+    """CONN_MAX_AGE by server mode, and the pooled backend settings."""
+
+    def test_asgi_disables_persistent_connections(self):
+        for mode, conn_max_age in [("asgi", 0), ("wsgi", 60), ("dev", 60)]:
+            with self.subTest(mode=mode):
+                databases = load_settings(SERVER_MODE=mode, CONN_MAX_AGE="60", DB_POOL="false").DATABASES
+                self.assertEqual(databases["default"]["CONN_MAX_AGE"], conn_max_age)
+
+    def test_pool_settings(self):
+        database = load_settings(SERVER_MODE="wsgi", CONN_MAX_AGE="60", DB_POOL="true").DATABASES["default"]
+        self.assertEqual(database["ENGINE"], "horizon_analytics.postgresql_pool")
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertLessEqual(database["OPTIONS"]["pool"]["min_size"], database["OPTIONS"]["pool"]["max_size"])
+
+
+class PooledBackendTests(SimpleTestCase):
+    """horizon_analytics.postgresql_pool: connections borrowed from and given back to a bounded pool."""
+
+    databases = {"default"}
+
+    def setUp(self):
+        from horizon_analytics.postgresql_pool import base
+
+        self.base = base
+        self.settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "horizon_analytics.postgresql_pool",
+            "CONN_MAX_AGE": 0,
+        }
+        self.wrappers = []
+        self.addCleanup(self.close_pool)
+
+    def close_pool(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        pool = self.base._pools.pop((os.getpid(), "pooled"), None)
+        if pool is not None:
+            pool.close()
+
+    def wrapper(self, max_size, **settings_dict):
+        """Wrapper on the test pool (one per process and alias, created by the first connection)."""
+        options = {"pool": {"min_size": 1, "max_size": max_size, "timeout": 0.5}}
+        wrapper = self.base.DatabaseWrapper({**self.settings_dict, "OPTIONS": options, **settings_dict}, alias="pooled")
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_close_returns_connection_to_pool(self):
+        wrapper = self.wrapper(max_size=1)
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+
+        # Reopened, by the same wrapper or another one: the same server connection, from the pool
+        self.assertEqual(self.backend_pid(wrapper), pid)
+        wrapper.close()
+        self.assertEqual(self.backend_pid(self.wrapper(max_size=1)), pid)
+
+    def test_pool_size_is_bounded(self):
+        wrappers = [self.wrapper(max_size=2) for _ in range(2)]
+        pids = {self.backend_pid(wrapper) for wrapper in wrappers}
+        self.assertEqual(len(pids), 2)
+
+        # A third connection waits for the pool timeout, then fails
+        with self.assertRaises(OperationalError):
+            self.wrapper(max_size=2).ensure_connection()
+        self.assertEqual(wrappers[0].pool.get_stats()["pool_size"], 2)
+
+        # Given back by the first wrapper, lent to the next one
+        wrappers[0].close()
+        self.assertIn(self.backend_pid(self.wrapper(max_size=2)), pids)
+
+    def test_requires_conn_max_age_zero(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(max_size=1, CONN_MAX_AGE=60).ensure_connection()
+
+
+class ColumnarEngineTests(SyntheticDatasetTestCase):
+    """The NumPy engine answers as the SQL queries, with and without filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # No Funding and no regions: NULL total, first in the ranking as in Postgres
+        Project.objects.create(local_project_code="P99999", oc_project_title="Senza finanziamento")
+        refresh_project_rankings()
+
+    def setUp(self):
+        from .engine import ColumnarEngine
+        self.engine = ColumnarEngine.from_database(version=0)
+
+    def test_overview_matches_sql(self):
+        for filters in OVERVIEW_FILTERS + [
+            {}, {"region": "015"}, {"macroarea": "Mezzogiorno", "is_trasversale": "false"},
+            {"region": "019", "top_n": "40"},
+        ]:
+            with self.subTest(filters=filters):
+                expected = services.overview_fused(filters)
+                self.assertTrue(services.results_match(expected, services.overview_legacy(filters)))
+                self.assertTrue(services.results_match(expected, self.engine.overview(filters)))
+
+    def test_analysis_matches_sql(self):
+        for filters in ANALYSIS_FILTERS + [
+            {}, {"macroarea": "Centro-Nord", "funding_source": "Stato"},
+            {"macroarea": "Mezzogiorno", "funding_source": "Regioni"}, {"macroarea": "Tutte", "funding_source": "UE"},
+        ]:
+            with self.subTest(filters=filters):
+                expected = services.analysis_fused(filters)
+                self.assertTrue(services.results_match(expected, services.analysis_legacy(filters)))
+                self.assertTrue(services.results_match(expected, self.engine.analysis(filters)))
+
+    @override_settings(ANALYTICS_ENGINE="numpy")
+    def test_services_answer_from_engine(self):
+        overview_filters = {"region": "015"}
+        analysis_filters = {"macroarea": "Estero", "funding_source": "UE"}
+        with mock.patch("analytics_projects.engine.get_engine", return_value=self.engine), \
+                CaptureQueriesContext(connection) as captured:
+            overview = services.compute_overview_data(overview_filters)
+            analysis = services.compute_analysis_data(analysis_filters)
+        self.assertEqual(captured.captured_queries, [])
+        self.assertTrue(services.results_match(services.overview_fused(overview_filters), overview))
+        self.assertTrue(services.results_match(services.analysis_fused(analysis_filters), analysis))
+
+    def test_snapshot_round_trip(self):
+        from .engine import ColumnarEngine
+        from .snapshot import read_snapshot
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "engine.snapshot")
+            self.engine.write_snapshot(path)
+            version, arrays, lists = read_snapshot(path)
+            loaded = ColumnarEngine.from_snapshot(path)
+
+            self.assertEqual(version, 0)
+            expected_arrays = {
+                **self.engine.arrays,
+                "project_regions": self.engine.project_regions,
+                "project_region_offsets": self.engine.project_region_offsets,
+            }
+            self.assertEqual(set(arrays), set(expected_arrays))
+            for name, array in expected_arrays.items():
+                with self.subTest(array=name):
+                    self.assertEqual(arrays[name].dtype, array.dtype)
+                    self.assertEqual(arrays[name].tobytes(), array.tobytes())
+            self.assertEqual(
+                {name: [values[i] for i in range(len(values))] for name, values in lists.items()},
+                {name: list(values) for name, values in self.engine.lists.items()},
+            )
+            self.assertEqual(loaded.overview({"top_n": "40"}), self.engine.overview({"top_n": "40"}))
+            self.assertEqual(loaded.analysis({}), self.engine.analysis({}))
+
+    @override_settings(ANALYTICS_ENGINE="numpy")
+    def test_version_bump_reloads_engine(self):
+        from . import engine
+
+        with tempfile.TemporaryDirectory() as folder, \
+                override_settings(ANALYTICS_SNAPSHOT_PATH=os.path.join(folder, "engine.snapshot")), \
+                mock.patch.object(engine, "_engine", None):
+            version = cache.get_dataset_version().version
+            engine.ColumnarEngine.from_database(version).write_snapshot(settings.ANALYTICS_SNAPSHOT_PATH)
+            with mock.patch.object(engine.ColumnarEngine, "from_database") as from_database:
+                current = engine.get_engine()
+                self.assertIs(engine.get_engine(), current)
+            from_database.assert_not_called()
+            self.assertEqual(current.version, version)
+
+            # A new import: the snapshot is stale, the engine is rebuilt from the database
+            Project.objects.filter(local_project_code="P99999").update(oc_project_title="Aggiornato")
+            new_version = cache.bump_dataset_version()
+            with self.assertLogs("analytics_projects.engine", "WARNING"):
+                rebuilt = engine.get_engine()
+            self.assertEqual(rebuilt.version, new_version)
+            self.assertEqual(rebuilt.overview({})["top_projects"]["project1"]["title"], "Aggiornato")
+            self.assertEqual(current.overview({})["top_projects"]["project1"]["title"], "Senza finanziamento")
+
+
+@override_settings(
+    ANALYTICS_RESPONSE_CACHE=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "encoding-tests"}},
+)
+class ResponseEncodingTests(SyntheticDatasetTestCase):
+    """Encoded bodies from the response cache, its keys and counters, and the conditional responses of the API."""
+
+    def setUp(self):
+        django_cache.clear()
+
+    def test_cached_variants_written_without_brotli(self):
+        # The entry is written by a process without brotli: a client accepting br gets the cached gzip
+        with mock.patch("analytics_projects.cache.COMPRESSORS", {"gzip": cache.COMPRESSORS["gzip"]}):
+            self.client.get("/api/overview/", HTTP_ACCEPT_ENCODING="gzip")
+        response = self.client.get("/api/overview/", HTTP_ACCEPT_ENCODING="br, gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_not_modified_varies_on_encoding(self):
+        etag = self.client.get("/api/overview/", HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        response = self.client.get("/api/overview/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_cache_keys_valid_for_memcached(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            for params in [{}, {"macroarea": "Ambito Nazionale"}, {"region": "x" * 300}]:
+                self.assertEqual(self.client.get("/api/overview/", params).status_code, 200)
+            self.assertEqual(self.client.get("/api/analysis/", {"macroarea": "Ambito Nazionale"}).status_code, 200)
+
+    def test_dataset_version_read_once(self):
+        self.client.get("/api/overview/")
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get("/api/overview/")
+        version_table = DatasetVersion._meta.db_table
+        self.assertEqual(sum(version_table in query["sql"] for query in captured.captured_queries), 1)
+
+    def test_cache_stats_for_staff_only(self):
+        self.assertEqual(self.client.get("/api/cache-stats/").status_code, 403)
+
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.client.get("/api/overview/")
+        before = self.client.get("/api/cache-stats/").json()["data"]
+        self.client.get("/api/overview/")
+        after = self.client.get("/api/cache-stats/").json()["data"]
+        self.assertEqual(after["hits"], before["hits"] + 1)
+        self.assertEqual(after["misses"], before["misses"])
+
+
+class FastJSONTests(SyntheticDatasetTestCase):
+    """The compiled serializers and the orjson renderer give the same bytes as DRF."""
+
+    def grouped_payload(self):
+        """A grouped response with None, Decimal and float values and nested lists of serializers."""
+        data = services.compute_grouped_data("macroarea", {})
+        group = data["groups"][0]
+        group["value"] = None
+        overview, analysis = group["overview"], group["analysis"]
+        overview["total_financing"] = Decimal("1234567.89")
+        overview["abroad_financing"] = None
+        overview["top_projects"]["project1"]["total_financing"] = Decimal("0.10")
+        overview["top_projects"]["project1"]["title"] = "Progetto \u2028 città"
+        overview["top_sectors"]["sector1"] = None
+        analysis["top10_thematic_objectives"].append(None)
+        analysis["funds_to_be_found"]["total_missing_amount"] = 0.1 + 0.2
+        return data
+
+    def test_compiled_serializer_matches_drf(self):
+        data = self.grouped_payload()
+        with override_settings(ANALYTICS_FAST_JSON=False):
+            expected = serialize(GroupedSerializer, data)
+        fast = serialize(GroupedSerializer, data)
+
+        self.assertEqual(fast, json.loads(json.dumps(expected)))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_renderer_matches_drf(self):
+        utc = datetime.timezone.utc
+        for value in [
+            None, Decimal("1.10"), 0.1 + 0.2, 123456789.125, -0.0, 2 ** 63, [[1, [2.5, None, Decimal("3")]]],
+            "\u2028\u2029 città", datetime.datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=utc),
+            datetime.datetime(2024, 5, 1, 12), datetime.date(2024, 5, 1), datetime.time(1, 2, 3, 4567),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render({"value": value}), JSONRenderer().render({"value": value}))
+
+    def test_renderer_known_differences(self):
+        # Exponent floats: other text, same value
+        self.assertEqual(FastJSONRenderer().render({"value": 1e16}), b'{"value":1e16}')
+        self.assertEqual(json.loads(FastJSONRenderer().render({"value": 1e16})), {"value": 1e16})
+        # NaN: null instead of the ValueError of strict JSON
+        self.assertEqual(FastJSONRenderer().render({"value": float("nan")}), b'{"value":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({"value": float("nan")})
+
+
+class GroupedMetricsTests(SyntheticDatasetTestCase):
+    """Every group of compute_grouped_data matches the Overview / Analysis filtered on its value."""
+
+    def test_groups_match_filtered_responses(self):
+        for dimension in ("region", "macroarea"):
+            groups = services.compute_grouped_data(dimension, {})["groups"]
+            self.assertTrue(groups)
+            for group in groups:
+                with self.subTest(dimension=dimension, value=group["value"]):
+                    overview = services.overview_fused({dimension: group["value"]})
+                    self.assertTrue(services.results_match(overview, group["overview"]))
+                    if dimension == "macroarea":
+                        analysis = services.analysis_fused({"macroarea": group["value"], "funding_source": "Tutte"})
+                        self.assertTrue(services.results_match(analysis, group["analysis"]))
+
+    def test_column_groups_match_legacy_sections(self):
+        # The API has no sector / theme / typology filter: the legacy sections run on the projects
+        # of the group instead, so their top sectors, themes and typologies check the GROUPING sets
+        for dimension, column in [("sector", "cup_descr_sector"), ("theme", "oc_synthetic_theme"),
+                                  ("typology", "cup_typology")]:
+            groups = services.compute_grouped_data(dimension, {})["groups"]
+            self.assertEqual(
+                [group["value"] for group in groups],
+                sorted(set(Project.objects.values_list(column, flat=True)), key=lambda value: (value is None, value)),
+            )
+            for group in groups:
+                with self.subTest(dimension=dimension, value=group["value"]):
+                    lookup = Q(**{column: group["value"]}) if group["value"] is not None else Q(**{f"{column}__isnull": True})
+                    projects_qs = Project.objects.filter(lookup)
+                    with mock.patch.object(services, "get_filtered_projects", return_value=projects_qs), \
+                            mock.patch.object(services, "get_filtered_projects_by_filters",
+                                              return_value=(projects_qs, Funding.objects.filter(project__in=projects_qs))):
+                        overview = services.overview_legacy({})
+                        analysis = services.analysis_legacy({})
+                    self.assertTrue(services.results_match(overview, group["overview"]))
+                    self.assertTrue(services.results_match(analysis, group["analysis"]))
+
+
+class ProjectListingTests(QueryPlanMixin, SyntheticDatasetTestCase):
+    """Keyset pages of get_projects_page: same rows as the full ordering, index-driven at any depth."""
+
+    def walk_pages(self, filters, page_size):
+        rows, cursor = [], None
+        while True:
+            page, next_cursor = services.get_projects_page(filters, ("id", "total_financing"), page_size, cursor)
+            rows += page
+            if next_cursor is None:
+                return rows
+            cursor = services.decode_cursor(next_cursor)
+
+    def test_pages_follow_ranking_order(self):
+        # A few projects without funding: NULL total_financing, listed first
+        Project.objects.filter(local_project_code__in=["P00003", "P00004"]).update(total_financing=None)
+
+        for filters in [{}, {"region": "015", "status": "In corso"}, {"funding_source": "UE", "min_financing": 1e6}]:
+            with self.subTest(filters=filters):
+                expected = list(
+                    services.get_listed_projects(filters)
+                    .order_by(*Project.RANKING_ORDER)
+                    .values_list("local_project_code", flat=True)
+                )
+                self.assertEqual([row["id"] for row in self.walk_pages(filters, 37)], expected)
+
+    def test_filters_match_get_filtered_projects(self):
+        # The API reads macroarea=Trasversale as is_trasversale, like the Overview
+        for params, filters in [
+            ({"region": "nessun filtro", "macroarea": "nessun filtro"}, {}),
+            ({"macroarea": "Trasversale"}, {"is_trasversale": True}),
+            ({"region": "997", "is_trasversale": "false"}, {"region": "997", "is_trasversale": "false"}),
+        ]:
+            with self.subTest(params=params):
+                expected = set(services.get_filtered_projects(filters).values_list("local_project_code", flat=True))
+                rows, query = [], {**params, "fields": "id", "page_size": 1000}
+                while True:
+                    data = self.client.get("/api/projects/", query).json()["data"]
+                    rows += data["results"]
+                    if data["next_cursor"] is None:
+                        break
+                    query["cursor"] = data["next_cursor"]
+                self.assertEqual({row["id"] for row in rows}, expected)
+
+    def test_deep_pages_use_indexes(self):
+        ranking = list(Project.objects.order_by(*Project.RANKING_ORDER).values_list("total_financing", "local_project_code"))
+        # Last project of its total: the page goes on with the lower totals, a range of project_ranking_idx
+        total_financing = ranking[len(ranking) * 3 // 4][0]
+        cursor = [row for row in ranking if row[0] == total_financing][-1]
+
+        def deep_page(filters):
+            return services.get_projects_page(filters, services.PROJECT_LIST_DEFAULT_FIELDS, 20, cursor)
+
+        self.assertFalse(self.full_scans(deep_page, {}))
+
+
+class FundingAdminTests(TestCase):
+    """Admin edits of a Funding keep the ranking column of its project in step."""
+
+    def test_save_and_delete_update_total_financing(self):
+        from django.contrib import admin
+
+        model_admin = admin.site._registry[Funding]
+        project = Project.objects.create(local_project_code="P1", oc_project_title="Progetto 1")
+        funding = Funding(project=project, eu_funds_fesr=1000.0, state_fsc=500.0)
+
+        model_admin.save_model(None, funding, None, change=False)
+        project.refresh_from_db()
+        self.assertEqual(project.total_financing, 1500.0)
+
+        model_admin.delete_model(None, funding)
+        project.refresh_from_db()
+        self.assertIsNone(project.total_financing)
+
+
+CSV_COLUMNS = [
+    "COD_LOCALE_PROGETTO", "COD_REGIONE", "DEN_REGIONE", "OC_MACROAREA", "OC_STATO_PROGETTO",
+    "OC_STATO_PROCEDURALE", "OC_TITOLO_PROGETTO", "CUP_DESCR_SETTORE", "CUP_DESCR_TIPOLOGIA",
+    "OC_TEMA_SINTETICO", *import_script.FUNDING_FIELD_MAP.values(),
+]
+
+
+def csv_row(code, regions=(("001", "PIEMONTE"),), **columns):
+    """A CSV row of the OpenCoesione export: regions as (code, name) pairs, amounts in Italian format."""
+    return {
+        "COD_LOCALE_PROGETTO": code,
+        "COD_REGIONE": ":::".join(region_code for region_code, _ in regions),
+        "DEN_REGIONE": ":::".join(region_name for _, region_name in regions),
+        "OC_STATO_PROGETTO": "In corso",
+        "OC_STATO_PROCEDURALE": "In esecuzione",
+        "OC_TITOLO_PROGETTO": f"Progetto {code}",
+        "CUP_DESCR_SETTORE": "INFRASTRUTTURE SOCIALI",
+        "CUP_DESCR_TIPOLOGIA": "NUOVA REALIZZAZIONE",
+        "OC_TEMA_SINTETICO": "TRASPORTI",
+        **columns,
+    }
+
+
+# Multi-region projects (links in CSV order), a project repeated with other values and regions,
+# an unknown region, a project without regions, a trasversale project and values the codec rejects
+IMPORT_ROWS = [
+    csv_row("P1", [("001", "PIEMONTE"), ("012", "LAZIO")], FINANZ_UE_FESR="1500000,25", FINANZ_STATO_FSC="250000",
+            ECONOMIE_TOTALI="1000"),
+    csv_row("P2", [("015", "CAMPANIA"), ("001", "PIEMONTE")], OC_MACROAREA="Trasversale",
+            FINANZ_PRIVATO="60000000", CUP_DESCR_TIPOLOGIA="NON PREVISTA"),
+    csv_row("P3", [("999", "SCONOSCIUTA"), ("019", "SICILIA")], FINANZ_REGIONE="N/A", OC_STATO_PROGETTO=""),
+    csv_row("P4", [], FINANZ_COMUNE="10,5"),
+    csv_row("P1", [("019", "SICILIA"), ("012", "LAZIO")], FINANZ_UE_FESR="2000000", OC_STATO_PROGETTO="Concluso"),
+    csv_row("P5", [("997", "PAESI EUROPEI")], FINANZ_UE="3000000", ECONOMIE_TOTALI="500000"),
+]
+
+
+class ImportTestCase(TransactionTestCase):
+    """
+    Imports of small CSV files through the loaders of data_import/import_script.py. Transactional:
+    the loaders commit on their own and the parallel one writes from other processes.
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.folder, name)
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.DictWriter(file, CSV_COLUMNS, delimiter=";", restval="")
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    @staticmethod
+    def read_csv(path):
+        rows = import_script.import_multiple_csv(path) if os.path.isdir(path) else import_script.import_projects_from_csv(path)
+        return import_script.normalize_projects_data(import_script.fingerprint_projects_data(rows))
+
+    @staticmethod
+    def dataset_state():
+        """Every row of the dataset tables that the APIs read, the links of every project in insertion order."""
+        def values(model, *order):
+            return list(model.objects.order_by(*order).values(
+                *(field.attname for field in model._meta.concrete_fields if field.name != "id")
+            ))
+
+        return {
+            "projects": values(Project, "pk"),
+            "fundings": values(Funding, "project_id"),
+            "links": list(
+                Location.project.through.objects.order_by("project_id", "id").values_list("project_id", "location_id")
+            ),
+            "aggregates": values(FundingAggregate, *DIMENSIONS),
+        }
+
+    @staticmethod
+    def clear_dataset():
+        Location.project.through.objects.all().delete()
+        Funding.objects.all().delete()
+        Project.objects.all().delete()
+        FundingAggregate.objects.all().delete()
+
+
+class BulkImportTests(ImportTestCase):
+    """The COPY loaders end in the same state as the ORM loader (load_projects_into_db)."""
+
+    def test_bulk_loader_matches_orm_loader(self):
+        path = self.write_csv("progetti.csv", IMPORT_ROWS)
+
+        with CaptureQueriesContext(connection) as captured:
+            import_script.load_projects_into_db(self.read_csv(path))
+        # total_financing is written once, set-wise by refresh_project_rankings, not on each Funding.save
+        ranking_updates = [
+            query["sql"] for query in captured.captured_queries
+            if query["sql"].lstrip().upper().startswith("UPDATE") and "total_financing" in query["sql"]
+        ]
+        self.assertEqual(len(ranking_updates), 1)
+        expected = self.dataset_state()
+        self.assertEqual(
+            [(p["local_project_code"], p["region_codes"], p["region_label"]) for p in expected["projects"]],
+            [("P1", ["001", "012", "019"], "PIEMONTE, LAZIO, SICILIA"), ("P2", ["015", "001"], "CAMPANIA, PIEMONTE"),
+             ("P3", ["019"], "SICILIA"), ("P4", [], ""), ("P5", ["997"], "PAESI EUROPEI")],
+        )
+
+        self.clear_dataset()
+        import_script.bulk_load_projects_into_db(self.read_csv(path), chunk_size=2)
+        self.assertEqual(self.dataset_state(), expected)
+
+    def test_parallel_folder_matches_orm_loader(self):
+        # P1 and P2 come back in the second file: its rows win, the links of both files add up
+        self.write_csv("progetti_1.csv", IMPORT_ROWS[:3])
+        self.write_csv("progetti_2.csv", IMPORT_ROWS[3:] + [csv_row("P2", [("012", "LAZIO")], FINANZ_STATO_PAC="1000")])
+
+        import_script.load_projects_into_db(self.read_csv(self.folder))
+        expected = self.dataset_state()
+
+        self.clear_dataset()
+        import_script.parallel_load_csv_folder(self.folder, workers=2, chunk_size=2)
+        self.assertEqual(self.dataset_state(), expected)
+
+    def test_invalid_values_reported_per_load(self):
+        path = self.write_csv("progetti.csv", IMPORT_ROWS)
+        for _ in range(2):
+            with self.assertLogs(import_script.logger, "WARNING") as logs:
+                import_script.bulk_load_projects_into_db(self.read_csv(path))
+            # P2 has two regions: its typology is decoded once per normalized row
+            self.assertEqual(logs.output, [
+                "WARNING:import_script:2 valori non validi nella colonna CUP_DESCR_TIPOLOGIA",
+            ])
+
+
+class ColumnCodecTests(SimpleTestCase):
+    """Column-wise decoding of the import chunks and its count of invalid values."""
+
+    def setUp(self):
+        self.codec = ColumnCodec(decimal_columns=["FINANZ_UE"], enum_columns={"TIPOLOGIA": {"ALTRO", "RESTAURO"}})
+
+    def test_decode_counts_invalid_values(self):
+        columns = self.codec.decode([
+            {"FINANZ_UE": "1000,5", "TIPOLOGIA": "ALTRO"},
+            {"FINANZ_UE": "N/A", "TIPOLOGIA": " RESTAURO "},
+            {"FINANZ_UE": "mille", "TIPOLOGIA": "ALTRA"},
+            {"FINANZ_UE": "", "TIPOLOGIA": ""},
+        ])
+        self.assertEqual(list(columns["FINANZ_UE"]), [1000.5, 0.0, 0.0, 0.0])
+        self.assertEqual(columns["TIPOLOGIA"], ["ALTRO", "RESTAURO", None, None])
+        self.assertEqual(self.codec.invalid, {"FINANZ_UE": 1, "TIPOLOGIA": 1})
+
+        self.codec.reset()
+        self.assertEqual(self.codec.invalid, {})
+
+    def test_clean_data_logs_nothing(self):
+        logger = logging.getLogger("column_codec.tests")
+        self.codec.decode([{"FINANZ_UE": "1,5", "TIPOLOGIA": "ALTRO"}, {"FINANZ_UE": "", "TIPOLOGIA": None}])
+        with self.assertNoLogs(logger, "WARNING"):
+            self.codec.log_invalid(logger)
+
+
+class DeltaImportTests(ImportTestCase):
+    """--delta imports end in the same state as a full import of the same CSV."""
+
+    def delta_import(self, rows, prune=False):
+        path = self.write_csv("delta.csv", rows)
+        import_script.bulk_load_projects_into_db(self.read_csv(path), delta=True, prune=prune)
+        return path
+
+    def assert_matches_full_import(self, path):
+        state = self.dataset_state()
+        self.clear_dataset()
+        import_script.bulk_load_projects_into_db(self.read_csv(path))
+        self.assertEqual(state, self.dataset_state())
+
+    def test_project_losing_every_region(self):
+        self.delta_import(IMPORT_ROWS)
+        # P2 only keeps a region missing from Location: no links left
+        rows = [row for row in IMPORT_ROWS if row["COD_LOCALE_PROGETTO"] != "P2"]
+        path = self.delta_import(rows + [csv_row("P2", [("999", "SCONOSCIUTA")])])
+
+        p2 = Project.objects.get(pk="P2")
+        self.assertEqual((p2.region_codes, p2.macroareas, p2.region_label, p2.macroarea_label), ([], [], "", ""))
+        self.assertFalse(services.get_filtered_projects({"region": "015"}).filter(pk="P2").exists())
+        self.assert_matches_full_import(path)
+
+    def delta_counts(self, rows, prune=False):
+        with self.assertLogs(import_script.logger, "INFO") as logs:
+            path = self.delta_import(rows, prune=prune)
+        summary = next(line for line in logs.output if "Import delta:" in line)
+        return path, dict(item.split("=") for item in summary.split("Import delta: ")[1].split(", "))
+
+    def test_changed_and_unchanged_rows(self):
+        self.delta_import(IMPORT_ROWS)
+        # Edited in the database only: an unchanged CSV row must not rewrite it
+        Project.objects.filter(pk="P4").update(oc_project_title="Modificato")
+
+        rows = [row for row in IMPORT_ROWS if row["COD_LOCALE_PROGETTO"] != "P5"]
+        path, counts = self.delta_counts(rows + [csv_row("P5", [("997", "PAESI EUROPEI")], FINANZ_UE="4000000")])
+
+        self.assertEqual(counts, {"unchanged": "4", "inserted": "0", "updated": "1", "deleted": "0"})
+        self.assertEqual(Project.objects.get(pk="P4").oc_project_title, "Modificato")
+        self.assertEqual(Funding.objects.get(project_id="P5").total_funds_gross, 4_000_000)
+
+        Project.objects.filter(pk="P4").update(oc_project_title="Progetto P4")
+        self.assert_matches_full_import(path)
+
+    def test_unchanged_file_is_skipped(self):
+        self.delta_import(IMPORT_ROWS)
+        expected = self.dataset_state()
+
+        _, counts = self.delta_counts(IMPORT_ROWS)
+        self.assertEqual(counts, {"unchanged": "5", "inserted": "0", "updated": "0", "deleted": "0"})
+        self.assertEqual(self.dataset_state(), expected)
+
+    def test_vanished_projects_pruned_only_on_request(self):
+        self.delta_import(IMPORT_ROWS)
+        rows = [row for row in IMPORT_ROWS if row["COD_LOCALE_PROGETTO"] != "P5"]
+
+        _, counts = self.delta_counts(rows)
+        self.assertEqual(counts["deleted"], "0")
+        self.assertTrue(Project.objects.filter(pk="P5").exists())
+
+        path, counts = self.delta_counts(rows, prune=True)
+        self.assertEqual(counts["deleted"], "1")
+        self.assertFalse(Project.objects.filter(pk="P5").exists())
+        self.assertFalse(Location.project.through.objects.filter(project_id="P5").exists())
+        self.assert_matches_full_import(path)
+
+
+class ShadowSwapTests(ImportTestCase):
+    """--swap loads into the shadow schema and swaps it live; --rollback brings the previous dataset back."""
+
+    MODELS = (Project, Funding, Location.project.through)
+
+    def live_counts(self):
+        return {model._meta.db_table: model.objects.count() for model in self.MODELS}
+
+    def schema_counts(self, schema):
+        with connection.cursor() as cursor:
+            counts = {}
+            for model in self.MODELS:
+                cursor.execute(f"SELECT count(*) FROM {schema}.{model._meta.db_table}")
+                counts[model._meta.db_table] = cursor.fetchone()[0]
+        return counts
+
+    def live_statistics(self):
+        """Extended statistics of the live Funding table, as (schema, name)."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT stxnamespace::regnamespace::text, stxname FROM pg_statistic_ext WHERE stxrelid = %s::regclass",
+                [f"public.{Funding._meta.db_table}"],
+            )
+            return cursor.fetchall()
+
+    def test_swap_and_rollback(self):
+        def drop_previous_schema():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {import_script.PREVIOUS_SCHEMA} CASCADE")
+        self.addCleanup(drop_previous_schema)
+        statistics = [("public", "funding_source_bits_stats")]
+
+        import_script.bulk_load_projects_into_db(self.read_csv(self.write_csv("prima.csv", IMPORT_ROWS[:3])))
+        previous = self.live_counts()
+
+        import_script.shadow_load(
+            import_script.bulk_load_projects_into_db, self.read_csv(self.write_csv("dopo.csv", IMPORT_ROWS))
+        )
+        swapped = self.live_counts()
+        self.assertEqual(list(swapped.values()), [5, 5, 7])
+        self.assertEqual(self.schema_counts(import_script.PREVIOUS_SCHEMA), previous)
+        self.assertEqual(Project.objects.get(pk="P1").region_codes, ["001", "012", "019"])
+        self.assertEqual(self.live_statistics(), statistics)
+
+        import_script.rollback_dataset()
+        self.assertEqual(self.live_counts(), previous)
+        self.assertEqual(list(previous.values()), [3, 3, 5])
+        self.assertEqual(self.schema_counts(import_script.PREVIOUS_SCHEMA), swapped)
+        self.assertEqual(self.live_statistics(), statistics)
+
+
+class CheckpointImportTests(ImportTestCase):
+    """--checkpoint imports resume after a failed chunk without duplicating or losing rows."""
+
+    def test_resume_after_failed_chunk(self):
+        files = [self.write_csv("progetti_1.csv", IMPORT_ROWS[:2]), self.write_csv("progetti_2.csv", IMPORT_ROWS[2:])]
+        import_script.bulk_load_projects_into_db(self.read_csv(self.folder))
+        expected = self.dataset_state()
+        self.clear_dataset()
+
+        # Chunks of 2 CSV rows: the first file is one chunk, the second chunk of the second file fails
+        merge, merged = import_script.merge_staging_into_tables, []
+
+        def failing_merge(*args, **kwargs):
+            if len(merged) == 2:
+                raise RuntimeError("blocco interrotto")
+            merged.append(merge(*args, **kwargs))
+
+        with mock.patch.object(import_script, "merge_staging_into_tables", failing_merge), \
+                self.assertRaises(RuntimeError):
+            import_script.checkpointed_load(files, chunk_size=2)
+
+        self.assertEqual(
+            list(ImportCheckpoint.objects.order_by("file_path").values_list("row_offset", "completed")),
+            [(2, True), (2, False)],
+        )
+        self.assertEqual(Project.objects.count(), 4)
+
+        import_script.checkpointed_load(files, chunk_size=2, resume=True)
+        self.assertEqual(self.dataset_state(), expected)
+        self.assertFalse(ImportCheckpoint.objects.exists())
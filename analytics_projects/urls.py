@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib import admin
 from . import views
-from .views import OverviewAPI, AnalysisAPI
+from .views import OverviewAPI, AnalysisAPI, GroupedAPI, ProjectsAPI, CacheStatsAPI
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
@@ -20,6 +20,9 @@ urlpatterns = [
     path('efficienza_e_performance_page/', views.efficienza_e_performance_page, name='efficienza_e_performance_page'), #url of efficenza e performance page
     path('territori_e_attori_page/', views.territori_e_attori_page, name='territori_e_attori_page'), #url of territori e attori page
     path('api/analysis/', AnalysisAPI.as_view(), name='analysis-api'), #url of API
+    path('api/grouped/', GroupedAPI.as_view(), name='grouped-api'), #url of API (metrics per dimension value)
+    path('api/projects/', ProjectsAPI.as_view(), name='projects-api'), #url of API (project listing)
+    path('api/cache-stats/', CacheStatsAPI.as_view(), name='cache-stats-api'), #url of API (response cache counters, staff only)
     # Generate the OpenAPI file
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     # Swagger UI
@@ -1,10 +1,28 @@
+import hashlib
+import json
+import math
+import os
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.shortcuts import render
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import OverviewSerializer, AnalysisSerializer
+from .serializers import (
+    OverviewSerializer, AnalysisSerializer, GroupedSerializer, ProjectListItemSerializer, serialize,
+)
 from .services import *
+from .cache import get_dataset_version, cached_body, cache_stats, negotiate_encoding
+from .renderers import FastJSONRenderer
 
 def dashboard(request):
         return render(request, 'analytics_projects/dashboard.html')
@@ -36,6 +54,63 @@ def import_csv(request):
     return render(request, 'analytics_projects/import_csv.html')
 
 
+# Conditional requests: ETag / Last-Modified come from the dataset version, so a client
+# revalidating with If-None-Match / If-Modified-Since gets a 304 without running any service
+def request_dataset_version(request):
+    if not hasattr(request, "_dataset_version"):
+        request._dataset_version = get_dataset_version()
+    return request._dataset_version
+
+def analytics_etag(request, *args, **kwargs):
+    # Every content coding is a different representation, so it gets its own ETag
+    version = request_dataset_version(request).version
+    query = urlencode(sorted(request.GET.items()))
+    accept = request.META.get("HTTP_ACCEPT", "")
+    encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING"))
+    key = f"{request.path}|{version}|{query}|{accept}|{encoding}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def analytics_last_modified(request, *args, **kwargs):
+    return request_dataset_version(request).updated_at
+
+# Clients and the CDN may store the responses but must revalidate them on every use.
+# The ETag depends on Accept and Accept-Encoding, so the 304 responses vary on them as well
+analytics_conditional = [
+    cache_control(no_cache=True),
+    vary_on_headers("Accept", "Accept-Encoding"),
+    condition(etag_func=analytics_etag, last_modified_func=analytics_last_modified),
+]
+
+def analytics_response(request, endpoint, filters_key, payload):
+    """
+    Response for payload(), the dict to render. Plain JSON requests are answered from the cache of
+    rendered bodies, stored once per dataset version and filters_key together with their gzip / br
+    variants, in the encoding negotiated from Accept-Encoding. Other renderers (browsable API,
+    indented JSON) or a disabled response cache render payload() as usual.
+    """
+    renderer = request.accepted_renderer
+    if not (
+        settings.ANALYTICS_RESPONSE_CACHE
+        and isinstance(renderer, FastJSONRenderer)
+        and renderer.get_indent(request.accepted_media_type, {}) is None
+    ):
+        return Response(payload(), status=status.HTTP_200_OK)
+
+    bodies = cached_body(
+        endpoint, filters_key, lambda: renderer.render(payload(), request.accepted_media_type),
+        version=request_dataset_version(request).version,
+    )
+    # Negotiated on the variants actually cached: the entry may come from a process without brotli
+    encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING"), bodies.keys())
+
+    response = HttpResponse(bodies[encoding], content_type=renderer.media_type, status=status.HTTP_200_OK)
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+@method_decorator(analytics_conditional, name="get")
 class OverviewAPI(APIView):
     """
     API that receives filters from frontend and returns a JSON called data
@@ -54,37 +129,28 @@ class OverviewAPI(APIView):
         filters = {
             "region": region,
             "macroarea": macroarea,
-            "is_trasversale": is_trasversale
+            "is_trasversale": is_trasversale,
+            # Size of top_projects (settings.ANALYTICS_TOP_N by default, at most ANALYTICS_TOP_N_MAX)
+            "top_n": request.query_params.get("top_n"),
         }
 
-        num_projects_with_status = count_projects_with_status(filters)
-        macroarea_financing = funding_by_macroarea(filters)
-
         # Prepare JSON
-        data = {
-            "filters": {
-                "region": region,
-                "macroarea": macroarea
-            },
-            "number_of_projects": num_projects_with_status.get('total', 0),
-            "total_financing": sum_funding_gross(filters),
-            "number_ended_projects": num_projects_with_status.get('concluded', 0),
-            "number_not_started_projects": num_projects_with_status.get('not_started', 0),
-            "number_projects_in_progress": num_projects_with_status.get('in_progress', 0),
-            "number_projects_liquidated": num_projects_with_status.get('liquidated', 0),
-            "middle_north_financing": macroarea_financing.get('Centro-Nord', 0.0),
-            "midday_financing": macroarea_financing.get('Mezzogiorno', 0.0),
-            "national_financing": macroarea_financing.get('Ambito Nazionale', 0.0),
-            "abroad_financing": macroarea_financing.get('Estero', 0.0),
-            "top_projects": top_10_projects(filters),
-            "number_big_projects": count_big_projects(filters),
-            "top_sectors": get_top_sectors(filters)
-        }
+        def payload():
+            data = {
+                "filters": {
+                    "region": region,
+                    "macroarea": macroarea
+                },
+                **build_overview_data(filters),
+            }
+            # Pass the already-prepared dictionary directly to the serializer
+            return {"data": serialize(OverviewSerializer, data)}
 
-        # Pass the already-prepared dictionary directly to the serializer
-        serializer = OverviewSerializer(data)
-        return Response({"data": serializer.data}, status=status.HTTP_200_OK)
+        # The body echoes the filters as received: they are part of its cache key
+        echo = json.dumps([region, macroarea])
+        return analytics_response(request, "overview", (*overview_filters_key(filters), echo), payload)
 
+@method_decorator(analytics_conditional, name="get")
 class AnalysisAPI(APIView):
     """
     API that receives filters from frontend and returns
@@ -101,19 +167,144 @@ class AnalysisAPI(APIView):
             "funding_source": funding_source
         }
 
-        data = {
-            "filters": {
+        def payload():
+            data = {
+                "filters": {
+                    "macroarea": macroarea,
+                    "funding_source": funding_source
+                },
+                **build_analysis_data(filters),
+            }
+            # Pass the already-prepared dictionary directly to the serializer
+            return serialize(AnalysisSerializer, data)
+
+        # The body echoes the filters as received: they are part of its cache key
+        echo = json.dumps([macroarea, funding_source])
+        return analytics_response(request, "analysis", (*analysis_filters_key(filters), echo), payload)
+
+@method_decorator(analytics_conditional, name="get")
+class GroupedAPI(APIView):
+    """
+    API that returns the Overview and Analysis metrics for every value of a dimension
+    (region, macroarea, sector, theme or typology), computed in a single pass.
+    """
+
+    def get(self, request):
+        dimension = request.query_params.get("dimension")
+        if dimension not in GROUP_DIMENSIONS:
+            return Response(
+                {"detail": f"dimension must be one of: {', '.join(GROUP_DIMENSIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        filters = {"top_n": request.query_params.get("top_n")}
+
+        def payload():
+            return {"data": serialize(GroupedSerializer, build_grouped_data(dimension, filters))}
+
+        return analytics_response(request, "grouped", grouped_filters_key(dimension, filters), payload)
+
+@method_decorator(analytics_conditional, name="get")
+class ProjectsAPI(APIView):
+    """
+    API that lists projects ordered by total financing (then project code), filtered on
+    region, macroarea, status, procedural_state, sector, theme, typology, funding_source and
+    min_financing / max_financing. Pages follow the opaque `cursor` of the previous page
+    (keyset pagination); `fields` selects a subset of the project fields.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        macroarea = params.get("macroarea")
+        is_trasversale = params.get("is_trasversale")
+
+        # Same convention as the Overview: "Trasversale" is the is_trasversale flag, not a macroarea
+        if macroarea == "Trasversale":
+            is_trasversale = True
+            macroarea = None
+
+        try:
+            filters = {
+                "region": params.get("region"),
                 "macroarea": macroarea,
-                "funding_source": funding_source
-            },
-            "funding_sources_analysis": funding_sources_analysis(filters),
-            "specific_funds_contribution": specific_funds_contribution(filters),
-            "top10_thematic_objectives": top10_thematic_objectives(filters),
-            "top10_project_typologies": get_top_project_typologies(filters),
-            "funds_to_be_found": get_funds_to_be_found(filters),
-            "payments_realization_gap": get_payments_realization_gap(filters),
-        }
-        # Pass the already-prepared dictionary directly to the serializer
-        serializer = AnalysisSerializer(data)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+                "is_trasversale": is_trasversale,
+                **{name: params.get(name) for name in PROJECT_LIST_FILTERS},
+                "funding_source": parse_funding_source(params.get("funding_source")),
+                "min_financing": parse_amount(params.get("min_financing")),
+                "max_financing": parse_amount(params.get("max_financing")),
+            }
+            fields = parse_fields(params.get("fields"))
+            cursor = parse_cursor(params.get("cursor"))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, next_cursor = get_projects_page(filters, fields, parse_page_size(params.get("page_size")), cursor)
+
+        next_url = None
+        if next_cursor is not None:
+            query = request.GET.copy()
+            query["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+        return Response({
+            "data": {
+                "results": ProjectListItemSerializer(rows, many=True, fields=fields).data,
+                "next": next_url,
+                "next_cursor": next_cursor,
+            }
+        }, status=status.HTTP_200_OK)
+
+@extend_schema(exclude=True)
+class CacheStatsAPI(APIView):
+    """
+    Debug API (staff only) with the hits, misses and hit ratio of the response cache.
+    The counters belong to the worker process that answers, identified by pid.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"data": {"pid": os.getpid(), **cache_stats()}}, status=status.HTTP_200_OK)
+
+
+def parse_cursor(value):
+    if not value:
+        return None
+    try:
+        return decode_cursor(value)
+    except ValueError:
+        raise ValueError("invalid cursor")
+
+def parse_fields(value):
+    if not value:
+        return PROJECT_LIST_DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in PROJECT_LIST_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a comma-separated subset of: {', '.join(PROJECT_LIST_FIELDS)}")
+    return fields
+
+def parse_funding_source(value):
+    if not value or value == "Tutte":
+        return None
+    if value not in FUNDING_SOURCE_FILTERS:
+        raise ValueError(f"funding_source must be one of: Tutte, {', '.join(FUNDING_SOURCE_FILTERS)}")
+    return value
+
+def parse_amount(value):
+    if value in (None, ""):
+        return None
+    try:
+        amount = float(value)
+    except ValueError:
+        raise ValueError(f"invalid amount: {value}")
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount: {value}")
+    return amount
 
+def parse_page_size(value):
+    # Same clamping as top_n: out-of-range or invalid values fall back to the bounds / the default
+    try:
+        page_size = int(value or settings.ANALYTICS_PROJECTS_PAGE_SIZE)
+    except ValueError:
+        page_size = settings.ANALYTICS_PROJECTS_PAGE_SIZE
+    return min(max(page_size, 1), settings.ANALYTICS_PROJECTS_MAX_PAGE_SIZE)
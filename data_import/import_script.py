@@ -7,10 +7,21 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "horizon_analytics.settings")
 import django
 django.setup()
 
-import glob, logging, csv 
+import argparse, glob, hashlib, itertools, logging, csv, time
 
-from django.db import transaction
-from analytics_projects.models import Project, Funding, Location
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from analytics_projects.models import (
+    Project, Funding, Location, ImportManifest, ImportCheckpoint, FundingAggregate,
+)
+from analytics_projects.aggregates import (
+    refresh_funding_aggregates, refresh_project_locations, refresh_project_rankings,
+)
+from analytics_projects.cache import bump_dataset_version, get_dataset_version
+from column_codec import ColumnCodec
 
 # Logging 
 logging.basicConfig(level=logging.INFO)
@@ -35,54 +46,58 @@ def clean_str(value):
     """Rimuove spazi iniziali/finali da stringhe."""
     return value.strip() if isinstance(value, str) else value
 
+CUP_TYPOLOGY_VALUES = frozenset(c.value for c in Project.CUPTypologyChoices)
+
+
 def map_cup_typology(value: str):
     if not value:
         return None
-    return next((c.value for c in Project.CUPTypologyChoices if c.value == value.strip()), None)
+    value = value.strip()
+    return value if value in CUP_TYPOLOGY_VALUES else None
 
 # CSV reading
 def import_projects_from_csv(file_path: str):
-    """Legge un file CSV e restituisce una lista di dizionari con i dati."""
-    projects_data = []
+    """Legge un file CSV riga per riga e restituisce un generatore di dizionari con i dati."""
+    count = 0
     with open(file_path, mode="r", encoding="utf-8-sig") as file:  # <- usa utf-8-sig per BOM
         reader = csv.DictReader(file, delimiter=";")
         for row in reader:
             # rimuove virgolette dai nomi delle colonne e dai valori
-            clean_row = {k.strip().strip('"'): clean_str(v).strip('"') for k, v in row.items()}
-            projects_data.append(clean_row)
-    logger.info(f"Importati {len(projects_data)} record dal file {file_path}")
-    return projects_data
+            yield {k.strip().strip('"'): clean_str(v).strip('"') for k, v in row.items()}
+            count += 1
+    logger.info(f"Importati {count} record dal file {file_path}")
 
 # multiple CSV reading
 def import_multiple_csv(folder_path: str):
     """
     Importa tutti i CSV in una cartella con la stessa intestazione.
-    Restituisce una lista unica di dizionari, saltando le intestazioni duplicate.
+    Restituisce un generatore unico di dizionari: i file vengono letti uno dopo l'altro,
+    senza mai tenerli in memoria.
     """
-    all_data = []
+    total = 0
     csv_files = sorted(glob.glob(f"{folder_path}/*.csv"))  # All csv
 
-    for i, file_path in enumerate(csv_files):
-        with open(file_path, mode="r", encoding="utf-8") as f:
-            reader = csv.DictReader(f, delimiter=";")
-            rows = list(reader)
-            logger.info(f"Importati {len(rows)} record da {file_path}")
-            all_data.extend(rows)  # concatenate all lines
-    logger.info(f"Totale record importati da tutti i CSV: {len(all_data)}")
-    return all_data
+    for file_path in csv_files:
+        for row in import_projects_from_csv(file_path):
+            total += 1
+            yield row
+    logger.info(f"Totale record importati da tutti i CSV: {total}")
 
 
 # Normalize csv
 def normalize_projects_data(projects_data):
-    normalized_data = []
+    """Generatore che duplica le righe con più regioni (una riga per regione)."""
+    read = written = 0
     DELIMITER = ":::"
     for data in projects_data:
+        read += 1
         region_codes = str(data.get("COD_REGIONE", "") or "").split(DELIMITER)
         region_names = str(data.get("DEN_REGIONE", "") or "").split(DELIMITER)
 
         # no multiple regions
         if len(region_codes) == 1 and len(region_names) == 1:
-            normalized_data.append(data)
+            written += 1
+            yield data
             continue
 
         # duplicate rows
@@ -90,42 +105,152 @@ def normalize_projects_data(projects_data):
             new_row = data.copy()
             new_row["COD_REGIONE"] = code.strip()
             new_row["DEN_REGIONE"] = name.strip()
-            normalized_data.append(new_row)
+            written += 1
+            yield new_row
 
-    logger.info(f"Normalizzazione completata: {len(projects_data)} → {len(normalized_data)} righe")
-    return normalized_data
+    logger.info(f"Normalizzazione completata: {read} → {written} righe")
 
 
-# Import on database 
-@transaction.atomic
-def load_projects_into_db(projects_data):
-    # Prima assicurati che tutte le locations siano caricate
-    locations_data = [
-        {"region_code": "001", "region_name": "PIEMONTE", "macroarea": "Centro-Nord"},
-        {"region_code": "002", "region_name": "VALLE D'AOSTA", "macroarea": "Centro-Nord"},
-        {"region_code": "003", "region_name": "LOMBARDIA", "macroarea": "Centro-Nord"},
-        {"region_code": "004", "region_name": "TRENTINO-ALTO ADIGE", "macroarea": "Centro-Nord"},
-        {"region_code": "005", "region_name": "VENETO", "macroarea": "Centro-Nord"},
-        {"region_code": "006", "region_name": "FRIULI-VENEZIA GIULIA", "macroarea": "Centro-Nord"},
-        {"region_code": "007", "region_name": "LIGURIA", "macroarea": "Centro-Nord"},
-        {"region_code": "008", "region_name": "EMILIA-ROMAGNA", "macroarea": "Centro-Nord"},
-        {"region_code": "009", "region_name": "TOSCANA", "macroarea": "Centro-Nord"},
-        {"region_code": "010", "region_name": "UMBRIA", "macroarea": "Centro-Nord"},
-        {"region_code": "011", "region_name": "MARCHE", "macroarea": "Centro-Nord"},
-        {"region_code": "012", "region_name": "LAZIO", "macroarea": "Centro-Nord"},
-        {"region_code": "013", "region_name": "ABRUZZO", "macroarea": "Mezzogiorno"},
-        {"region_code": "014", "region_name": "MOLISE", "macroarea": "Mezzogiorno"},
-        {"region_code": "015", "region_name": "CAMPANIA", "macroarea": "Mezzogiorno"},
-        {"region_code": "016", "region_name": "PUGLIA", "macroarea": "Mezzogiorno"},
-        {"region_code": "017", "region_name": "BASILICATA", "macroarea": "Mezzogiorno"},
-        {"region_code": "018", "region_name": "CALABRIA", "macroarea": "Mezzogiorno"},
-        {"region_code": "019", "region_name": "SICILIA", "macroarea": "Mezzogiorno"},
-        {"region_code": "020", "region_name": "SARDEGNA", "macroarea": "Mezzogiorno"},
-        {"region_code": "997", "region_name": "PAESI EUROPEI", "macroarea": "Estero"},
-        {"region_code": "000", "region_name": "AMBITO NAZIONALE", "macroarea": "Ambito Nazionale"},
-    ]
+# Chunking
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def iter_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Raggruppa un iterabile di righe in liste di al massimo chunk_size elementi."""
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Locations
+LOCATIONS_DATA = [
+    {"region_code": "001", "region_name": "PIEMONTE", "macroarea": "Centro-Nord"},
+    {"region_code": "002", "region_name": "VALLE D'AOSTA", "macroarea": "Centro-Nord"},
+    {"region_code": "003", "region_name": "LOMBARDIA", "macroarea": "Centro-Nord"},
+    {"region_code": "004", "region_name": "TRENTINO-ALTO ADIGE", "macroarea": "Centro-Nord"},
+    {"region_code": "005", "region_name": "VENETO", "macroarea": "Centro-Nord"},
+    {"region_code": "006", "region_name": "FRIULI-VENEZIA GIULIA", "macroarea": "Centro-Nord"},
+    {"region_code": "007", "region_name": "LIGURIA", "macroarea": "Centro-Nord"},
+    {"region_code": "008", "region_name": "EMILIA-ROMAGNA", "macroarea": "Centro-Nord"},
+    {"region_code": "009", "region_name": "TOSCANA", "macroarea": "Centro-Nord"},
+    {"region_code": "010", "region_name": "UMBRIA", "macroarea": "Centro-Nord"},
+    {"region_code": "011", "region_name": "MARCHE", "macroarea": "Centro-Nord"},
+    {"region_code": "012", "region_name": "LAZIO", "macroarea": "Centro-Nord"},
+    {"region_code": "013", "region_name": "ABRUZZO", "macroarea": "Mezzogiorno"},
+    {"region_code": "014", "region_name": "MOLISE", "macroarea": "Mezzogiorno"},
+    {"region_code": "015", "region_name": "CAMPANIA", "macroarea": "Mezzogiorno"},
+    {"region_code": "016", "region_name": "PUGLIA", "macroarea": "Mezzogiorno"},
+    {"region_code": "017", "region_name": "BASILICATA", "macroarea": "Mezzogiorno"},
+    {"region_code": "018", "region_name": "CALABRIA", "macroarea": "Mezzogiorno"},
+    {"region_code": "019", "region_name": "SICILIA", "macroarea": "Mezzogiorno"},
+    {"region_code": "020", "region_name": "SARDEGNA", "macroarea": "Mezzogiorno"},
+    {"region_code": "997", "region_name": "PAESI EUROPEI", "macroarea": "Estero"},
+    {"region_code": "000", "region_name": "AMBITO NAZIONALE", "macroarea": "Ambito Nazionale"},
+]
+
+# Funding field -> colonna CSV
+FUNDING_FIELD_MAP = {
+    "eu_funds": "FINANZ_UE",
+    "eu_funds_fesr": "FINANZ_UE_FESR",
+    "eu_funds_fse": "FINANZ_UE_FSE",
+    "eu_funds_feasr": "FINANZ_UE_FEASR",
+    "eu_funds_feamp": "FINANZ_UE_FEAMP",
+    "eu_funds_iog": "FINANZ_UE_IOG",
+    "state_rotating_fund": "FINANZ_STATO_FONDO_DI_ROTAZIONE",
+    "state_fsc": "FINANZ_STATO_FSC",
+    "state_pac": "FINANZ_STATO_PAC",
+    "state_completions": "FINANZ_STATO_COMPLETAMENTI",
+    "state_other_measures": "FINANZ_STATO_ALTRI_PROVVEDIMENTI",
+    "regional_funds": "FINANZ_REGIONE",
+    "provincial_funds": "FINANZ_PROVINCIA",
+    "municipal_funds": "FINANZ_COMUNE",
+    "freed_resources": "FINANZ_RISORSE_LIBERATE",
+    "other_public_funds": "FINANZ_ALTRO_PUBBLICO",
+    "foreign_state": "FINANZ_STATO_ESTERO",
+    "private_funds": "FINANZ_PRIVATO",
+    "funds_to_find": "FINANZ_DA_REPERIRE",
+    "total_savings": "ECONOMIE_TOTALI",
+    "total_public_savings": "ECONOMIE_TOTALI_PUBBLICHE",
+    "total_funds_gross": "FINANZ_TOTALE_PUBBLICO",
+    "total_funds_net": "OC_FINANZ_TOT_PUB_NETTO",
+}
+
+PROJECT_COLUMNS = [
+    "local_project_code", "oc_project_status", "oc_procedural_state", "oc_project_title",
+    "cup_descr_sector", "cup_typology", "oc_synthetic_theme", "is_trasversale",
+]
+FUNDING_COLUMNS = [*FUNDING_FIELD_MAP, "source_mask"]
+
+# Bit di source_mask acceso da ogni colonna positiva (fonte + singolo fondo), come Funding.compute_source_mask
+SOURCE_MASK_BITS = {
+    field: Funding.source_bit(family) | Funding.source_bit(field)
+    for family, fields in Funding.SOURCE_FAMILIES.items()
+    for field in fields
+}
+
+# Decodifica a colonne usata dai loader bulk (il loader ORM resta su safe_float).
+# I conteggi dei valori non validi vengono azzerati all'inizio di ogni loader
+CODEC = ColumnCodec(
+    decimal_columns=FUNDING_FIELD_MAP.values(),
+    enum_columns={"CUP_DESCR_TIPOLOGIA": CUP_TYPOLOGY_VALUES},
+)
+
+REGION_DELIMITER = ":::"
+
+# Colonne CSV che finiscono nel database: solo queste entrano nell'impronta della riga.
+# Incrementare FINGERPRINT_VERSION quando cambia il modo in cui vengono importate.
+FINGERPRINT_VERSION = "1"
+FINGERPRINT_KEY = "_FINGERPRINT"
+FINGERPRINT_COLUMNS = sorted({
+    "OC_STATO_PROGETTO", "OC_STATO_PROCEDURALE", "OC_TITOLO_PROGETTO", "CUP_DESCR_SETTORE",
+    "CUP_DESCR_TIPOLOGIA", "OC_TEMA_SINTETICO", "OC_MACROAREA", "COD_REGIONE",
+    *FUNDING_FIELD_MAP.values(),
+})
+
+
+def fingerprint_projects_data(projects_data):
+    """
+    Generatore che aggiunge a ogni riga CSV l'impronta del suo contenuto.
+    Va applicato prima di normalize_projects_data, così l'impronta copre tutte le regioni del progetto.
+    """
+    for data in projects_data:
+        content = "\x1f".join([FINGERPRINT_VERSION, *(data.get(c) or "" for c in FINGERPRINT_COLUMNS)])
+        data[FINGERPRINT_KEY] = hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+        yield data
 
-    for loc in locations_data:
+
+def build_project_defaults(data):
+    """Campi del Project (esclusa la chiave) ricavati da una riga CSV."""
+    return {
+        "oc_project_status": data.get("OC_STATO_PROGETTO") or "Non applicabile",
+        "oc_procedural_state": data.get("OC_STATO_PROCEDURALE") or "Non avviato",
+        "oc_project_title": data.get("OC_TITOLO_PROGETTO", "Titolo non disponibile"),
+        "cup_descr_sector": data.get("CUP_DESCR_SETTORE"),
+        "cup_typology": map_cup_typology(data.get("CUP_DESCR_TIPOLOGIA")),
+        "oc_synthetic_theme": data.get("OC_TEMA_SINTETICO"),
+        "is_trasversale": (data.get("OC_MACROAREA", "").strip().lower() == "trasversale"),
+    }
+
+
+def build_funding_defaults(data):
+    """Campi del Funding ricavati da una riga CSV."""
+    return {field: safe_float(data.get(column)) for field, column in FUNDING_FIELD_MAP.items()}
+
+
+def split_region_codes(data):
+    """Codici regione di una riga (il CSV può contenere più codici separati da :::)."""
+    region_code = data.get("COD_REGIONE")
+    if not region_code:
+        return []
+    return [c.strip() for c in region_code.split(REGION_DELIMITER)]
+
+
+def load_locations():
+    """Assicura che tutte le locations siano presenti e restituisce l'indice dei codici regione."""
+    for loc in LOCATIONS_DATA:
         Location.objects.update_or_create(
             region_code=loc["region_code"],
             defaults={
@@ -135,65 +260,684 @@ def load_projects_into_db(projects_data):
         )
 
     logger.info("Locations caricate correttamente!")
+    return build_location_index()
+
+
+def build_location_index():
+    """Codici regione presenti nel database, letti una sola volta per import."""
+    return frozenset(Location.objects.values_list("region_code", flat=True))
+
+
+def collect_location_pairs(projects_data, location_index):
+    """
+    Coppie (progetto, regione) distinte di un blocco di righe, solo per regioni esistenti,
+    nell'ordine del CSV: region_codes e region_label seguono l'ordine dei legami.
+    Le righe duplicate da normalize_projects_data producono la stessa coppia una volta sola.
+    """
+    return list(dict.fromkeys(
+        (data["COD_LOCALE_PROGETTO"], code)
+        for data in projects_data
+        for code in split_region_codes(data)
+        if code in location_index
+    ))
+
+
+# Import on database 
+@transaction.atomic
+def load_projects_into_db(projects_data, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Prima assicurati che tutte le locations siano caricate
+    location_index = load_locations()
+    ProjectLocation = Location.project.through
+
+    # Questo import non calcola le impronte: il prossimo import delta riscriverà tutto
+    ImportManifest.objects.all().delete()
 
     # Poi processa i progetti
-    for data in projects_data:
-        project, _ = Project.objects.update_or_create(
-            local_project_code=data["COD_LOCALE_PROGETTO"],
-            defaults={
-                "oc_project_status": data.get("OC_STATO_PROGETTO") or "Non applicabile",
-                "oc_procedural_state": data.get("OC_STATO_PROCEDURALE") or "Non avviato",
-                "oc_project_title": data.get("OC_TITOLO_PROGETTO", "Titolo non disponibile"),
-                "cup_descr_sector": data.get("CUP_DESCR_SETTORE"),
-                "cup_typology": map_cup_typology(data.get("CUP_DESCR_TIPOLOGIA")),
-                "oc_synthetic_theme": data.get("OC_TEMA_SINTETICO"),
-                "is_trasversale": (data.get("OC_MACROAREA", "").strip().lower() == "trasversale"),
-            },
+    for chunk in iter_chunks(projects_data, chunk_size):
+        for data in chunk:
+            project, _ = Project.objects.update_or_create(
+                local_project_code=data["COD_LOCALE_PROGETTO"],
+                defaults=build_project_defaults(data),
+            )
+
+            # Funding
+            Funding.objects.update_or_create(
+                project=project,
+                defaults=build_funding_defaults(data),
+            )
+
+        # Associa le locations ai progetti del blocco con un solo INSERT ... ON CONFLICT DO NOTHING
+        ProjectLocation.objects.bulk_create(
+            [
+                ProjectLocation(project_id=project_code, location_id=region_code)
+                for project_code, region_code in collect_location_pairs(chunk, location_index)
+            ],
+            ignore_conflicts=True,
         )
 
-        # Funding
-        Funding.objects.update_or_create(
-            project=project,
-            defaults={
-                "eu_funds": safe_float(data.get("FINANZ_UE")),
-                "eu_funds_fesr": safe_float(data.get("FINANZ_UE_FESR")),
-                "eu_funds_fse": safe_float(data.get("FINANZ_UE_FSE")),
-                "eu_funds_feasr": safe_float(data.get("FINANZ_UE_FEASR")),
-                "eu_funds_feamp": safe_float(data.get("FINANZ_UE_FEAMP")),
-                "eu_funds_iog": safe_float(data.get("FINANZ_UE_IOG")),
-                "state_rotating_fund": safe_float(data.get("FINANZ_STATO_FONDO_DI_ROTAZIONE")),
-                "state_fsc": safe_float(data.get("FINANZ_STATO_FSC")),
-                "state_pac": safe_float(data.get("FINANZ_STATO_PAC")),
-                "state_completions": safe_float(data.get("FINANZ_STATO_COMPLETAMENTI")),
-                "state_other_measures": safe_float(data.get("FINANZ_STATO_ALTRI_PROVVEDIMENTI")),
-                "regional_funds": safe_float(data.get("FINANZ_REGIONE")),
-                "provincial_funds": safe_float(data.get("FINANZ_PROVINCIA")),
-                "municipal_funds": safe_float(data.get("FINANZ_COMUNE")),
-                "freed_resources": safe_float(data.get("FINANZ_RISORSE_LIBERATE")),
-                "other_public_funds": safe_float(data.get("FINANZ_ALTRO_PUBBLICO")),
-                "foreign_state": safe_float(data.get("FINANZ_STATO_ESTERO")),
-                "private_funds": safe_float(data.get("FINANZ_PRIVATO")),
-                "funds_to_find": safe_float(data.get("FINANZ_DA_REPERIRE")),
-                "total_savings": safe_float(data.get("ECONOMIE_TOTALI")),
-                "total_public_savings": safe_float(data.get("ECONOMIE_TOTALI_PUBBLICHE")),
-                "total_funds_gross": safe_float(data.get("FINANZ_TOTALE_PUBBLICO")),
-                "total_funds_net": safe_float(data.get("OC_FINANZ_TOT_PUB_NETTO")),
-            },
+    logger.info("Progetti e associazioni locations completate con successo!")
+    refresh_aggregates()
+
+
+def refresh_aggregates():
+    """
+    Ricalcola i dati derivati letti dalle API (regioni ed etichette dei progetti, total_financing,
+    cubo FundingAggregate), a fine import.
+    """
+    started = time.perf_counter()
+    projects = refresh_project_locations()
+    ranked = refresh_project_rankings()
+    rows = refresh_funding_aggregates()
+    logger.info(
+        f"Regioni aggiornate per {projects} progetti, totali per {ranked}, aggregati ricalcolati: {rows} righe "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+# ------------------------------
+# Bulk import (COPY + INSERT ... ON CONFLICT)
+# ------------------------------
+# Staging tables: temporanee per l'import su una sola connessione,
+# UNLOGGED e condivise quando più processi scrivono in parallelo
+StagingTables = namedtuple("StagingTables", ["projects", "locations"])
+TEMP_STAGING = StagingTables("staging_projects", "staging_project_locations")
+SHARED_STAGING = StagingTables("import_staging_projects", "import_staging_project_locations")
+
+
+def build_staging_rows(part, seq_start, projects_data):
+    """
+    Righe per la tabella di staging di un blocco: part, seq, impronta, campi Project, campi Funding.
+    I campi vengono decodificati a colonne con CODEC; totali e source_mask sono quelli di Funding.save().
+    """
+    columns = CODEC.decode(projects_data)
+
+    funding = {field: columns[column] for field, column in FUNDING_FIELD_MAP.items()}
+    funding["total_funds_gross"] = [
+        sum(values) for values in zip(*(funding[f] for f in Funding.GROSS_FUNDS_FIELDS))
+    ]
+    funding["total_funds_net"] = [
+        gross - savings for gross, savings in zip(funding["total_funds_gross"], funding["total_savings"])
+    ]
+    source_mask = [0] * len(projects_data)
+    for field, bits in SOURCE_MASK_BITS.items():
+        source_mask = [mask | bits if value > 0 else mask for mask, value in zip(source_mask, funding[field])]
+    funding["source_mask"] = source_mask
+
+    # Stesse regole di build_project_defaults
+    project = {
+        "oc_project_status": [d.get("OC_STATO_PROGETTO") or "Non applicabile" for d in projects_data],
+        "oc_procedural_state": [d.get("OC_STATO_PROCEDURALE") or "Non avviato" for d in projects_data],
+        "oc_project_title": [d.get("OC_TITOLO_PROGETTO", "Titolo non disponibile") for d in projects_data],
+        "cup_descr_sector": [d.get("CUP_DESCR_SETTORE") for d in projects_data],
+        "cup_typology": columns["CUP_DESCR_TIPOLOGIA"],
+        "oc_synthetic_theme": [d.get("OC_TEMA_SINTETICO") for d in projects_data],
+        "is_trasversale": [
+            (d.get("OC_MACROAREA") or "").strip().lower() == "trasversale" for d in projects_data
+        ],
+    }
+
+    return zip(
+        itertools.repeat(part),
+        range(seq_start + 1, seq_start + len(projects_data) + 1),
+        [d.get(FINGERPRINT_KEY) for d in projects_data],
+        [d["COD_LOCALE_PROGETTO"] for d in projects_data],
+        *(project[c] for c in PROJECT_COLUMNS[1:]),
+        *(funding[c] for c in FUNDING_COLUMNS),
+    )
+
+
+def create_staging_tables(cursor, staging=TEMP_STAGING):
+    """
+    Crea le tabelle di staging con gli stessi tipi delle tabelle reali.
+    TEMP_STAGING vive solo nella transazione corrente, SHARED_STAGING resta finché non viene eliminata.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    through_table = Location.project.through._meta.db_table
+    manifest_table = ImportManifest._meta.db_table
+
+    if staging is TEMP_STAGING:
+        create, suffix = "CREATE TEMP TABLE", "ON COMMIT DROP"
+    else:
+        drop_staging_tables(cursor, staging)
+        create, suffix = "CREATE UNLOGGED TABLE", ""
+
+    cursor.execute(f"""
+        {create} {staging.projects} {suffix} AS
+        SELECT 0::integer AS part, 0::bigint AS seq, m.content_hash,
+               {", ".join(f"p.{c}" for c in PROJECT_COLUMNS)},
+               {", ".join(f"f.{c}" for c in FUNDING_COLUMNS)}
+        FROM {project_table} p, {funding_table} f, {manifest_table} m
+        WITH NO DATA
+    """)
+    cursor.execute(f"""
+        {create} {staging.locations} {suffix} AS
+        SELECT 0::integer AS part, 0::bigint AS seq, project_id, location_id FROM {through_table}
+        WITH NO DATA
+    """)
+
+
+def drop_staging_tables(cursor, staging=SHARED_STAGING):
+    cursor.execute(f"DROP TABLE IF EXISTS {staging.projects}, {staging.locations}")
+
+
+def copy_rows_to_staging(cursor, projects_data, location_index, seq_start=0, part=0, staging=TEMP_STAGING):
+    """
+    Scrive un blocco di righe normalizzate nelle tabelle di staging con COPY.
+    part identifica il file di provenienza, così l'ordine (part, seq) rispecchia l'ordine di lettura;
+    ogni coppia (progetto, regione) porta il (part, seq) della prima riga che la contiene.
+    Restituisce il numero di righe scritte.
+    """
+    staging_columns = ", ".join(["part", "seq", "content_hash", *PROJECT_COLUMNS, *FUNDING_COLUMNS])
+    projects_data = list(projects_data)
+    location_pairs = {}
+    for seq, data in enumerate(projects_data, seq_start + 1):
+        for pair in collect_location_pairs([data], location_index):
+            location_pairs.setdefault(pair, seq)
+
+    with cursor.copy(f"COPY {staging.projects} ({staging_columns}) FROM STDIN") as copy:
+        for row in build_staging_rows(part, seq_start, projects_data):
+            copy.write_row(row)
+
+    with cursor.copy(f"COPY {staging.locations} (part, seq, project_id, location_id) FROM STDIN") as copy:
+        for (project_id, location_id), seq in location_pairs.items():
+            copy.write_row((part, seq, project_id, location_id))
+
+    return len(projects_data)
+
+
+def merge_staging_into_tables(cursor, staging=TEMP_STAGING):
+    """Upsert set-based da staging verso Project, Funding, la tabella M2M Location.project e il manifest."""
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    through_table = Location.project.through._meta.db_table
+    manifest_table = ImportManifest._meta.db_table
+
+    # A parità di codice vince l'ultima riga letta, come con update_or_create.
+    # region_codes / macroareas / etichette e total_financing vengono riempiti a fine import
+    # da refresh_project_locations e refresh_project_rankings
+    cursor.execute(f"""
+        INSERT INTO {project_table} (
+            {", ".join(PROJECT_COLUMNS)}, region_codes, macroareas, region_label, macroarea_label
         )
+        SELECT DISTINCT ON (local_project_code) {", ".join(PROJECT_COLUMNS)}, '{{}}', '{{}}', '', ''
+        FROM {staging.projects}
+        ORDER BY local_project_code, part DESC, seq DESC
+        ON CONFLICT (local_project_code) DO UPDATE SET
+        {", ".join(f"{c} = EXCLUDED.{c}" for c in PROJECT_COLUMNS[1:])}
+    """)
+    cursor.execute(f"""
+        INSERT INTO {funding_table} (project_id, {", ".join(FUNDING_COLUMNS)})
+        SELECT DISTINCT ON (local_project_code) local_project_code, {", ".join(FUNDING_COLUMNS)}
+        FROM {staging.projects}
+        ORDER BY local_project_code, part DESC, seq DESC
+        ON CONFLICT (project_id) DO UPDATE SET
+        {", ".join(f"{c} = EXCLUDED.{c}" for c in FUNDING_COLUMNS)}
+    """)
+    # Le coppie arrivano già filtrate sull'indice delle regioni (collect_location_pairs).
+    # Inserite nell'ordine di lettura, dalla prima riga che le contiene, come fa load_projects_into_db:
+    # region_codes / region_label seguono l'ordine dei legami
+    cursor.execute(f"""
+        INSERT INTO {through_table} (location_id, project_id)
+        SELECT location_id, project_id FROM (
+            SELECT DISTINCT ON (project_id, location_id) project_id, location_id, part, seq
+            FROM {staging.locations}
+            ORDER BY project_id, location_id, part, seq
+        ) first_links
+        ORDER BY part, seq
+        ON CONFLICT (location_id, project_id) DO NOTHING
+    """)
+    cursor.execute(f"""
+        INSERT INTO {manifest_table} (local_project_code, content_hash)
+        SELECT DISTINCT ON (local_project_code) local_project_code, content_hash
+        FROM {staging.projects}
+        ORDER BY local_project_code, part DESC, seq DESC
+        ON CONFLICT (local_project_code) DO UPDATE SET content_hash = EXCLUDED.content_hash
+    """)
 
-        # Associa le locations corrette al progetto se trasversale
-        region_code = data.get("COD_REGIONE")
-        if region_code:
-            # Possibile che il CSV contenga più codici separati da :::
-            codes = [c.strip() for c in region_code.split(":::")]
-            locs_to_add = Location.objects.filter(region_code__in=codes)
-            if locs_to_add.exists():
-                project.locations.add(*locs_to_add)
 
-    logger.info("Progetti e associazioni locations completate con successo!")
+def apply_delta(cursor, staging=TEMP_STAGING, prune=False):
+    """
+    Confronta la staging con il manifest e toglie dalla staging i progetti con impronta invariata,
+    così il merge successivo scrive solo progetti nuovi o modificati.
+    Con prune=True elimina anche i progetti assenti dalla staging, che in quel caso
+    deve contenere l'intero dataset.
+    Restituisce i conteggi unchanged / inserted / updated / deleted.
+    """
+    project_table = Project._meta.db_table
+    funding_table = Funding._meta.db_table
+    through_table = Location.project.through._meta.db_table
+    manifest_table = ImportManifest._meta.db_table
+
+    # Impronta dell'ultima riga letta per ogni progetto
+    cursor.execute(f"""
+        CREATE TEMP TABLE delta_latest ON COMMIT DROP AS
+        SELECT DISTINCT ON (local_project_code) local_project_code, content_hash
+        FROM {staging.projects}
+        ORDER BY local_project_code, part DESC, seq DESC
+    """)
+    cursor.execute("ALTER TABLE delta_latest ADD PRIMARY KEY (local_project_code)")
+    cursor.execute("ANALYZE delta_latest")
+
+    # Progetti non più presenti nel dataset (le FK di Django non hanno ON DELETE CASCADE).
+    # Solo su richiesta: con un input parziale verrebbero cancellati i progetti degli altri file.
+    deleted = 0
+    if prune:
+        cursor.execute(f"""
+            CREATE TEMP TABLE delta_deleted ON COMMIT DROP AS
+            SELECT p.local_project_code FROM {project_table} p
+            WHERE NOT EXISTS (SELECT 1 FROM delta_latest l WHERE l.local_project_code = p.local_project_code)
+        """)
+        cursor.execute(f"DELETE FROM {through_table} WHERE project_id IN (SELECT local_project_code FROM delta_deleted)")
+        cursor.execute(f"DELETE FROM {funding_table} WHERE project_id IN (SELECT local_project_code FROM delta_deleted)")
+        cursor.execute(f"DELETE FROM {project_table} WHERE local_project_code IN (SELECT local_project_code FROM delta_deleted)")
+        deleted = cursor.rowcount
+        cursor.execute(f"""
+            DELETE FROM {manifest_table} m
+            WHERE NOT EXISTS (SELECT 1 FROM delta_latest l WHERE l.local_project_code = m.local_project_code)
+        """)
+
+    # Progetti presenti con la stessa impronta: niente da scrivere
+    cursor.execute(f"""
+        CREATE TEMP TABLE delta_unchanged ON COMMIT DROP AS
+        SELECT l.local_project_code FROM delta_latest l
+        JOIN {manifest_table} m ON m.local_project_code = l.local_project_code
+        JOIN {project_table} p ON p.local_project_code = l.local_project_code
+        WHERE m.content_hash = l.content_hash
+    """)
+    unchanged = cursor.rowcount
+    cursor.execute(f"""
+        DELETE FROM {staging.projects} s USING delta_unchanged u
+        WHERE s.local_project_code = u.local_project_code
+    """)
+    cursor.execute(f"""
+        DELETE FROM {staging.locations} s USING delta_unchanged u
+        WHERE s.project_id = u.local_project_code
+    """)
+
+    cursor.execute(f"""
+        SELECT count(*) FROM delta_latest l
+        WHERE NOT EXISTS (SELECT 1 FROM {project_table} p WHERE p.local_project_code = l.local_project_code)
+    """)
+    inserted = cursor.fetchone()[0]
+
+    # Progetti modificati: le regioni vengono riscritte da zero
+    cursor.execute(f"""
+        DELETE FROM {through_table}
+        WHERE project_id IN (SELECT local_project_code FROM {staging.projects})
+    """)
+    cursor.execute("SELECT count(*) FROM delta_latest")
+    updated = cursor.fetchone()[0] - unchanged - inserted
+
+    counts = {"unchanged": unchanged, "inserted": inserted, "updated": updated, "deleted": deleted}
+    logger.info("Import delta: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    return counts
+
+
+def log_throughput(label, rows, started):
+    elapsed = time.perf_counter() - started
+    logger.info(f"{label}: {rows} righe in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} righe/s)")
+
+
+@transaction.atomic
+def bulk_load_projects_into_db(projects_data, chunk_size=DEFAULT_CHUNK_SIZE, delta=False, prune=False,
+                               schema=None):
+    """
+    Variante di load_projects_into_db per dataset grandi: COPY in tabelle di staging
+    e upsert set-based. Lo stato finale del database è lo stesso.
+    Le righe vengono consumate a blocchi di chunk_size, quindi projects_data può essere un generatore.
+    Con delta=True vengono scritti solo i progetti nuovi o modificati; con prune=True vengono
+    eliminati anche quelli scomparsi e projects_data deve essere il dataset completo (vedi apply_delta).
+    Con schema le tabelle scritte sono quelle dello schema indicato (vedi shadow_load).
+    """
+    CODEC.reset()
+    with connection.cursor() as cursor:
+        set_dataset_schema(cursor, schema)
+    location_index = load_locations()
+
+    started = time.perf_counter()
+    rows = 0
+    with connection.cursor() as cursor:
+        create_staging_tables(cursor)
+        for chunk in iter_chunks(projects_data, chunk_size):
+            rows += copy_rows_to_staging(cursor, chunk, location_index, seq_start=rows)
+        log_throughput("COPY completata", rows, started)
+
+        if delta:
+            apply_delta(cursor, prune=prune)
+        merge_staging_into_tables(cursor)
+
+    refresh_aggregates()
+
+    CODEC.log_invalid(logger)
+    log_throughput("Import bulk completato", rows, started)
+
+
+# ------------------------------
+# Import parallelo di più file
+# ------------------------------
+def copy_csv_file_to_staging(part, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Eseguito in un processo worker: legge, normalizza e copia un file nella staging condivisa
+    usando la propria connessione. Restituisce il numero di righe copiate.
+    """
+    rows = 0
+    CODEC.reset()
+    location_index = build_location_index()
+    with transaction.atomic(), connection.cursor() as cursor:
+        normalized = normalize_projects_data(fingerprint_projects_data(import_projects_from_csv(file_path)))
+        for chunk in iter_chunks(normalized, chunk_size):
+            rows += copy_rows_to_staging(
+                cursor, chunk, location_index, seq_start=rows, part=part, staging=SHARED_STAGING
+            )
+    connection.close()
+    CODEC.log_invalid(logger)
+    return rows
+
+
+def parallel_load_csv_folder(folder_path: str, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, delta=False,
+                             prune=False, schema=None):
+    """
+    Importa i CSV di una cartella con un pool di processi: ogni worker copia un file
+    nella staging condivisa, poi un unico passaggio consolida i dati nelle tabelle reali
+    (o in quelle dello schema indicato).
+    """
+    csv_files = sorted(glob.glob(f"{folder_path}/*.csv"))
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        set_dataset_schema(cursor, schema)
+        load_locations()
+
+    # La staging condivisa resta in public, dove i worker la trovano
+    with connection.cursor() as cursor:
+        create_staging_tables(cursor, SHARED_STAGING)
+
+    # I processi figli non devono ereditare la connessione del processo padre
+    connections.close_all()
+
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(copy_csv_file_to_staging, part, file_path, chunk_size)
+            for part, file_path in enumerate(csv_files)
+        ]
+        for future in futures:
+            rows += future.result()
+    log_throughput(f"COPY completata con {workers} processi", rows, started)
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            set_dataset_schema(cursor, schema)
+            if delta:
+                apply_delta(cursor, SHARED_STAGING, prune=prune)
+            merge_staging_into_tables(cursor, SHARED_STAGING)
+            refresh_aggregates()
+    finally:
+        with connection.cursor() as cursor:
+            drop_staging_tables(cursor)
+
+    log_throughput("Import parallelo completato", rows, started)
+
+
+# ------------------------------
+# Import a blocchi con checkpoint (ripresa dopo un errore)
+# ------------------------------
+def checkpointed_load(csv_files, chunk_size=DEFAULT_CHUNK_SIZE, resume=False):
+    """
+    Importa i file CSV facendo commit a ogni blocco di chunk_size righe e salvando,
+    nella stessa transazione, quante righe di ogni file sono già state scritte.
+    Con resume=True riparte dall'ultimo blocco confermato invece che da zero.
+    A import completato i checkpoint vengono eliminati.
+    """
+    CODEC.reset()
+    with transaction.atomic():
+        location_index = load_locations()
+        if not resume:
+            ImportCheckpoint.objects.all().delete()
+
+    started = time.perf_counter()
+    rows = 0
+    for file_path in csv_files:
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(file_path=file_path)
+        if checkpoint.completed:
+            logger.info(f"{file_path} già importato, lo salto")
+            continue
+        if checkpoint.row_offset:
+            logger.info(f"Riprendo {file_path} dalla riga {checkpoint.row_offset}")
+
+        # I blocchi sono di righe CSV, così le regioni di un progetto finiscono nello stesso commit
+        csv_rows = itertools.islice(import_projects_from_csv(file_path), checkpoint.row_offset, None)
+        for chunk in iter_chunks(fingerprint_projects_data(csv_rows), chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                create_staging_tables(cursor)
+                rows += copy_rows_to_staging(cursor, normalize_projects_data(chunk), location_index)
+                merge_staging_into_tables(cursor)
+
+                checkpoint.row_offset += len(chunk)
+                checkpoint.save(update_fields=["row_offset", "updated_at"])
+
+        checkpoint.completed = True
+        checkpoint.save(update_fields=["completed", "updated_at"])
+        log_throughput(f"{file_path} completato", rows, started)
+
+    refresh_aggregates()
+    # Niente da riprendere: un --resume successivo ripartirebbe da zero
+    ImportCheckpoint.objects.all().delete()
+    CODEC.log_invalid(logger)
+    log_throughput("Import a blocchi completato", rows, started)
+
+
+# ------------------------------
+# Refresh senza downtime: schema ombra + swap atomico
+# ------------------------------
+SHADOW_SCHEMA = "analytics_shadow"
+PREVIOUS_SCHEMA = "analytics_previous"
+LIVE_SCHEMA = "public"
+SWAP_LOCK_TIMEOUT = "5s"
+
+
+def dataset_tables():
+    """Tabelle che compongono il dataset e vengono scambiate insieme."""
+    return [
+        model._meta.db_table
+        for model in (Location, Project, Funding, Location.project.through, ImportManifest, FundingAggregate)
+    ]
+
+
+def set_dataset_schema(cursor, schema):
+    """Fino al commit le tabelle del dataset vengono risolte prima nello schema indicato."""
+    if schema:
+        cursor.execute(f"SET LOCAL search_path TO {schema}, {LIVE_SCHEMA}")
+
+
+def create_shadow_schema(cursor):
+    """Ricrea lo schema ombra con tabelle vuote identiche a quelle live (indici, vincoli e FK compresi)."""
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SHADOW_SCHEMA}")
+
+    foreign_keys = []
+    for table in dataset_tables():
+        cursor.execute(f"CREATE TABLE {SHADOW_SCHEMA}.{table} (LIKE {LIVE_SCHEMA}.{table} INCLUDING ALL)")
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid = %s::regclass",
+            [f"{LIVE_SCHEMA}.{table}"],
+        )
+        foreign_keys += [(table, name, definition) for name, definition in cursor.fetchall()]
+
+    # LIKE non copia le FK: le ricrea con lo stesso nome, risolvendo le tabelle riferite nello schema ombra
+    with transaction.atomic():
+        set_dataset_schema(cursor, SHADOW_SCHEMA)
+        for table, name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {SHADOW_SCHEMA}.{table} ADD CONSTRAINT {name} {definition}")
+
+
+def _index_signatures(cursor, schema, table):
+    """Indici di una tabella come {(unique, definizione senza nome): nome}."""
+    cursor.execute(
+        "SELECT c.relname, ix.indisunique, regexp_replace(pg_get_indexdef(ix.indexrelid), '^.* USING ', '') "
+        "FROM pg_index ix JOIN pg_class c ON c.oid = ix.indexrelid "
+        "WHERE ix.indrelid = %s::regclass",
+        [f"{schema}.{table}"],
+    )
+    return {(unique, definition): name for name, unique, definition in cursor.fetchall()}
+
+
+def _statistics_signatures(cursor, schema, table):
+    """{colonne/espressioni: (schema, nome)} delle statistiche estese di schema.table."""
+    cursor.execute(
+        "SELECT s.stxnamespace::regnamespace::text, s.stxname, pg_get_statisticsobjdef_columns(s.oid) "
+        "FROM pg_statistic_ext s WHERE s.stxrelid = %s::regclass",
+        [f"{schema}.{table}"],
+    )
+    return {definition: (namespace, name) for namespace, name, definition in cursor.fetchall()}
+
+
+def swap_schemas(cursor, incoming, outgoing):
+    """
+    Sposta le tabelle live in outgoing e quelle di incoming in public, nella transazione corrente.
+    Gli indici e le statistiche estese generati da LIKE vengono rinominati come quelli live, così le
+    migrazioni continuano a trovarli.
+    """
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {outgoing}")
+    for table in dataset_tables():
+        cursor.execute(f"DROP TABLE IF EXISTS {outgoing}.{table} CASCADE")
+        cursor.execute(f"ALTER TABLE {LIVE_SCHEMA}.{table} SET SCHEMA {outgoing}")
+        cursor.execute(f"ALTER TABLE {incoming}.{table} SET SCHEMA {LIVE_SCHEMA}")
+
+    for table in dataset_tables():
+        previous_names = _index_signatures(cursor, outgoing, table)
+        for signature, name in _index_signatures(cursor, LIVE_SCHEMA, table).items():
+            previous_name = previous_names.get(signature)
+            if previous_name and previous_name != name:
+                cursor.execute(f"ALTER INDEX {LIVE_SCHEMA}.{name} RENAME TO {previous_name}")
+
+        # Le statistiche estese non seguono la tabella con SET SCHEMA: si spostano con lei,
+        # altrimenti il DROP SCHEMA dell'ombra eliminerebbe quelle della tabella ora live
+        previous_statistics = _statistics_signatures(cursor, outgoing, table)
+        for namespace, name in previous_statistics.values():
+            if namespace == LIVE_SCHEMA:
+                cursor.execute(f"ALTER STATISTICS {LIVE_SCHEMA}.{name} SET SCHEMA {outgoing}")
+        for signature, (namespace, name) in _statistics_signatures(cursor, LIVE_SCHEMA, table).items():
+            if namespace != LIVE_SCHEMA:
+                cursor.execute(f"ALTER STATISTICS {namespace}.{name} SET SCHEMA {LIVE_SCHEMA}")
+            previous_name = previous_statistics.get(signature, (None, name))[1]
+            if previous_name != name:
+                cursor.execute(f"ALTER STATISTICS {LIVE_SCHEMA}.{name} RENAME TO {previous_name}")
+
+
+def shadow_load(load, *args, **kwargs):
+    """
+    Esegue un loader bulk (bulk_load_projects_into_db o parallel_load_csv_folder) nello schema ombra,
+    aggiorna le statistiche e scambia atomicamente il nuovo dataset con quello live.
+    Il dataset precedente resta in PREVIOUS_SCHEMA per il rollback.
+    """
+    with connection.cursor() as cursor:
+        create_shadow_schema(cursor)
+
+    load(*args, schema=SHADOW_SCHEMA, **kwargs)
+
+    with connection.cursor() as cursor:
+        for table in dataset_tables():
+            cursor.execute(f"ANALYZE {SHADOW_SCHEMA}.{table}")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        swap_schemas(cursor, incoming=SHADOW_SCHEMA, outgoing=PREVIOUS_SCHEMA)
+        cursor.execute(f"DROP SCHEMA {SHADOW_SCHEMA} CASCADE")
+
+    logger.info(f"Nuovo dataset pubblicato, il precedente è in {PREVIOUS_SCHEMA}")
+
+
+@transaction.atomic
+def rollback_dataset():
+    """Ripristina il dataset precedente: live e PREVIOUS_SCHEMA si scambiano di posto."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER SCHEMA {PREVIOUS_SCHEMA} RENAME TO {SHADOW_SCHEMA}")
+        swap_schemas(cursor, incoming=SHADOW_SCHEMA, outgoing=PREVIOUS_SCHEMA)
+        cursor.execute(f"DROP SCHEMA {SHADOW_SCHEMA} CASCADE")
+
+    logger.info("Dataset precedente ripristinato")
+
+
+# ------------------------------
+# Pubblicazione del dataset
+# ------------------------------
+def publish_dataset():
+    """
+    Scrive lo snapshot del motore NumPy (se ANALYTICS_SNAPSHOT_PATH è configurato) con la prossima
+    versione e poi la pubblica: i worker trovano lo snapshot già pronto quando vedono la versione nuova
+    e le risposte in cache della versione precedente non vengono più lette.
+    """
+    if settings.ANALYTICS_SNAPSHOT_PATH:
+        from analytics_projects.engine import ColumnarEngine
+
+        started = time.perf_counter()
+        engine = ColumnarEngine.from_database(get_dataset_version().version + 1)
+        engine.write_snapshot(settings.ANALYTICS_SNAPSHOT_PATH)
+        logger.info(f"Snapshot {settings.ANALYTICS_SNAPSHOT_PATH} scritto in {time.perf_counter() - started:.1f}s")
+
+    version = bump_dataset_version()
+    logger.info(f"Versione del dataset: {version}")
+
 
 if __name__ == "__main__":
-    projects = import_projects_from_csv("csv/Progetti_2021-2027_1.csv")  # percorso relativo del CSV
-    #projects = import_multiple_csv("csv") #path folder
-    normalized_projects = normalize_projects_data(projects)
-    load_projects_into_db(normalized_projects)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import dei progetti OpenCoesione")
+    parser.add_argument("--file", default="csv/Progetti_2021-2027_1.csv", help="percorso relativo del CSV")
+    parser.add_argument("--folder", help="importa tutti i CSV della cartella (ignora --file)")
+    parser.add_argument("--bulk", action="store_true", help="usa COPY e upsert set-based invece dell'ORM")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="righe per blocco")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processi paralleli per --folder (0 = un processo per core)")
+    parser.add_argument("--delta", action="store_true",
+                        help="scrive solo i progetti nuovi o modificati (implica --bulk)")
+    parser.add_argument("--prune", action="store_true",
+                        help="con --delta elimina i progetti assenti dall'input, "
+                             "che deve essere il dataset completo (di solito --folder)")
+    parser.add_argument("--swap", action="store_true",
+                        help="costruisce il dataset in uno schema ombra e lo pubblica con uno swap atomico "
+                             "(implica --bulk, non compatibile con --delta)")
+    parser.add_argument("--rollback", action="store_true", help="ripristina il dataset precedente allo swap")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="commit a ogni blocco con checkpoint per file e riga (implica --bulk)")
+    parser.add_argument("--resume", action="store_true",
+                        help="riprende un import --checkpoint dall'ultimo blocco confermato")
+    args = parser.parse_args()
+
+    if args.swap and args.delta:
+        parser.error("--swap ricostruisce il dataset da zero e non è compatibile con --delta")
+    if args.prune and not args.delta:
+        parser.error("--prune si usa solo con --delta")
+    if (args.checkpoint or args.resume) and (args.swap or args.delta):
+        parser.error("--checkpoint/--resume non sono compatibili con --swap e --delta")
+
+    def run(load, *load_args, **load_kwargs):
+        # Con --swap i loader bulk vengono eseguiti nello schema ombra
+        if args.swap:
+            return shadow_load(load, *load_args, **load_kwargs)
+        return load(*load_args, **load_kwargs)
+
+    if args.rollback:
+        rollback_dataset()
+    elif args.checkpoint or args.resume:
+        csv_files = sorted(glob.glob(f"{args.folder}/*.csv")) if args.folder else [args.file]
+        checkpointed_load(csv_files, chunk_size=args.chunk_size, resume=args.resume)
+    elif args.folder and args.workers != 1:
+        run(parallel_load_csv_folder, args.folder, workers=args.workers, chunk_size=args.chunk_size,
+            delta=args.delta, prune=args.prune)
+    else:
+        if args.folder:
+            projects = import_multiple_csv(args.folder)
+        else:
+            projects = import_projects_from_csv(args.file)
+        normalized_projects = normalize_projects_data(fingerprint_projects_data(projects))
+        if args.bulk or args.delta or args.swap:
+            run(bulk_load_projects_into_db, normalized_projects, chunk_size=args.chunk_size, delta=args.delta,
+                prune=args.prune)
+        else:
+            load_projects_into_db(normalized_projects, chunk_size=args.chunk_size)
+
+    # Solo a import completato (dopo lo swap con --swap)
+    publish_dataset()
@@ -0,0 +1,31 @@
+"""
+Gunicorn configuration, read by start.sh when SERVER_MODE is "wsgi" or "asgi".
+
+wsgi: horizon_analytics.wsgi with gthread workers (processes x threads).
+asgi: horizon_analytics.asgi with uvicorn workers. Settings force CONN_MAX_AGE=0 in this
+      mode, so set DB_POOL=true to reuse PostgreSQL connections across requests.
+Every setting can be overridden through the environment (GUNICORN_*).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+# One process per core (plus one) by default: the API is CPU-bound on JSON and numpy
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = os.environ.get(
+    "GUNICORN_WORKER_CLASS",
+    "uvicorn.workers.UvicornWorker" if os.environ.get("SERVER_MODE") == "asgi" else "gthread",
+)
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers now and then, staggered so they do not restart together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-")
+errorlog = "-"
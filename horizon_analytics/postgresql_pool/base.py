@@ -0,0 +1,72 @@
+"""
+PostgreSQL backend with a psycopg_pool.ConnectionPool per process (Django 4.2 has no native pool).
+
+Enabled by settings when DB_POOL is on: OPTIONS["pool"] holds the ConnectionPool arguments
+(min_size, max_size, timeout, max_idle, max_lifetime). Django still opens and closes its
+connection around every request (CONN_MAX_AGE = 0), but opening borrows a connection from
+the pool and closing gives it back; the pool checks a connection is alive before lending it.
+"""
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError as exc:
+    raise ImproperlyConfigured("DB_POOL requires the psycopg_pool package (psycopg[pool])") from exc
+
+# (pid, alias) -> pool: a forked worker never reuses the sockets of its parent
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def pool(self):
+        key = (os.getpid(), self.alias)
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    if self.settings_dict["CONN_MAX_AGE"] != 0:
+                        raise ImproperlyConfigured("Pooled connections require CONN_MAX_AGE = 0")
+                    pool = ConnectionPool(
+                        kwargs=self.get_connection_params(),
+                        name=f"{self.alias}-{os.getpid()}",
+                        check=ConnectionPool.check_connection,
+                        open=True,
+                        **self.settings_dict["OPTIONS"]["pool"],
+                    )
+                    _pools[key] = pool
+        return pool
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = IsolationLevel(
+                IsolationLevel.READ_COMMITTED if isolation_level is None else isolation_level
+            )
+        except ValueError:
+            raise ImproperlyConfigured(f"Invalid transaction isolation level {isolation_level}")
+
+        connection = self.pool.getconn()
+        # The pooled connection may come from another request: reset what Django configures
+        connection.isolation_level = None if isolation_level is None else self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
+            # Back in the pool: this wrapper must not use it any more
+            self.connection = None
@@ -16,9 +16,9 @@ environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 SECRET_KEY = env('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env.bool('DEBUG', default=True)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=[])
 
 # Application definition
 INSTALLED_APPS = [
@@ -36,6 +36,11 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson when installed and ANALYTICS_FAST_JSON is on, the stock JSONRenderer otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'analytics_projects.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -83,9 +88,46 @@ DATABASES = {
         'PASSWORD': env('POSTGRES_PASSWORD'),
         'HOST': env('POSTGRES_HOST'),
         'PORT': env('POSTGRES_PORT'),
+        # Persistent connections, checked before reuse (one per worker thread)
+        'CONN_MAX_AGE': env.int('CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Under ASGI every sync view runs on a thread of the sync_to_async executor, and Django only
+# closes connections at the end of a request: persistent connections would pile up, one per
+# thread, and never be reused. Use DB_POOL to keep connections open across requests instead.
+if env('SERVER_MODE', default='dev') == 'asgi':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Connection pool (psycopg_pool) per worker process instead of persistent connections:
+# every worker holds at most DB_POOL_MAX_SIZE connections, so keep
+# workers x DB_POOL_MAX_SIZE below the max_connections of the server
+if env.bool('DB_POOL', default=False):
+    DATABASES['default'].update({
+        'ENGINE': 'horizon_analytics.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': env.int('DB_POOL_MIN_SIZE', default=1),
+                'max_size': env.int('DB_POOL_MAX_SIZE', default=4),
+                'timeout': env.float('DB_POOL_TIMEOUT', default=10.0),  # seconds waiting for a free connection
+                'max_idle': env.float('DB_POOL_MAX_IDLE', default=600.0),
+                'max_lifetime': env.float('DB_POOL_MAX_LIFETIME', default=3600.0),
+            },
+        },
+    })
+
+# Cache (analytics API responses). CACHE_URL examples:
+#   locmemcache://analytics?max_entries=1000   per-process LRU (default)
+#   filecache:///var/tmp/horizon_cache?max_entries=5000
+#   redis://redis:6379/1                       shared; set maxmemory-policy allkeys-lru on the server
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://analytics?max_entries=1000'),
+}
+# Cached responses are keyed on the dataset version, so they only expire to bound stale memory
+CACHES['default'].setdefault('TIMEOUT', env.int('CACHE_TIMEOUT', default=24 * 60 * 60))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -105,3 +147,37 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Analytics: answer the dashboard APIs from the pre-aggregated FundingAggregate table when possible
+ANALYTICS_USE_AGGREGATES = env.bool('ANALYTICS_USE_AGGREGATES', default=True)
+
+# How the dashboard APIs are computed: "fused" (few combined queries), "legacy" (one query per metric)
+# or "compare" (both, logging differences and serving the legacy result)
+ANALYTICS_QUERY_PLANNER = env('ANALYTICS_QUERY_PLANNER', default='fused')
+
+# Engine behind the fused planner: "database" (SQL) or "numpy" (in-memory columns, requires numpy)
+ANALYTICS_ENGINE = env('ANALYTICS_ENGINE', default='database')
+
+# Binary snapshot of the numpy engine columns, written by the importer and mmapped by every worker
+ANALYTICS_SNAPSHOT_PATH = env('ANALYTICS_SNAPSHOT_PATH', default=None)
+
+# Independent sections of the legacy planner computed concurrently: at most ANALYTICS_SECTION_CONCURRENCY
+# at a time per request (1 = one after another), on a pool of ANALYTICS_SECTION_THREADS threads per process.
+# Every running section holds its own database connection: size DB_POOL_MAX_SIZE accordingly
+ANALYTICS_SECTION_CONCURRENCY = env.int('ANALYTICS_SECTION_CONCURRENCY', default=1)
+ANALYTICS_SECTION_THREADS = env.int('ANALYTICS_SECTION_THREADS', default=8)
+
+# Serialize the analytics responses with precompiled serializers and render them with orjson (if installed)
+ANALYTICS_FAST_JSON = env.bool('ANALYTICS_FAST_JSON', default=True)
+
+# Projects listed in the Overview top-N: default, and upper bound of the top_n query parameter
+ANALYTICS_TOP_N = env.int('ANALYTICS_TOP_N', default=10)
+ANALYTICS_TOP_N_MAX = env.int('ANALYTICS_TOP_N_MAX', default=100)
+
+# Page size of /api/projects/: default, and upper bound of the page_size query parameter
+ANALYTICS_PROJECTS_PAGE_SIZE = env.int('ANALYTICS_PROJECTS_PAGE_SIZE', default=50)
+ANALYTICS_PROJECTS_MAX_PAGE_SIZE = env.int('ANALYTICS_PROJECTS_MAX_PAGE_SIZE', default=500)
+
+# Cache the Overview / Analysis responses per filter set and dataset version
+ANALYTICS_RESPONSE_CACHE = env.bool('ANALYTICS_RESPONSE_CACHE', default=True)
+ANALYTICS_CACHE_ALIAS = 'default'
@@ -12,7 +12,23 @@ python manage.py collectstatic --noinput
 
 echo "Import dei CSV..."
 export PYTHONPATH=/app
-python /app/data_import/import_script.py
+# Tutta la cartella: il delta salta i progetti invariati. Senza --prune un riavvio
+# non elimina mai progetti, nemmeno se qualche file manca.
+python /app/data_import/import_script.py --folder /app/csv --delta
 
-echo "Avvio server..."
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# SERVER_MODE: dev (runserver), wsgi o asgi (gunicorn multi-processo, vedi gunicorn.conf.py)
+SERVER_MODE="${SERVER_MODE:-dev}"
+export SERVER_MODE
+
+echo "Avvio server ($SERVER_MODE)..."
+case "$SERVER_MODE" in
+  wsgi)
+    exec gunicorn --config /app/gunicorn.conf.py horizon_analytics.wsgi:application
+    ;;
+  asgi)
+    exec gunicorn --config /app/gunicorn.conf.py horizon_analytics.asgi:application
+    ;;
+  *)
+    exec python manage.py runserver 0.0.0.0:8000
+    ;;
+esac
\ No newline at end of file